@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import json
+import os
+from itertools import islice
+import pyarrow as pa
+import pyarrow.parquet as pq
+from config_utils import load_test_config
+from data_classes import load_label_vocabulary
+from predictor import build_predictor
+
+CHECKPOINT_FILE = "_checkpoint.json"
+
+
+def iter_records(input_path, text_column, id_column=None, skip=0):
+    """
+    Streams (id, career history) records from a JSONL or Parquet file.
+
+    Whitespace-only lines of a JSONL file are not records. The first `skip` records are passed over
+    without decoding them: whole row groups of a Parquet file are not read at all, JSONL lines are
+    counted but not parsed.
+
+    Args:
+        input_path (str): Path of a `.jsonl` or `.parquet` file.
+        text_column (str): Field / column holding the career history text.
+        id_column (str, optional): Field / column holding the record id. Defaults to the row number.
+        skip (int): Number of leading records to skip, e.g. the records already done by a resumed job.
+
+    Yields:
+        tuple: (record id, career history text).
+    """
+    if input_path.endswith(".parquet"):
+        columns = [text_column] + ([id_column] if id_column is not None else [])
+        parquet_file = pq.ParquetFile(input_path)
+        row, row_groups = 0, []
+        for i in range(parquet_file.num_row_groups):
+            num_rows = parquet_file.metadata.row_group(i).num_rows
+            if row + num_rows <= skip:
+                row += num_rows
+            else:
+                row_groups.append(i)
+        if not row_groups:
+            return
+        for batch in parquet_file.iter_batches(batch_size=10_000, row_groups=row_groups, columns=columns):
+            if row < skip:
+                # Only the first batches of the first remaining row group can still be done
+                offset = min(skip - row, batch.num_rows)
+                batch, row = batch.slice(offset), row + offset
+            texts = batch.column(text_column).to_pylist()
+            ids = batch.column(id_column).to_pylist() if id_column is not None else range(row, row + len(texts))
+            yield from zip(ids, texts)
+            row += len(texts)
+    elif input_path.endswith(".jsonl"):
+        with open(input_path) as f:
+            row = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                if row >= skip:
+                    record = json.loads(line)
+                    yield (record[id_column] if id_column is not None else row), record[text_column]
+                row += 1
+    else:
+        raise ValueError(f"Unsupported input format: {input_path} (expected .jsonl or .parquet)")
+
+
+def job_description(label_predictor, input_path, chunk_size, top_k):
+    """
+    Identifies a batch prediction job, so that a checkpoint is only resumed by the same job.
+
+    Besides the input and chunking, the job is identified by the predictor (`LabelPredictor.version`,
+    which covers the embedding model and the transformation file) and a hash of its label vocabulary,
+    since the label ids of earlier part files index into it. The input file is fingerprinted by its
+    size and modification time, since the chunks already written would no longer line up with a
+    rewritten input.
+    """
+    labels_hash = hashlib.sha1(json.dumps(label_predictor.label_texts).encode()).hexdigest()
+    input_stat = os.stat(input_path)
+    return {
+        "input_path": os.path.abspath(input_path),
+        "input_fingerprint": f"{input_stat.st_size}:{input_stat.st_mtime_ns}",
+        "chunk_size": chunk_size,
+        "top_k": top_k,
+        "predictor_version": label_predictor.version,
+        "labels_hash": labels_hash,
+    }
+
+
+def load_checkpoint(output_dir, job):
+    """
+    Returns the number of chunks and records already written to `output_dir` for this job.
+
+    Args:
+        output_dir (str): Output directory.
+        job (dict): Description of the job, see `job_description`.
+
+    Raises:
+        ValueError: If `output_dir` holds the output of a job with different parameters, another predictor
+            or an earlier version of the input file.
+    """
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT_FILE)) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return 0, 0
+    if checkpoint["job"].get("input_fingerprint") != job["input_fingerprint"]:
+        raise ValueError(
+            f"{job['input_path']} changed since {output_dir} was written "
+            f"({checkpoint['job'].get('input_fingerprint')} != {job['input_fingerprint']}), refusing to resume"
+        )
+    if checkpoint["job"] != job:
+        raise ValueError(f"{output_dir} holds the output of a different job: {checkpoint['job']}")
+    return checkpoint["completed_chunks"], checkpoint["completed_rows"]
+
+
+def save_checkpoint(output_dir, job, completed_chunks, completed_rows):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump({"job": job, "completed_chunks": completed_chunks, "completed_rows": completed_rows}, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_part(output_dir, part, ids, label_ids, scores):
+    """
+    Writes the predictions of one chunk as `part-<n>.parquet`, atomically.
+
+    Args:
+        output_dir (str): Output directory.
+        part (int): Chunk number.
+        ids (list): Record ids.
+        label_ids (List[np.ndarray]): Per record, the found label ids, most similar first.
+        scores (List[np.ndarray]): Per record, the similarities of the found labels.
+    """
+    table = pa.table({
+        "id": pa.array(ids),
+        "label_ids": pa.array([found.tolist() for found in label_ids], pa.list_(pa.int32())),
+        "scores": pa.array([found.tolist() for found in scores], pa.list_(pa.float32())),
+    })
+    path = os.path.join(output_dir, f"part-{part:05d}.parquet")
+    pq.write_table(table, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+
+
+def batch_predict(predictor, input_path, output_dir, text_column, id_column=None, chunk_size=50_000, top_k=10):
+    """
+    Predicts the top-k next occupations of every career history in `input_path`, chunk by chunk.
+
+    Every chunk is encoded, transformed and searched on its own and written to its own Parquet
+    part file, so memory stays constant in the input size. A checkpoint is updated after every
+    part; re-running the same job resumes after the last completed chunk.
+
+    Every part file has the columns
+        - `id`: the record id (see `id_column`),
+        - `label_ids`: list<int32> of up to `top_k` ids into the `labels.json` vocabulary, most similar first,
+        - `scores`: list<float32> of the similarities of these labels.
+    Approximate indexes (IVF, HNSW, PQ) can find fewer than `top_k` labels for a record; their padding
+    is dropped (see `LabelPredictor.found_results`), so both lists can be shorter than `top_k`.
+
+    Args:
+        predictor (Predictor): Predictor used for the predictions.
+        input_path (str): Path of a `.jsonl` or `.parquet` file with career histories.
+        output_dir (str): Directory for `labels.json`, the part files and the checkpoint.
+        text_column (str): Field / column holding the career history text.
+        id_column (str, optional): Field / column holding the record id. Defaults to the row number.
+        chunk_size (int): Number of records per chunk / part file.
+        top_k (int): Number of predicted labels per record.
+
+    Returns:
+        int: Number of records predicted by this call.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    label_predictor = predictor.label_predictor
+    job = job_description(label_predictor, input_path, chunk_size, top_k)
+
+    completed_chunks, completed_rows = load_checkpoint(output_dir, job)
+    records = iter_records(input_path, text_column, id_column, skip=completed_rows)
+    if completed_chunks:
+        print(f"Resuming after {completed_chunks} completed chunks ({completed_rows} records)")
+    else:
+        # Label ids in the part files index into this vocabulary
+        with open(os.path.join(output_dir, "labels.json"), "w") as f:
+            json.dump(label_predictor.label_texts, f)
+
+    part = completed_chunks
+    num_predicted = 0
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        ids, texts = zip(*chunk)
+        label_ids, scores = label_predictor.predict_ids(list(texts), top_k=top_k)
+        found_label_ids, found_scores = zip(*label_predictor.found_results(label_ids, scores))
+        write_part(output_dir, part, list(ids), found_label_ids, found_scores)
+        part += 1
+        num_predicted += len(chunk)
+        save_checkpoint(output_dir, job, part, completed_rows + num_predicted)
+        print(f"Wrote part {part - 1} ({completed_rows + num_predicted} records done)")
+    return num_predicted
+
+
+def main(config, input_path, output_dir, text_column, id_column=None, chunk_size=50_000, top_k=10):
+    """
+    Main function of the batch prediction job.
+
+    Builds the predictor of a test configuration and runs `batch_predict` with it.
+
+    Args:
+        config (dict): Test configuration (see `config/test/`), defining model, transformation and label space.
+        input_path, output_dir, text_column, id_column, chunk_size, top_k: See `batch_predict`.
+    """
+    print("Loading label vocabulary...")
+    label_texts = load_label_vocabulary(config["data"]["data_type"], cache_dir=config.get("cache", {}).get("data_dir"))
+
+    print("Initializing the predictor model...")
+    predictor = build_predictor(config, label_texts)
+
+    num_predicted = batch_predict(predictor, input_path, output_dir, text_column, id_column, chunk_size, top_k)
+    print(f"Predicted {num_predicted} records into {output_dir}")
+
+
+if __name__ == "__main__":
+    """
+    Entry point for batch prediction of stored career histories.
+    """
+    parser = argparse.ArgumentParser(description="Predict next occupations for career histories stored on disk.")
+    parser.add_argument("--test_config", type=str, required=True, help="Test configuration defining the predictor.")
+    parser.add_argument("--input", type=str, required=True, help="Input .jsonl or .parquet file.")
+    parser.add_argument("--output_dir", type=str, required=True, help="Directory for the Parquet part files.")
+    parser.add_argument("--text_column", type=str, default="career_history", help="Field holding the career history.")
+    parser.add_argument("--id_column", type=str, default=None, help="Field holding the record id (default: row number).")
+    parser.add_argument("--chunk_size", type=int, default=50_000, help="Number of records per chunk / part file.")
+    parser.add_argument("--top_k", type=int, default=10, help="Number of predicted occupations per record.")
+    args = parser.parse_args()
+
+    config = load_test_config(args.test_config)
+    main(config, args.input, args.output_dir, args.text_column, args.id_column, args.chunk_size, args.top_k)
@@ -0,0 +1,351 @@
+import argparse
+import json
+import multiprocessing
+import time
+import numpy as np
+import faiss
+import psutil
+from config_utils import load_test_config, load_label_index_config
+from data_classes import Data, load_label_vocabulary
+from evaluation import ranking_metrics
+import label_store
+from predictor import MLPTransformationModel, build_predictor
+
+
+def reference_search(label_predictor, embeddings, top_k):
+    """
+    Query path before the fused projection: transform, normalize, normalize and cast again, search.
+    """
+    embeddings = label_predictor.transformation_model.transform(embeddings)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    indices, _ = label_predictor.label_space.lookup_closest_labels(embeddings, top_k)
+    return indices
+
+
+def single_normalize_search(label_predictor, embeddings, top_k):
+    """
+    Query path of `LabelPredictor.embed`: transform, one in-place float32 normalization, search.
+    """
+    embeddings = np.ascontiguousarray(label_predictor.transformation_model.transform(embeddings), dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    indices, _ = label_predictor.label_space.lookup_closest_labels(embeddings, top_k, normalized=True)
+    return indices
+
+
+def fused_search(label_predictor, embeddings, top_k):
+    """
+    Fused query path of `LabelPredictor.search`: search the untransformed queries against the labels
+    projected by Tᵀ and rescale the scores to cosine similarities.
+    """
+    indices, _ = label_predictor.search(np.ascontiguousarray(embeddings, dtype=np.float32), top_k)
+    return indices
+
+
+def benchmark(search, label_predictor, embeddings, batch_size, repeats, top_k=10):
+    """
+    Times a query path on pre-computed query embeddings, batch by batch.
+
+    Args:
+        search (callable): One of the `*_search` functions.
+        label_predictor (LabelPredictor): Predictor built with `fuse_transformation=True`.
+        embeddings (np.ndarray): (n, dim) untransformed query embeddings.
+        batch_size (int): Number of queries per search call.
+        repeats (int): Number of timed passes over all queries; the fastest one is reported.
+        top_k (int): Number of labels retrieved per query.
+
+    Returns:
+        tuple:
+            - np.ndarray: (n, top_k) retrieved label ids.
+            - float: Fastest pass in milliseconds per 1000 queries.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        indices = np.concatenate(
+            [search(label_predictor, embeddings[i:i + batch_size], top_k) for i in range(0, len(embeddings), batch_size)]
+        )
+        best = min(best, time.perf_counter() - start)
+    return indices, 1000 * 1000 * best / len(embeddings)
+
+
+def benchmark_transformation(transformation_model, embeddings, batch_sizes, repeats):
+    """
+    Measures latency and throughput of `transformation_model.transform` alone.
+
+    Args:
+        transformation_model (TransformationModel): Linear or MLP transformation.
+        embeddings (np.ndarray): (n, dim) query embeddings.
+        batch_sizes (Iterable[int]): Batch sizes to measure.
+        repeats (int): Number of timed passes per batch size; the fastest one is reported.
+
+    Returns:
+        dict: Per batch size, milliseconds per batch and queries per second.
+    """
+    results = {}
+    for batch_size in batch_sizes:
+        batches = [embeddings[i:i + batch_size] for i in range(0, len(embeddings), batch_size)]
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for batch in batches:
+                transformation_model.transform(batch)
+            best = min(best, time.perf_counter() - start)
+        results[batch_size] = {
+            "ms_per_batch": round(1000 * best / len(batches), 3),
+            "queries_per_second": round(len(embeddings) / best, 1),
+        }
+    return results
+
+
+def main(config, batch_size=256, repeats=5, neural_model_path=None):
+    """
+    Compares the reference, single-normalization and fused query paths on the test split.
+
+    Encoding is identical for all paths and is done once up front; only the
+    transformation, normalization and search are timed.
+
+    Args:
+        config (dict): Test configuration (see `config/test/`). Must use a linear transformation.
+        batch_size (int): Number of queries per search call.
+        repeats (int): Number of timed passes per path.
+        neural_model_path (str, optional): MLP transformation to compare with the linear map.
+
+    Returns:
+        dict: Latency, MRR, R@10 and top-10 agreement with the reference path, per path.
+    """
+    data = Data(config["data"]["data_type"], cache_dir=config.get("cache", {}).get("data_dir"))
+    _, _, test_pairs = data.get_data(stage='evaluation')
+    career_histories_texts = [exp_doc for exp_doc, _ in test_pairs]
+    ground_truth_label_ids = data.label_ids(test_pairs)
+
+    # All three paths need the linear map; the fused index is built for the "fused" path
+    model_config = dict(config["model"], transformation_method="linear", fuse_transformation=True)
+    predictor = build_predictor(
+        dict(config, model=model_config), data.labels, embedding_cache_dir=config.get("cache", {}).get("embedding_dir")
+    )
+    label_predictor = predictor.label_predictor
+
+    start = time.perf_counter()
+    embeddings = np.asarray(label_predictor.query_encoder.encode(career_histories_texts))
+    print(f"Encoded {len(embeddings)} test career histories in {time.perf_counter() - start:.2f}s")
+
+    results = {}
+    reference_indices = None
+    for name, search in (
+        ("reference", reference_search),
+        ("single_normalize", single_normalize_search),
+        ("fused", fused_search),
+    ):
+        indices, ms_per_1k = benchmark(search, label_predictor, embeddings, batch_size, repeats)
+        if reference_indices is None:
+            reference_indices = indices
+        metrics = ranking_metrics(indices, ground_truth_label_ids, ks=(10,))
+        results[name] = {
+            "ms_per_1k_queries": round(ms_per_1k, 3),
+            "MRR": round(metrics["MRR"], 4),
+            "R@10": round(metrics["R@10"], 4),
+            "top10_agreement_with_reference": round(float(np.mean(indices == reference_indices)), 4),
+        }
+        print(f"{name}: {json.dumps(results[name])}")
+
+    if neural_model_path is not None:
+        # Transformation alone, then the full transform + search path with the MLP
+        transformations = {"linear": label_predictor.transformation_model, "neural": MLPTransformationModel(neural_model_path)}
+        results["transformation"] = {
+            name: benchmark_transformation(model, embeddings, (1, 32, batch_size), repeats)
+            for name, model in transformations.items()
+        }
+        print(f"transformation: {json.dumps(results['transformation'])}")
+        label_predictor.transformation_model = transformations["neural"]
+        indices, ms_per_1k = benchmark(single_normalize_search, label_predictor, embeddings, batch_size, repeats)
+        metrics = ranking_metrics(indices, ground_truth_label_ids, ks=(10,))
+        results["neural"] = {
+            "ms_per_1k_queries": round(ms_per_1k, 3),
+            "MRR": round(metrics["MRR"], 4),
+            "R@10": round(metrics["R@10"], 4),
+            "top10_agreement_with_reference": round(float(np.mean(indices == reference_indices)), 4),
+        }
+        print(f"neural: {json.dumps(results['neural'])}")
+    return results
+
+
+def benchmark_backends(config, backends, batch_size=256, num_single_queries=100):
+    """
+    Compares encoder inference backends end to end (encode, transform, search) on the test split.
+
+    Every backend gets its own predictor, so the labels are encoded by the same backend as the
+    queries. The embedding cache is disabled to time actual encoding.
+
+    Args:
+        config (dict): Test configuration (see `config/test/`).
+        backends (Iterable[str]): Backends to compare, see `onnx_backend.BACKENDS`. The first one is the reference.
+        batch_size (int): Number of queries per `predict_ids` call for the throughput measurement.
+        num_single_queries (int): Number of one-query calls for the latency measurement.
+
+    Returns:
+        dict: Per backend, throughput, median single-query latency, MRR, R@10 and top-10 agreement with the reference.
+    """
+    data = Data(config["data"]["data_type"], cache_dir=config.get("cache", {}).get("data_dir"))
+    _, _, test_pairs = data.get_data(stage='evaluation')
+    career_histories_texts = [exp_doc for exp_doc, _ in test_pairs]
+    ground_truth_label_ids = data.label_ids(test_pairs)
+
+    results = {}
+    reference_indices = None
+    for backend in backends:
+        predictor = build_predictor(dict(config, backend=dict(config.get("backend") or {}, type=backend)), data.labels)
+        label_predictor = predictor.label_predictor
+
+        start = time.perf_counter()
+        indices = np.concatenate([
+            label_predictor.predict_ids(career_histories_texts[i:i + batch_size], top_k=10)[0]
+            for i in range(0, len(career_histories_texts), batch_size)
+        ])
+        elapsed = time.perf_counter() - start
+
+        latencies = []
+        for text in career_histories_texts[:num_single_queries]:
+            query_start = time.perf_counter()
+            label_predictor.predict_ids([text], top_k=10)
+            latencies.append(time.perf_counter() - query_start)
+
+        if reference_indices is None:
+            reference_indices = indices
+        metrics = ranking_metrics(indices, ground_truth_label_ids, ks=(10,))
+        results[backend] = {
+            "queries_per_second": round(len(indices) / elapsed, 1),
+            "p50_single_query_ms": round(1000 * float(np.median(latencies)), 3),
+            "MRR": round(metrics["MRR"], 4),
+            "R@10": round(metrics["R@10"], 4),
+            "top10_agreement_with_reference": round(float(np.mean(indices == reference_indices)), 4),
+        }
+        print(f"{backend}: {json.dumps(results[backend])}")
+    return results
+
+
+def load_minilm_app_predictor(label_index_config="minilm_baseline.yaml"):
+    """
+    Loads the Streamlit app's former setup: all-MiniLM-L6-v2 searching a flat index of the labels.
+
+    The labels and index are the label index of `label_index_config` (see `config/label_index/`),
+    built by `precompute_faiss_index.py`, so both configurations load from the same format.
+
+    Returns:
+        Callable: Maps a list of texts to (n, 10) label ids.
+    """
+    config = load_label_index_config(label_index_config)
+    label_index_dir = config["output"]["label_index_dir"]
+    if not label_store.has_label_embeddings(label_index_dir):
+        raise FileNotFoundError(
+            f"{label_index_dir} does not exist, build it with "
+            f"`python src/precompute_faiss_index.py --label_index_config {label_index_config}`"
+        )
+    label_texts = label_store.load_label_texts(label_index_dir)
+    label_predictor = build_predictor(config["predictor"], label_texts, label_index_dir).label_predictor
+    return lambda texts: label_predictor.predict_ids(texts, top_k=10)[0]
+
+
+def load_configured_predictor(config):
+    """
+    Loads the Predictor of a test configuration, as the Streamlit app and `serve.py` do.
+
+    Returns:
+        Callable: Maps a list of texts to (n, 10) label ids.
+    """
+    label_texts = load_label_vocabulary(config["data"]["data_type"], cache_dir=config.get("cache", {}).get("data_dir"))
+    label_predictor = build_predictor(config, label_texts).label_predictor
+    return lambda texts: label_predictor.predict_ids(texts, top_k=10)[0]
+
+
+def _cold_start_worker(loader, loader_args, queries, results):
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    predict_ids = loader(*loader_args)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = process.memory_info().rss
+    query_start = time.perf_counter()
+    predict_ids(queries[:1])
+    first_query_seconds = time.perf_counter() - query_start
+    results.put({
+        "load_seconds": round(load_seconds, 2),
+        "first_query_ms": round(1000 * first_query_seconds, 1),
+        "rss_loaded_mb": round(rss_loaded / 2**20, 1),
+        "rss_model_mb": round((rss_loaded - rss_before) / 2**20, 1),
+        "rss_after_query_mb": round(process.memory_info().rss / 2**20, 1),
+    })
+
+
+def benchmark_cold_start(config, queries=("role: marketing intern \n description: ",), baseline_label_index_config="minilm_baseline.yaml"):
+    """
+    Compares cold start time and resident memory of the app's former MiniLM setup and the configured Predictor.
+
+    Every configuration is loaded in a fresh process, so neither benefits from the other's imports,
+    page cache of model files or allocations.
+
+    Args:
+        config (dict): Test configuration (see `config/test/`) of the Predictor.
+        queries (Sequence[str]): Queries, the first of which is timed after loading.
+        baseline_label_index_config (str): Label index configuration of the MiniLM baseline.
+
+    Returns:
+        dict: Per configuration, load time, first query latency and resident memory.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name, loader, loader_args in (
+        ("minilm_faiss_index", load_minilm_app_predictor, (baseline_label_index_config,)),
+        ("configured_predictor", load_configured_predictor, (config,)),
+    ):
+        queue = context.Queue()
+        process = context.Process(target=_cold_start_worker, args=(loader, loader_args, list(queries), queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{name}: failed with exit code {process.exitcode}")
+            continue
+        results[name] = queue.get()
+        print(f"{name}: {json.dumps(results[name])}")
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Entry point for benchmarking the inference query paths on a test configuration.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the predictor query paths on the test split.")
+    parser.add_argument("--test_config", type=str, required=True, help="Path to the test configuration file.")
+    parser.add_argument("--batch_size", type=int, default=256, help="Number of queries per search call.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed passes per query path.")
+    parser.add_argument("--neural", action="store_true", help="Also benchmark the MLP transformation (model.path_neural_model).")
+    parser.add_argument(
+        "--backends", type=str, nargs="+", default=None,
+        help="Instead, compare encoder backends end to end, e.g. --backends torch onnx_int8 (the first is the reference).",
+    )
+    parser.add_argument(
+        "--cold_start", action="store_true",
+        help="Instead, compare cold start time and memory of the app's former MiniLM index and the configured Predictor.",
+    )
+    parser.add_argument(
+        "--baseline_label_index_config", type=str, default="minilm_baseline.yaml",
+        help="Label index configuration of the MiniLM baseline of --cold_start.",
+    )
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    config = load_test_config(args.test_config)
+    if args.cold_start:
+        results = benchmark_cold_start(config, baseline_label_index_config=args.baseline_label_index_config)
+    elif args.backends is not None:
+        results = benchmark_backends(config, args.backends, batch_size=args.batch_size)
+    else:
+        results = main(
+            config,
+            batch_size=args.batch_size,
+            repeats=args.repeats,
+            neural_model_path=config["model"]["path_neural_model"] if args.neural else None,
+        )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
@@ -1,17 +1,67 @@
-import numpy as np
-import faiss
+import re
+import time
+import psutil
 import streamlit as st
-from sentence_transformers import SentenceTransformer
+from config_utils import load_serve_config
+from data_classes import load_label_vocabulary
+import label_store
+from predictor import build_predictor
+from query_cache import CachedLabelPredictor, load_cached_label_predictor
+from utils import SEP_TOKEN
+
+DEFAULT_SERVE_CONFIG = "karrierewege.yaml"
 
 @st.cache_resource
-def load_predictor():
-    # Load precomputed job labels + FAISS index
-    next_jobs = np.load('src/next_jobs.npy', allow_pickle=True)
-    index = faiss.read_index('src/faiss_index.index')
+def load_predictor(serve_config=DEFAULT_SERVE_CONFIG):
+    """
+    Loads the Predictor of a serving configuration (see `config/serve/`) once for all sessions and pages.
+
+    This is the model, transformation and persisted label index that `test.py` evaluates, wrapped in
+    the configured query cache.
 
-    # Load SentenceTransformer model
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    return model, index, next_jobs
+    Returns:
+        tuple:
+            - LabelPredictor or CachedLabelPredictor: The predictor.
+            - dict: Cold-start time and resident memory of the process after loading.
+    """
+    start = time.perf_counter()
+    config = load_serve_config(serve_config)
+    predictor_config = config["predictor"]
+    label_index_dir = config.get("label_index_dir")
+    if label_index_dir is not None:
+        # The label index holds its own vocabulary, so the dataset is not loaded
+        label_texts = label_store.load_label_texts(label_index_dir)
+    else:
+        label_texts = load_label_vocabulary(
+            predictor_config["data"]["data_type"], cache_dir=predictor_config.get("cache", {}).get("data_dir")
+        )
+    predictor = build_predictor(predictor_config, label_texts, label_index_dir)
+    label_predictor = load_cached_label_predictor(predictor.label_predictor, config.get("server", {}).get("query_cache"))
+    load_stats = {
+        "serve_config": serve_config,
+        "load_seconds": time.perf_counter() - start,
+        "rss_mb": psutil.Process().memory_info().rss / 2**20,
+    }
+    return label_predictor, load_stats
+
+def format_career_history(career_input):
+    """
+    Formats "Marketing Intern → Marketing Specialist" (or one role per line) like the career histories the model was trained on.
+    """
+    roles = [role.strip() for role in re.split(r"→|->|\n", career_input) if role.strip()]
+    return SEP_TOKEN.join(f"role: {role} \n description: " for role in roles)
+
+def show_predictor_stats(label_predictor, load_stats):
+    st.sidebar.caption(
+        f"Predictor ({load_stats['serve_config']}) loaded in {load_stats['load_seconds']:.1f} s, "
+        f"{load_stats['rss_mb']:.0f} MB resident"
+    )
+    if isinstance(label_predictor, CachedLabelPredictor):
+        results, embeddings = label_predictor.results, label_predictor.embeddings
+        st.sidebar.caption(
+            f"Query cache hit rate: results {results.hit_rate:.0%} ({results.hits}/{results.hits + results.misses}), "
+            f"embeddings {embeddings.hit_rate:.0%} ({embeddings.hits}/{embeddings.hits + embeddings.misses})"
+        )
 
 def extract_job_title_and_description(raw_text):
     """
@@ -22,11 +72,11 @@ def extract_job_title_and_description(raw_text):
     description = parts[1].strip() if len(parts) > 1 else "No description available."
     return title, description
 
-def run():
+def run(serve_config=DEFAULT_SERVE_CONFIG):
     st.title("🚀 Career Changer Pathfinder")
     st.caption("Find your next career pivot with smarter AI suggestions! 🎯")
 
-    model, index, next_jobs = load_predictor()
+    label_predictor, load_stats = load_predictor(serve_config)
 
     # User Input
     st.subheader("📝 Enter your career path")
@@ -39,22 +89,19 @@ def run():
             st.warning("Please enter your career path above.")
         else:
             with st.spinner("Analyzing and generating suggestions..."):
-                # Embed user input
-                input_embedding = model.encode([career_input])
-                input_embedding = input_embedding / np.linalg.norm(input_embedding, axis=1, keepdims=True)
-                input_embedding = input_embedding.astype('float32')
-
-                # Search using FAISS index
-                distances, indices = index.search(input_embedding, 3)
+                # Embed, transform and search the user input
+                indices, similarities = label_predictor.predict_ids([format_career_history(career_input)], top_k=3)
 
                 st.success("✅ Here are your Top 3 Career Pivot Suggestions:")
 
-                for i, idx in enumerate(indices[0]):
-                    confidence = distances[0][i]
-                    raw_text = next_jobs[idx]
+                [(found_indices, found_similarities)] = label_predictor.found_results(indices, similarities)
+                for idx, confidence in zip(found_indices, found_similarities):
+                    raw_text = label_predictor.label_texts[idx]
                     job_title, job_desc = extract_job_title_and_description(raw_text)
 
                     with st.expander(f"🔎 {job_title} (Similarity: {confidence:.2f})"):
                         st.markdown(f"**📝 What You'll Do:**\n{job_desc[:300]}...")  # Shortened
                         st.markdown("**💼 Why It’s Interesting:**\nThis role is ideal if you want to gain experience in the field and build towards mid- and senior-level positions.")
                         st.markdown(f"**🔗 Learn More:** [Search {job_title} Internships](https://www.google.com/search?q={job_title.replace(' ', '+')}+Internships)")
+
+    show_predictor_stats(label_predictor, load_stats)
@@ -45,3 +45,43 @@ def load_test_config(config_name):
         config = yaml.safe_load(file)
 
     return config
+
+def load_serve_config(config_name):
+    """
+    Loads a YAML configuration file required for serving.
+
+    The serving configuration names the test configuration that defines the predictor;
+    it is loaded and returned under the `predictor` key.
+
+    Args:
+        config_name (str): The name of the serving configuration file to be loaded.
+
+    Returns:
+        dict: A dictionary containing the serving configuration.
+    """
+    with open(os.path.join("config/serve/", config_name)) as file:
+        config = yaml.safe_load(file)
+
+    config["predictor"] = load_test_config(config["test_config"])
+
+    return config
+
+def load_label_index_config(config_name):
+    """
+    Loads a YAML configuration file required for building a label index.
+
+    The label index configuration names the test configuration whose embedding model, backend and
+    index type the labels are encoded and indexed with; it is loaded and returned under the `predictor` key.
+
+    Args:
+        config_name (str): The name of the label index configuration file to be loaded.
+
+    Returns:
+        dict: A dictionary containing the label index configuration.
+    """
+    with open(os.path.join("config/label_index/", config_name)) as file:
+        config = yaml.safe_load(file)
+
+    config["predictor"] = load_test_config(config["test_config"])
+
+    return config
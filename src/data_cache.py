@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from itertools import islice
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DATA_CACHE_FORMAT_VERSION = 1  # Bump when the pair construction in utils.py changes
+_PAIR_SCHEMA = pa.schema([("doc_1", pa.string()), ("doc_2", pa.string())])
+_WRITE_BATCH_SIZE = 100_000
+
+
+def splits_cache_key(data_type, loader_kwargs, source_fingerprints):
+    """
+    Computes the cache key of the prepared splits of a dataset.
+
+    Args:
+        data_type (str): The dataset type (see `Data`).
+        loader_kwargs (dict): Keyword arguments the `stream_prepare_*` function is called with.
+        source_fingerprints (List[str]): Fingerprints of the source splits.
+
+    Returns:
+        str: Hex digest identifying the prepared splits.
+    """
+    description = [DATA_CACHE_FORMAT_VERSION, data_type, sorted(loader_kwargs.items()), list(source_fingerprints)]
+    return hashlib.sha1(json.dumps(description, default=str).encode()).hexdigest()
+
+
+def _latest_path(cache_dir, data_type, loader_kwargs):
+    description = [DATA_CACHE_FORMAT_VERSION, data_type, sorted(loader_kwargs.items())]
+    loader_key = hashlib.sha1(json.dumps(description, default=str).encode()).hexdigest()
+    return os.path.join(cache_dir, data_type, f"latest-{loader_key}.json")
+
+
+_HUB_LOOKUP_TIMEOUT = 3  # Seconds; a slower Hub falls back to the cached snapshot
+_hub_revisions = {}  # Revisions looked up by this process, so repeated `Data()` constructions do not query the Hub again
+
+
+def source_revision(source):
+    """
+    Returns a cheaply computed revision of a source of the prepared splits, without loading it.
+
+    Local files are identified by their size and modification time, Hugging Face datasets by the
+    commit hash of their main branch, looked up once per process. With `HF_HUB_OFFLINE` set, or if
+    the lookup fails, the commit of the locally cached snapshot of the dataset is used instead.
+
+    Args:
+        source (str or Path): Local file or Hugging Face dataset id.
+
+    Returns:
+        str or None: Revision, or None if it cannot be determined.
+    """
+    if os.path.isfile(source):
+        stat = os.stat(source)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    source = str(source)
+    if source in _hub_revisions:
+        return _hub_revisions[source]
+    from huggingface_hub import constants, dataset_info
+
+    if constants.HF_HUB_OFFLINE:
+        revision = _cached_snapshot_revision(constants.HF_HUB_CACHE, source)
+    else:
+        try:
+            revision = dataset_info(source, timeout=_HUB_LOOKUP_TIMEOUT).sha
+        except Exception as error:
+            revision = _cached_snapshot_revision(constants.HF_HUB_CACHE, source)
+            print(f"Could not look up the revision of {source} ({type(error).__name__}), using the cached snapshot {revision}")
+    _hub_revisions[source] = revision
+    return revision
+
+
+def _cached_snapshot_revision(hub_cache, source):
+    ref_path = os.path.join(hub_cache, f"datasets--{source.replace('/', '--')}", "refs", "main")
+    try:
+        with open(ref_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def find_latest_splits(cache_dir, data_type, loader_kwargs, source_revisions):
+    """
+    Looks up the prepared splits last cached for a data type and loader arguments.
+
+    The splits are only returned if they were prepared from the same `source_revisions`, which are
+    cheap to compute (see `source_revision`), unlike the fingerprints of the loaded source data.
+    Sources whose revision cannot be determined, e.g. offline without a cached snapshot, are assumed
+    unchanged, since they could not be loaded to prepare new splits either.
+
+    Args:
+        cache_dir (str): Root directory of the data cache.
+        data_type (str): The dataset type (see `Data`).
+        loader_kwargs (dict): Keyword arguments of the `stream_prepare_*` function.
+        source_revisions (dict): Current revision of every source, see `source_revision`.
+
+    Returns:
+        str or None: Directory of the prepared splits, or None if none are cached for these sources.
+    """
+    try:
+        with open(_latest_path(cache_dir, data_type, loader_kwargs)) as f:
+            latest = json.load(f)
+    except FileNotFoundError:
+        return None
+    cached_revisions = latest.get("source_revisions", {})
+    unknown = sorted(source for source, revision in source_revisions.items() if revision is None)
+    known_revisions = {source: revision for source, revision in source_revisions.items() if revision is not None}
+    if set(cached_revisions) != set(source_revisions) or any(cached_revisions[source] != revision for source, revision in known_revisions.items()):
+        return None
+    if unknown:
+        print(f"Revision of {', '.join(unknown)} unknown, reusing the splits prepared last")
+    path = os.path.join(cache_dir, data_type, latest["key"])
+    if not is_cached(path) or load_labels(path) is None:
+        return None
+    return path
+
+
+def save_latest_splits(cache_dir, data_type, loader_kwargs, key, source_revisions):
+    """
+    Records `key` as the prepared splits of `source_revisions` returned by `find_latest_splits`.
+    """
+    latest_path = _latest_path(cache_dir, data_type, loader_kwargs)
+    tmp_path = f"{latest_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "source_revisions": source_revisions}, f)
+    os.replace(tmp_path, latest_path)
+
+
+def save_splits(path, splits, meta=None):
+    """
+    Writes prepared splits to `path` as one Arrow IPC file per split.
+
+    Pairs are written in record batches, so lazily generated splits are never fully held in memory.
+    The directory is assembled under a unique temporary name and renamed into place once complete,
+    so readers never see a partially written or missing directory. Since `path` is keyed by the
+    content (see `splits_cache_key`), splits completed first by a concurrent writer are kept.
+
+    Args:
+        path (str): Target directory.
+        splits (dict): Maps split names to iterables of (doc_1, doc_2) pairs.
+        meta (dict, optional): Additional JSON-serializable information stored in `meta.json`.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.tmp-", dir=os.path.dirname(path))
+    for split, pairs in splits.items():
+        pairs = iter(pairs)
+        with pa.OSFile(os.path.join(tmp_path, f"{split}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, _PAIR_SCHEMA) as writer:
+                while True:
+                    batch = list(islice(pairs, _WRITE_BATCH_SIZE))
+                    if not batch:
+                        break
+                    doc_1, doc_2 = zip(*batch)
+                    writer.write_batch(pa.record_batch([pa.array(doc_1, pa.string()), pa.array(doc_2, pa.string())], schema=_PAIR_SCHEMA))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta or {}, f, default=str)
+    try:
+        os.rename(tmp_path, path)
+        return
+    except OSError:
+        if not os.path.exists(path):
+            raise
+    if is_cached(path):
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+    # A leftover incomplete directory is moved aside as a whole before the new one takes its place
+    stale_path = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.stale-", dir=os.path.dirname(path))
+    os.replace(path, stale_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(stale_path, ignore_errors=True)
+
+
+def read_split(path, split):
+    """
+    Memory-maps a prepared split written by `save_splits`.
+
+    Args:
+        path (str): Directory of the prepared splits.
+        split (str): Name of the split.
+
+    Returns:
+        pyarrow.Table: Table with the string columns `doc_1` and `doc_2`.
+    """
+    source = pa.memory_map(os.path.join(path, f"{split}.arrow"), "r")
+    return pa.ipc.open_file(source).read_all()
+
+
+def iter_split(path, split):
+    """
+    Iterates over the pairs of a prepared split, one record batch at a time.
+
+    Args:
+        path (str): Directory of the prepared splits.
+        split (str): Name of the split.
+
+    Yields:
+        tuple: (doc_1, doc_2) pairs.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(os.path.join(path, f"{split}.arrow"), "r"))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+
+
+def split_length(path, split):
+    """
+    Returns the number of pairs in a prepared split without reading its strings.
+    """
+    reader = pa.ipc.open_file(pa.memory_map(os.path.join(path, f"{split}.arrow"), "r"))
+    return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+def load_split(path, split):
+    """
+    Loads all pairs of a prepared split.
+
+    Args:
+        path (str): Directory of the prepared splits.
+        split (str): Name of the split.
+
+    Returns:
+        list of tuples: (doc_1, doc_2) pairs.
+    """
+    table = read_split(path, split)
+    return list(zip(table.column("doc_1").to_pylist(), table.column("doc_2").to_pylist()))
+
+
+def is_cached(path):
+    """
+    Returns whether `path` holds completely written prepared splits.
+    """
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def collect_labels(path):
+    """
+    Collects the sorted, de-duplicated `doc_2` values of all prepared splits.
+
+    Args:
+        path (str): Directory of the prepared splits.
+
+    Returns:
+        List[str]: Sorted label vocabulary.
+    """
+    labels = set()
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".arrow"):
+            labels.update(pc.unique(read_split(path, name[: -len(".arrow")]).column("doc_2")).to_pylist())
+    return sorted(labels)
+
+
+def save_labels(path, labels):
+    """
+    Persists the label vocabulary next to the prepared splits.
+
+    Args:
+        path (str): Directory of the prepared splits.
+        labels (List[str]): Label vocabulary; the position of a label is its id.
+    """
+    tmp_path = os.path.join(path, f"labels.json.tmp-{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        json.dump(labels, f)
+    os.replace(tmp_path, os.path.join(path, "labels.json"))
+
+
+def load_labels(path):
+    """
+    Loads the label vocabulary persisted by `save_labels`.
+
+    Args:
+        path (str): Directory of the prepared splits.
+
+    Returns:
+        List[str] or None: Label vocabulary, or None if it has not been persisted yet.
+    """
+    try:
+        with open(os.path.join(path, "labels.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
@@ -1,6 +1,53 @@
-from utils import load_prepare_decorte, load_prepare_karrierewege, load_prepare_decorte_esco
+from utils import stream_prepare_decorte, stream_prepare_karrierewege, stream_prepare_decorte_esco, PairStream, SPLITS
+from data_cache import (
+    splits_cache_key, save_splits, load_split, iter_split, split_length, is_cached, collect_labels, save_labels, load_labels,
+    find_latest_splits, save_latest_splits, source_revision,
+)
+from esco_lookup import ESCO_OCCUPATIONS_CSV
 import utils
+import os
 import re
+import numpy as np
+
+# Maps every data type to its `stream_prepare_*` function and the arguments it is called with
+DATA_LOADERS = {
+    'decorte': (stream_prepare_decorte, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False)),
+    'decorte_esco': (stream_prepare_decorte_esco, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False)),
+    'karrierewege': (stream_prepare_karrierewege, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en')),
+    'karrierewege_occ': (stream_prepare_karrierewege, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en_free')),
+    'karrierewege_100k': (stream_prepare_karrierewege, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='esco_100k')),
+    'karrierewege_cp': (stream_prepare_karrierewege, dict(consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en_free_cp')),
+}
+
+# Hugging Face datasets and local files every data type is prepared from, see `data_cache.source_revision`
+DATA_SOURCES = {
+    'decorte': ("jensjorisdecorte/anonymous-working-histories", ESCO_OCCUPATIONS_CSV),
+    'decorte_esco': ("jensjorisdecorte/anonymous-working-histories", ESCO_OCCUPATIONS_CSV),
+    'karrierewege': ("ElenaSenger/Karrierewege",),
+    'karrierewege_occ': ("ElenaSenger/Karrierewege_plus",),
+    'karrierewege_100k': ("ElenaSenger/Karrierewege_plus",),
+    'karrierewege_cp': ("ElenaSenger/Karrierewege_plus",),
+}
+
+def load_label_vocabulary(data_type, cache_dir=None):
+    """
+    Loads only the sorted label vocabulary of a dataset; no pairs are materialized.
+
+    With a cache, only the persisted `labels.json` of the prepared splits is read. Without one,
+    the pairs are generated once and only their labels are kept.
+
+    Args:
+        data_type (str): The dataset type (see `Data`).
+        cache_dir (str, optional): Directory prepared splits are cached in.
+
+    Returns:
+        List[str]: Label vocabulary; the position of a label is its id (as in `Data.labels`).
+    """
+    if cache_dir is not None:
+        return Data(data_type, streaming=True, cache_dir=cache_dir).labels
+    streams = Data(data_type, streaming=True)
+    return sorted({doc2 for pairs in (streams.train_pairs, streams.val_pairs, streams.test_pairs) for _, doc2 in pairs})
+
 
 class Data:
     """
@@ -15,13 +62,19 @@ class Data:
         DOC_1_PROMPT (str, optional): An optional prompt for document 1.
         DOC_2_PROMPT (str, optional): An optional prompt for document 2.
         ONLY_TITLES (bool): Flag to indicate whether only titles should be extracted.
-        train_pairs (list): Training data pairs.
-        val_pairs (list): Validation data pairs.
-        test_pairs (list): Test data pairs.
-        labels (list): Unique labels in the dataset.
+        streaming (bool): Flag to indicate whether pairs are generated lazily instead of held in memory.
+        cache_dir (str, optional): Directory prepared splits are cached in.
+        refresh_cache (bool): Flag to indicate whether the source dataset is loaded even if its prepared splits are cached.
+        train_pairs (list or PairStream): Training data pairs.
+        val_pairs (list or PairStream): Validation data pairs.
+        test_pairs (list or PairStream): Test data pairs.
+        labels (list): Sorted unique labels in the dataset; the position of a label is its id
+            (None when streaming without a cache).
+        label_to_id (dict): Maps every label to its id.
     """
 
-    def __init__(self, DATA_TYPE, DOC_1_PROMPT=None, DOC_2_PROMPT=None, ONLY_TITLES=False):
+    def __init__(self, DATA_TYPE, DOC_1_PROMPT=None, DOC_2_PROMPT=None, ONLY_TITLES=False, streaming=False, cache_dir=None,
+                 refresh_cache=False):
         """
         Initializes the Data class by loading the appropriate dataset based on the specified type.
 
@@ -30,51 +83,126 @@ class Data:
             DOC_1_PROMPT (str, optional): Prompt for document 1 (default: None).
             DOC_2_PROMPT (str, optional): Prompt for document 2 (default: None).
             ONLY_TITLES (bool): If True, extracts only job titles (default: False).
+            streaming (bool): If True, keeps the splits as lazily generated `PairStream`s so that
+                consumers run in bounded memory. Without `cache_dir`, labels are not collected in this mode (default: False).
+            cache_dir (str, optional): If set, prepared splits are cached there as memory-mapped Arrow files
+                and reused by later runs (default: None). With streaming, only the label vocabulary is read
+                until the pairs are iterated.
+            refresh_cache (bool): If True, the source dataset is loaded and fingerprinted even if prepared splits
+                of its current revision are cached (default: False).
         """
         self.DATA_TYPE = DATA_TYPE
         self.DOC_1_PROMPT = DOC_1_PROMPT
         self.DOC_2_PROMPT = DOC_2_PROMPT
         self.ONLY_TITLES = ONLY_TITLES
+        self.streaming = streaming
+        self.cache_dir = cache_dir
+        self.refresh_cache = refresh_cache
         self.train_pairs = None
         self.val_pairs = None
         self.test_pairs = None
         self.labels = None
+        self.label_to_id = None
         self.__load_data()
 
     def __load_data(self):
         """
         Loads data based on the specified `DATA_TYPE`.
 
-        Depending on the dataset type, this method calls the appropriate `load_prepare_*` function 
-        to load and preprocess the dataset. It also extracts unique labels from the dataset.
-        """
-        if self.DATA_TYPE == 'decorte':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_decorte(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, 
-            )
-        elif self.DATA_TYPE == 'decorte_esco':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_decorte_esco(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, 
-            )
-        elif self.DATA_TYPE == 'karrierewege':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_karrierewege(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en'
-            )
-        elif self.DATA_TYPE == 'karrierewege_occ':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_karrierewege(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en_free'
-            )
-        elif self.DATA_TYPE == 'karrierewege_100k':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_karrierewege(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='esco_100k'
-            )
-        elif self.DATA_TYPE == 'karrierewege_cp':
-            self.train_pairs, self.val_pairs, self.test_pairs = load_prepare_karrierewege(
-                consider_all_subspans_of_len_at_least_2=True, minus_last=False, language='en_free_cp'
-            )
+        Depending on the dataset type, this method calls the appropriate `stream_prepare_*` function 
+        to load and preprocess the dataset, or reads the prepared splits from the cache. Unless streaming,
+        the pairs are materialized and the unique labels are extracted from the dataset.
+
+        The cache key contains the fingerprints of the source splits, which are only known once the
+        source dataset is loaded. To avoid that load, the splits cached last for the data type are
+        reused if the sources still have the same revision (see `data_cache.source_revision`: commit
+        of a Hugging Face dataset, size and modification time of a local file). Otherwise, or if a
+        revision cannot be determined, the source is loaded and fingerprinted.
+        """
+        if self.DATA_TYPE not in DATA_LOADERS:
+            raise ValueError(f"Invalid data type: {self.DATA_TYPE}")
+        loader, loader_kwargs = DATA_LOADERS[self.DATA_TYPE]
+
+        if self.cache_dir is not None:
+            source_revisions = {str(source): source_revision(source) for source in DATA_SOURCES[self.DATA_TYPE]}
+            # Changes of the ESCO normalization change the pairs without changing the sources
+            source_revisions["esco_normalization_version"] = utils.ESCO_NORMALIZATION_VERSION
+            path = None
+            if not self.refresh_cache:
+                path = find_latest_splits(self.cache_dir, self.DATA_TYPE, loader_kwargs, source_revisions)
+            if path is None:
+                path = self.__prepare_cache(loader(**loader_kwargs), loader_kwargs, source_revisions)
+            else:
+                print(f"Loading prepared splits from cache: {path}")
+            self.__set_labels(load_labels(path))
+            if self.streaming:
+                self.train_pairs, self.val_pairs, self.test_pairs = (
+                    PairStream(lambda split=split: iter_split(path, split), length_hint=split_length(path, split))
+                    for split in SPLITS
+                )
+                return
+            self.train_pairs, self.val_pairs, self.test_pairs = (load_split(path, split) for split in SPLITS)
+            return
+
+        streams = loader(**loader_kwargs)
+        if self.streaming:
+            self.train_pairs, self.val_pairs, self.test_pairs = (streams[split] for split in SPLITS)
+            return
+        else:
+            self.train_pairs, self.val_pairs, self.test_pairs = (list(streams[split]) for split in SPLITS)
 
         # Extract unique labels from the dataset
-        self.labels = list(set([pair[1] for pair in self.train_pairs + self.val_pairs + self.test_pairs]))
+        self.__set_labels(set([pair[1] for pair in self.train_pairs + self.val_pairs + self.test_pairs]))
+
+    def __set_labels(self, labels):
+        """
+        Sets the label vocabulary, sorted so that label ids are stable across processes.
+
+        Args:
+            labels (Iterable[str]): Unique labels.
+        """
+        self.labels = sorted(labels)
+        self.label_to_id = {label: label_id for label_id, label in enumerate(self.labels)}
+
+    def label_ids(self, data_pairs):
+        """
+        Maps the labels (`doc2`) of data pairs to their ids in the label vocabulary.
+
+        Args:
+            data_pairs (Iterable[tuple]): (doc1, doc2) pairs.
+
+        Returns:
+            np.ndarray: (n,) int32 array of label ids.
+        """
+        return np.fromiter((self.label_to_id[doc2] for _, doc2 in data_pairs), dtype=np.int32)
+
+    def __prepare_cache(self, streams, loader_kwargs, source_revisions):
+        """
+        Makes sure the prepared splits are cached on disk, building them on a cache miss.
+
+        The cache entry is keyed by the data type, the loader arguments and the fingerprints of the
+        source splits, so it is invalidated whenever the source dataset changes. The sorted label
+        vocabulary is persisted alongside the splits.
+
+        Args:
+            streams (dict): Maps split names to the `PairStream`s returned by the loader.
+            loader_kwargs (dict): Keyword arguments the loader was called with.
+            source_revisions (dict): Revisions of the sources, recorded for `data_cache.find_latest_splits`.
+
+        Returns:
+            str: Directory of the cached splits.
+        """
+        key = splits_cache_key(self.DATA_TYPE, loader_kwargs, [streams[split].fingerprint for split in SPLITS])
+        path = os.path.join(self.cache_dir, self.DATA_TYPE, key)
+        if is_cached(path):
+            print(f"Loading prepared splits from cache: {path}")
+        else:
+            print(f"Caching prepared splits to: {path}")
+            save_splits(path, streams, meta={"data_type": self.DATA_TYPE, "loader_kwargs": loader_kwargs})
+        if load_labels(path) is None:
+            save_labels(path, collect_labels(path))
+        save_latest_splits(self.cache_dir, self.DATA_TYPE, loader_kwargs, key, source_revisions)
+        return path
 
     @staticmethod
     def __minus_last(data_pairs):
@@ -119,6 +247,30 @@ class Data:
         
         return list(zip(sequences, targets))  # Return as pairs
     
+    def __stream(self, pairs, stage):
+        """
+        Lazily applies the stage-specific processing of `get_data` to a stream of pairs.
+
+        Args:
+            pairs (PairStream): Stream of (doc1, doc2) pairs.
+            stage (str): The stage of training or evaluation.
+
+        Returns:
+            PairStream: Processed stream of pairs.
+        """
+        def generate():
+            for pair in pairs:
+                if self.ONLY_TITLES:
+                    pair = self._extract_titles([pair])[0]
+                if stage == 'embedding_finetuning':
+                    yield pair
+                else:
+                    yield from self.__minus_last([pair])
+
+        # `__minus_last` drops pairs with a single-experience history, so the source count only holds without it
+        length_hint = pairs.length_hint if stage == 'embedding_finetuning' else None
+        return PairStream(generate, length_hint=length_hint)
+
     def get_data(self, stage):
         """
         Retrieves dataset splits based on the given stage.
@@ -127,6 +279,8 @@ class Data:
         - `embedding_finetuning`: Returns full pairs or only titles based on `ONLY_TITLES`.
         - `transformation_finetuning` or `evaluation`: Applies `__minus_last` filtering.
 
+        When streaming, the same processing is applied lazily and `PairStream`s are returned.
+
         Args:
             stage (str): The stage of training or evaluation.
 
@@ -136,6 +290,8 @@ class Data:
         Raises:
             ValueError: If the stage is invalid.
         """
+        if self.streaming and stage in ['embedding_finetuning', 'transformation_finetuning', 'evaluation']:
+            return self.__stream(self.train_pairs, stage), self.__stream(self.val_pairs, stage), self.__stream(self.test_pairs, stage)
         if stage == 'embedding_finetuning':
             if self.ONLY_TITLES:
                 return self._extract_titles(self.train_pairs), self._extract_titles(self.val_pairs), self._extract_titles(self.test_pairs)
@@ -0,0 +1,306 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
+
+CACHE_FORMAT_VERSION = 1
+
+# encode() keyword arguments that change the returned vectors and therefore have to be part of the cache key
+_OUTPUT_AFFECTING_KWARGS = ("prompt", "prompt_name", "normalize_embeddings", "precision", "output_value")
+_COMMIT_HASH = re.compile(r"[0-9a-f]{40}")
+
+
+def resolve_model_revision(model_id, revision=None):
+    """
+    Resolves the revision string used to key cached embeddings of a model.
+
+    For models stored in a local directory (e.g. the output of `finetune.py`) a fingerprint of the
+    weight files is used, so that re-training the model invalidates its cached embeddings. For hub
+    models, the configured revision (default "main") is resolved to its commit hash, so that an
+    update of the model on the hub invalidates them as well. Commit hashes are returned as they are.
+
+    Args:
+        model_id (str): Hugging Face model id or local path of the embedding model.
+        revision (str, optional): Explicit revision (branch, tag or commit hash).
+
+    Returns:
+        str: Revision string.
+    """
+    if os.path.isdir(model_id):
+        if revision is not None:
+            return revision
+        fingerprint = hashlib.sha1()
+        for root, dirs, files in os.walk(model_id):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                fingerprint.update(f"{os.path.relpath(path, model_id)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return f"local-{fingerprint.hexdigest()[:16]}"
+    revision = revision or "main"
+    if _COMMIT_HASH.fullmatch(revision):
+        return revision
+    return _hub_commit(model_id, revision)
+
+
+@functools.lru_cache(maxsize=None)
+def _hub_commit(model_id, revision):
+    """
+    Resolves a branch or tag of a hub model to its commit hash.
+
+    Without network access, the commit of the locally cached snapshot is used; if the model is not
+    cached either, the unresolved `revision` is returned with a warning.
+    """
+    from huggingface_hub import constants, model_info
+
+    try:
+        return model_info(model_id, revision=revision, timeout=10).sha
+    except Exception as error:
+        ref_path = os.path.join(constants.HF_HUB_CACHE, f"models--{model_id.replace('/', '--')}", "refs", revision)
+        try:
+            with open(ref_path) as f:
+                commit = f.read().strip()
+        except FileNotFoundError:
+            print(f"Warning: could not resolve revision {revision!r} of {model_id} ({type(error).__name__}); "
+                  f"cached embeddings are keyed by {revision!r} and may be stale")
+            return revision
+        print(f"Warning: could not look up revision {revision!r} of {model_id} ({type(error).__name__}), "
+              f"using the cached snapshot {commit}")
+        return commit
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed store of sentence embeddings for a single embedding model.
+
+    Embeddings are keyed by (model id, model revision, SHA-1 of the text). Every call to `encode`
+    that misses appends one shard, consisting of `<shard>.npy` (embeddings) and `<shard>.keys.npy`
+    (text digests, sorted). Shards are memory-mapped on load and keys are looked up per shard by
+    binary search, so opening a large cache does no work per cached text.
+
+    Attributes:
+        model_id (str): Model id the cached embeddings belong to.
+        model_revision (str): Model revision the cached embeddings belong to.
+        path (str): Directory holding the shards of this model.
+    """
+
+    def __init__(self, cache_dir, model_id, model_revision=None, backend="torch"):
+        """
+        Opens (or creates) the cache namespace of a model.
+
+        Args:
+            cache_dir (str): Root directory of the embedding cache.
+            model_id (str): Hugging Face model id or local path of the embedding model.
+            model_revision (str, optional): Model revision, see `resolve_model_revision`.
+            backend (str): Inference backend of the model (see `onnx_backend.BACKENDS`); ONNX and
+                quantized models produce slightly different embeddings and get their own namespace.
+        """
+        self.model_id = model_id
+        self.model_revision = resolve_model_revision(model_id, model_revision)
+        key = [self.model_id, self.model_revision, CACHE_FORMAT_VERSION]
+        if backend != "torch":
+            key.append(backend)
+        namespace = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        self.path = os.path.join(cache_dir, namespace)
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            os.makedirs(self.path, exist_ok=True)
+            tmp_path = f"{meta_path}.tmp-{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump({"model_id": self.model_id, "model_revision": self.model_revision}, f)
+            os.replace(tmp_path, meta_path)
+
+        self._shards = []
+        self._shard_keys = []  # Per shard, its sorted (n,) "S20" text digests
+        self._shard_rows = []  # Per shard, the embedding row of every sorted digest, or None if in order
+        self.__load_shards()
+
+    def __load_shards(self):
+        """
+        Memory-maps all complete shards of this namespace.
+        """
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".keys.npy"):
+                continue
+            shard_name = name[: -len(".keys.npy")]
+            keys = np.load(os.path.join(self.path, name), mmap_mode="r")
+            embeddings = np.load(os.path.join(self.path, f"{shard_name}.npy"), mmap_mode="r")
+            self.__register_shard(keys, embeddings)
+
+    def __register_shard(self, keys, embeddings):
+        # Keys are stored as raw (n, 20) uint8 rows and compared as fixed-width "S20" values;
+        # numpy byte strings would strip trailing NUL bytes if converted to Python bytes
+        keys = keys.view("S20").reshape(-1)
+        rows = None
+        if len(keys) > 1 and not np.all(keys[1:] >= keys[:-1]):
+            # Shards written before the keys were stored sorted
+            rows = np.argsort(keys, kind="stable")
+            keys = keys[rows]
+        self._shards.append(embeddings)
+        self._shard_keys.append(keys)
+        self._shard_rows.append(rows)
+
+    def __write_shard(self, keys, embeddings):
+        """
+        Persists newly computed embeddings as a new shard, sorted by key.
+
+        The embeddings are written before the keys and both are moved into place atomically,
+        so a shard only becomes visible to other processes once it is complete.
+        """
+        shard_name = f"{time.time_ns()}-{os.getpid()}"
+        keys = np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, 20)
+        order = np.argsort(keys.view("S20").reshape(-1), kind="stable")
+        keys, embeddings = keys[order], embeddings[order]
+        for suffix, array in ((".npy", embeddings), (".keys.npy", keys)):
+            final_path = os.path.join(self.path, shard_name + suffix)
+            tmp_path = final_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, final_path)
+        self.__register_shard(keys, np.load(os.path.join(self.path, f"{shard_name}.npy"), mmap_mode="r"))
+
+    def __locate(self, keys):
+        """
+        Finds the shard and row of every key.
+
+        Args:
+            keys (np.ndarray): (n,) "S20" text digests.
+
+        Returns:
+            tuple: (n,) shard numbers and (n,) rows, both -1 for keys that are not cached.
+        """
+        shard_numbers = np.full(len(keys), -1, dtype=np.int64)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for shard_number, (shard_keys, shard_rows) in enumerate(zip(self._shard_keys, self._shard_rows)):
+            # Earlier shards win if a text was cached twice, e.g. by concurrent writers
+            pending = np.flatnonzero(shard_numbers < 0)
+            if len(pending) == 0 or len(shard_keys) == 0:
+                continue
+            positions = np.searchsorted(shard_keys, keys[pending])
+            positions = np.minimum(positions, len(shard_keys) - 1)
+            found = shard_keys[positions] == keys[pending]
+            shard_numbers[pending[found]] = shard_number
+            rows[pending[found]] = positions[found] if shard_rows is None else shard_rows[positions[found]]
+        return shard_numbers, rows
+
+    @staticmethod
+    def _digest(text, variant):
+        return hashlib.sha1(f"{variant}\x00{text}".encode("utf-8")).digest()
+
+    def __len__(self):
+        # Number of cached embeddings
+        return sum(len(keys) for keys in self._shard_keys)
+
+    def encode(self, model, texts, **encode_kwargs):
+        """
+        Returns embeddings for `texts`, encoding only the texts that are not cached yet.
+
+        Missing texts are de-duplicated and encoded in a single `model.encode` call; the results
+        are written to a new shard before being returned.
+
+        Args:
+            model (SentenceTransformer): Model used to encode cache misses.
+            texts (List[str]): Texts to embed.
+            **encode_kwargs: Keyword arguments forwarded to `model.encode`.
+
+        Returns:
+            np.ndarray: (len(texts), dim) array of embeddings, in the order of `texts`.
+        """
+        variant = json.dumps(
+            {key: encode_kwargs[key] for key in _OUTPUT_AFFECTING_KWARGS if key in encode_kwargs},
+            sort_keys=True,
+            default=str,
+        )
+        digests = [self._digest(text, variant) for text in texts]
+        keys = np.frombuffer(b"".join(digests), dtype="S20")
+        shard_numbers, rows = self.__locate(keys)
+
+        missing = {}
+        for i in np.flatnonzero(shard_numbers < 0).tolist():
+            missing.setdefault(digests[i], texts[i])
+        if missing:
+            print(f"Embedding cache: encoding {len(missing)} of {len(texts)} texts ({len(self)} cached)")
+            new_embeddings = np.asarray(model.encode(list(missing.values()), **encode_kwargs))
+            self.__write_shard(list(missing.keys()), new_embeddings)
+            pending = np.flatnonzero(shard_numbers < 0)
+            shard_numbers[pending], rows[pending] = self.__locate(keys[pending])
+
+        if not digests:
+            # Keep the (0, dim) shape, so empty batches can still be stacked or multiplied
+            if self._shards:
+                return np.empty((0,) + self._shards[0].shape[1:], dtype=self._shards[0].dtype)
+            return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        first = self._shards[shard_numbers[0]]
+        embeddings = np.empty((len(digests),) + first.shape[1:], dtype=first.dtype)
+        for shard_number in np.unique(shard_numbers):
+            mask = shard_numbers == shard_number
+            embeddings[mask] = self._shards[shard_number][rows[mask]]
+        return embeddings
+
+
+class CachedEncoder:
+    """
+    Wraps an embedding model so that `encode` is served from an `EmbeddingCache`.
+
+    All other attributes are forwarded to the wrapped model, so a `CachedEncoder` can be used
+    wherever a `SentenceTransformer` is expected for encoding.
+    """
+
+    def __init__(self, model, cache):
+        self.model = model
+        self.cache = cache
+
+    def encode(self, sentences, **kwargs):
+        if isinstance(sentences, str):
+            return self.cache.encode(self.model, [sentences], **kwargs)[0]
+        return self.cache.encode(self.model, list(sentences), **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def load_embedding_model(model_id, revision=None, cache_dir=None, encoding_config=None, backend_config=None):
+    """
+    Loads a SentenceTransformer, optionally backed by the persistent embedding cache.
+
+    Args:
+        model_id (str): Hugging Face model id or local path of the embedding model.
+        revision (str, optional): Model revision to load and to key the cache with.
+        cache_dir (str, optional): Root directory of the embedding cache. If None, no cache is used.
+        encoding_config (dict, optional): `encoding` section of the config (batch_size, num_processes,
+            sort_by_length, chunk_size). If given, encoding goes through a `PooledEncoder`.
+        backend_config (dict, optional): `backend` section of the config (type, onnx_dir, quantization).
+            Defaults to the PyTorch backend.
+
+    Returns:
+        SentenceTransformer, PooledEncoder or CachedEncoder: Model exposing `encode`.
+    """
+    from sentence_transformers import SentenceTransformer
+    from encoding import PooledEncoder
+    from onnx_backend import load_onnx_model
+
+    backend_config = backend_config or {}
+    backend = backend_config.get("type", "torch")
+    # Resolved once, so the loaded weights, the ONNX export and the embedding cache share the same revision
+    resolved_revision = resolve_model_revision(model_id, revision)
+    if backend == "torch":
+        # Local models have no hub revision; theirs is a fingerprint of the weight files
+        model = SentenceTransformer(model_id, revision=None if os.path.isdir(model_id) else resolved_revision)
+    else:
+        model = load_onnx_model(
+            model_id,
+            revision=resolved_revision,
+            backend=backend,
+            onnx_dir=backend_config.get("onnx_dir", "./cache/onnx"),
+            quantization=backend_config.get("quantization", "avx2"),
+        )
+    if encoding_config is not None:
+        # Only cache misses reach the encoder when both are configured
+        model = PooledEncoder(model, **encoding_config)
+    if cache_dir is None:
+        return model
+    return CachedEncoder(model, EmbeddingCache(cache_dir, model_id, resolved_revision, backend=backend))
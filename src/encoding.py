@@ -0,0 +1,347 @@
+import atexit
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+
+# encode() keyword arguments supported by SentenceTransformer.encode_multi_process
+_MULTI_PROCESS_KWARGS = ("prompt_name", "prompt", "show_progress_bar", "precision", "normalize_embeddings")
+
+
+def unique_texts(texts):
+    """
+    De-duplicates texts while preserving the order of first occurrence.
+
+    Args:
+        texts (Sequence[str]): Texts, possibly with many repetitions.
+
+    Returns:
+        tuple:
+            - List[str]: Distinct texts.
+            - np.ndarray: (len(texts),) int64 array mapping every input text to its position in the distinct list.
+    """
+    positions = {}
+    inverse = np.fromiter(
+        (positions.setdefault(text, len(positions)) for text in texts), dtype=np.int64, count=len(texts)
+    )
+    return list(positions), inverse
+
+
+def encode_unique(model, texts, **encode_kwargs):
+    """
+    Encodes every distinct text once and expands the result back to the input order.
+
+    Training pairs repeat their targets (one ESCO label per pair) and, with subspans, their
+    career-history prefixes, so encoding only the distinct strings saves most of the encoder work.
+
+    Args:
+        model (SentenceTransformer): Model exposing `encode`.
+        texts (Sequence[str]): Texts to embed.
+        **encode_kwargs: Keyword arguments forwarded to `model.encode`.
+
+    Returns:
+        np.ndarray: (len(texts), dim) array of embeddings.
+    """
+    distinct, inverse = unique_texts(texts)
+    print(f"Encoding {len(distinct)} distinct texts for {len(texts)} inputs")
+    embeddings = np.asarray(model.encode(distinct, **encode_kwargs))
+    return embeddings[inverse]
+
+
+def length_order(texts, lengths=None):
+    """
+    Returns the permutation that sorts `texts` by length, longest first.
+
+    Args:
+        texts (Sequence[str]): Texts to sort.
+        lengths (np.ndarray, optional): Lengths of the texts, e.g. from `token_lengths`.
+            Defaults to the character lengths.
+
+    Returns:
+        np.ndarray: (len(texts),) int64 permutation; `texts[order[i]]` is the i-th longest text.
+    """
+    if lengths is None:
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    return np.argsort(-np.asarray(lengths), kind="stable")
+
+
+def token_lengths(model, texts):
+    """
+    Counts the tokens the model sees for every text, including special tokens and after truncation.
+
+    Args:
+        model (SentenceTransformer): Model whose tokenizer and `max_seq_length` are used.
+        texts (Sequence[str]): Texts to measure.
+
+    Returns:
+        np.ndarray: (len(texts),) int64 token counts.
+    """
+    input_ids = model.tokenizer(
+        list(texts), add_special_tokens=True, truncation=True, max_length=model.max_seq_length
+    )["input_ids"]
+    return np.fromiter((len(ids) for ids in input_ids), dtype=np.int64, count=len(input_ids))
+
+
+def token_budget_batches(sorted_lengths, max_tokens_per_batch, max_batch_size=None):
+    """
+    Splits length-sorted inputs into batches whose padded size stays within a token budget.
+
+    Since the inputs are sorted longest first, the first text of a batch determines its padded length,
+    so a batch of long texts holds few of them and a batch of short texts many.
+
+    Args:
+        sorted_lengths (np.ndarray): Token counts, sorted in descending order.
+        max_tokens_per_batch (int): Maximum of (batch size x longest text in the batch).
+        max_batch_size (int, optional): Upper bound on the number of texts per batch.
+
+    Returns:
+        List[Tuple[int, int]]: (start, end) positions of the batches.
+    """
+    batches = []
+    start = 0
+    while start < len(sorted_lengths):
+        size = max(1, max_tokens_per_batch // max(int(sorted_lengths[start]), 1))
+        if max_batch_size is not None:
+            size = min(size, max_batch_size)
+        batches.append((start, min(start + size, len(sorted_lengths))))
+        start += size
+    return batches
+
+
+class PooledEncoder:
+    """
+    Wraps an embedding model so that `encode` runs on length-sorted batches of a fixed size,
+    optionally spread over a pool of worker processes.
+
+    Inputs are sorted by length before being cut into token-budget batches or worker chunks, and the
+    output is restored to the input order; a plain single-process call is left to `SentenceTransformer.encode`,
+    which sorts by length itself. Lengths are measured in characters or, with `length_unit="tokens"`,
+    in tokens of the model's tokenizer; a token budget per batch then replaces the fixed batch size
+    if `max_tokens_per_batch` is set. With `num_processes > 1`, the sorted inputs are encoded in chunks
+    by sentence-transformers' multi-process pool, each worker using its share of the CPU cores.
+    All other attributes are forwarded to the wrapped model.
+    """
+
+    def __init__(
+        self,
+        model,
+        batch_size=32,
+        num_processes=1,
+        sort_by_length=True,
+        chunk_size=None,
+        length_unit="chars",
+        max_tokens_per_batch=None,
+    ):
+        """
+        Args:
+            model (SentenceTransformer): Model to encode with.
+            batch_size (int): Number of texts per forward pass.
+            num_processes (int): Number of worker processes, 1 to encode in the calling process.
+            sort_by_length (bool): Whether to sort the inputs by length before cutting token-budget batches
+                or worker chunks.
+            chunk_size (int, optional): Number of texts sent to a worker at a time. Defaults to the
+                sentence-transformers heuristic.
+            length_unit (str): "chars" or "tokens"; tokens also enable the tokens/s report.
+            max_tokens_per_batch (int, optional): Padded-token budget per batch, requires
+                `length_unit="tokens"`. `batch_size` then only caps the number of texts per batch.
+        """
+        if length_unit not in ("chars", "tokens"):
+            raise ValueError(f"Invalid length_unit: {length_unit}")
+        if max_tokens_per_batch is not None and (length_unit != "tokens" or num_processes > 1):
+            raise ValueError("max_tokens_per_batch requires length_unit 'tokens' and a single process")
+        self.model = model
+        self.batch_size = batch_size
+        self.num_processes = num_processes
+        self.sort_by_length = sort_by_length
+        self.chunk_size = chunk_size
+        self.length_unit = length_unit
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self._pool = None
+
+    def __start_pool(self):
+        if self._pool is None:
+            # Give every worker its share of the cores instead of letting each use all of them
+            previous_threads = os.environ.get("OMP_NUM_THREADS")
+            os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // self.num_processes))
+            try:
+                self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.num_processes)
+            finally:
+                if previous_threads is None:
+                    del os.environ["OMP_NUM_THREADS"]
+                else:
+                    os.environ["OMP_NUM_THREADS"] = previous_threads
+            atexit.register(self.close)
+        return self._pool
+
+    def close(self):
+        """
+        Stops the worker processes, if any were started.
+        """
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def encode(self, sentences, **encode_kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], **encode_kwargs)[0]
+        texts = list(sentences)
+        batch_size = encode_kwargs.pop("batch_size", self.batch_size)
+        if not texts:
+            return self.model.encode(texts, batch_size=batch_size, **encode_kwargs)
+
+        lengths = token_lengths(self.model, texts) if self.length_unit == "tokens" else None
+        multi_process = self.max_tokens_per_batch is None and self.num_processes > 1 and len(texts) > batch_size
+        start = time.perf_counter()
+        if self.max_tokens_per_batch is None and not multi_process:
+            # SentenceTransformer.encode sorts by length and restores the input order itself
+            embeddings = np.asarray(self.model.encode(texts, batch_size=batch_size, **encode_kwargs))
+            self.__report(texts, lengths, batch_size, start, num_processes=1)
+            return embeddings
+
+        # Token-budget batches and worker chunks are cut from the length-sorted inputs
+        order = length_order(texts, lengths) if self.sort_by_length else np.arange(len(texts))
+        sorted_texts = [texts[i] for i in order]
+        if self.max_tokens_per_batch is not None:
+            batches = token_budget_batches(lengths[order], self.max_tokens_per_batch, max_batch_size=batch_size)
+            embeddings = np.concatenate([
+                np.asarray(self.model.encode(sorted_texts[batch_start:batch_end], batch_size=batch_end - batch_start, **encode_kwargs))
+                for batch_start, batch_end in batches
+            ])
+            num_processes = 1
+        else:
+            unsupported = set(encode_kwargs) - set(_MULTI_PROCESS_KWARGS)
+            if unsupported:
+                raise ValueError(f"encode arguments not supported with multiple processes: {sorted(unsupported)}")
+            embeddings = self.model.encode_multi_process(
+                sorted_texts, self.__start_pool(), batch_size=batch_size, chunk_size=self.chunk_size, **encode_kwargs
+            )
+            num_processes = self.num_processes
+        self.__report(texts, lengths, batch_size, start, num_processes)
+
+        embeddings = np.asarray(embeddings)
+        restored = np.empty_like(embeddings)
+        restored[order] = embeddings
+        return restored
+
+    @staticmethod
+    def __report(texts, lengths, batch_size, start, num_processes):
+        # Throughput of calls spanning more than one batch, with the number of processes actually used
+        elapsed = time.perf_counter() - start
+        if len(texts) > batch_size:
+            rate = f"{len(texts) / elapsed:.1f} texts/s"
+            if lengths is not None:
+                rate += f", {int(lengths.sum()) / elapsed:.0f} tokens/s"
+            print(f"Encoded {len(texts)} texts in {elapsed:.2f}s ({rate}, {num_processes} process(es))")
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+class CompositionalEncoder:
+    """
+    Encodes career histories by pooling embeddings of their individual experiences.
+
+    A career history is split on the separator token into its experiences. Every distinct
+    experience is encoded once by the wrapped model, and the vectors of the `cache_size` most
+    recently used experiences are kept in memory across calls. The history vector is then composed
+    from its experience vectors. With all subspans of a career as inputs, the encoder sees each
+    experience once instead of once per subspan, so encoder work per career is O(L) instead of O(L²).
+
+    Pooling:
+        - "mean": average of the experience vectors.
+        - "max": element-wise maximum of the experience vectors.
+        - "decay": weighted average with weight `decay ** (L - 1 - i)` for experience i,
+          so the most recent (last) experience weighs most.
+
+    All other attributes are forwarded to the wrapped model.
+    """
+
+    def __init__(self, model, separator, pooling="mean", decay=0.5, cache_size=100_000):
+        """
+        Args:
+            model (SentenceTransformer): Model encoding the individual experiences.
+            separator (str): Token separating the experiences of a career history (`utils.SEP_TOKEN`).
+            pooling (str): "mean", "max" or "decay".
+            decay (float): Per-step weight decay towards older experiences, used by "decay".
+            cache_size (int): Maximum number of experience vectors kept in memory; the least recently
+                used are evicted first, so long-running processes stay bounded.
+        """
+        if pooling not in ("mean", "max", "decay"):
+            raise ValueError(f"Invalid pooling: {pooling}")
+        self.model = model
+        self.separator = separator
+        self.pooling = pooling
+        self.decay = decay
+        self.cache_size = cache_size
+        self._experience_cache = OrderedDict()  # experience -> embedding, least recently used first
+
+    def __experience_embeddings(self, experiences, **encode_kwargs):
+        """
+        Returns the embeddings of `experiences`, encoding only those not cached.
+        """
+        unique = list(dict.fromkeys(experiences))
+        missing = [experience for experience in unique if experience not in self._experience_cache]
+        if missing:
+            print(f"Encoding {len(missing)} new experiences ({len(self._experience_cache)} cached)")
+            new_embeddings = np.asarray(self.model.encode(missing, **encode_kwargs), dtype=np.float32)
+            self._experience_cache.update(zip(missing, new_embeddings))
+        for experience in unique:
+            self._experience_cache.move_to_end(experience)
+        unique_embeddings = np.stack([self._experience_cache[experience] for experience in unique])
+        # Evicted only after this call's vectors are collected, so a call may use more than cache_size
+        while len(self._experience_cache) > self.cache_size:
+            self._experience_cache.popitem(last=False)
+        unique_ids = {experience: i for i, experience in enumerate(unique)}
+        ids = np.fromiter((unique_ids[e] for e in experiences), dtype=np.int64, count=len(experiences))
+        return unique_embeddings[ids]
+
+    def encode(self, sentences, **encode_kwargs):
+        if isinstance(sentences, str):
+            return self.encode([sentences], **encode_kwargs)[0]
+        segments = [text.split(self.separator) for text in sentences]
+        if not segments:
+            return np.asarray(self.model.encode([], **encode_kwargs))
+        lengths = np.fromiter((len(experiences) for experiences in segments), dtype=np.int64, count=len(segments))
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        embeddings = self.__experience_embeddings(
+            [experience for experiences in segments for experience in experiences], **encode_kwargs
+        )
+
+        if self.pooling == "max":
+            return np.maximum.reduceat(embeddings, starts, axis=0)
+        if self.pooling == "mean":
+            weights = np.ones(len(embeddings), dtype=np.float32)
+        else:
+            # Position of every experience counted from the end of its career history
+            positions_from_end = np.repeat(starts + lengths - 1, lengths) - np.arange(len(embeddings))
+            weights = (self.decay ** positions_from_end).astype(np.float32)
+        pooled = np.add.reduceat(embeddings * weights[:, None], starts, axis=0)
+        return pooled / np.add.reduceat(weights, starts)[:, None]
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def load_query_encoder(model, separator, composition_config=None):
+    """
+    Returns the encoder for career histories.
+
+    Args:
+        model (SentenceTransformer): Embedding model, also used for the labels.
+        separator (str): Token separating the experiences of a career history (`utils.SEP_TOKEN`).
+        composition_config (dict, optional): `composition` section of the config (pooling, decay, cache_size).
+
+    Returns:
+        SentenceTransformer or CompositionalEncoder: `model` itself, or a `CompositionalEncoder`
+        around it if a pooling is configured.
+    """
+    composition_config = composition_config or {}
+    if composition_config.get("pooling") is None:
+        return model
+    return CompositionalEncoder(
+        model,
+        separator,
+        pooling=composition_config["pooling"],
+        decay=composition_config.get("decay", 0.5),
+        cache_size=composition_config.get("cache_size", 100_000),
+    )
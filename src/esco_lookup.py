@@ -0,0 +1,157 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+ESCO_LOOKUP_FORMAT_VERSION = 1
+ESCO_OCCUPATIONS_CSV = Path("./data/occupations_en.csv")
+
+
+class EscoLookup:
+    """
+    Read-only mapping from ESCO occupation URI, preferred label or alt label to its description.
+
+    The lookup is a build-once artifact directory:
+        - `descriptions.bin`: all occupation descriptions, UTF-8 encoded and stored contiguously.
+        - `description_offsets.npy`: (n + 1,) int64 byte offsets of the descriptions in `descriptions.bin`.
+        - `keys.json`: maps every URI / label to the id of its description.
+        - `meta.json`: format version and fingerprint of the source CSV.
+
+    Descriptions are memory-mapped and decoded on access, so opening the lookup only costs parsing the key map.
+
+    Attributes:
+        source_fingerprint (dict): Format version and content hash of the CSV the lookup was built from.
+    """
+
+    def __init__(self, path):
+        """
+        Opens a lookup artifact built by `EscoLookup.build`.
+
+        Args:
+            path (str or Path): Directory of the lookup artifact.
+        """
+        path = Path(path)
+        with open(path / "meta.json") as f:
+            self.source_fingerprint = json.load(f)
+        with open(path / "keys.json") as f:
+            self._description_ids = json.load(f)
+        self._offsets = np.load(path / "description_offsets.npy", mmap_mode="r")
+        if self._offsets[-1] > 0:
+            self._descriptions = np.memmap(path / "descriptions.bin", dtype=np.uint8, mode="r")
+        else:
+            self._descriptions = np.empty(0, dtype=np.uint8)
+
+    def __getitem__(self, key):
+        description_id = self._description_ids[key]
+        start, end = self._offsets[description_id], self._offsets[description_id + 1]
+        return self._descriptions[start:end].tobytes().decode("utf-8")
+
+    def __contains__(self, key):
+        return key in self._description_ids
+
+    def __len__(self):
+        return len(self._description_ids)
+
+    def get(self, key, default=None):
+        return self[key] if key in self._description_ids else default
+
+    @staticmethod
+    def build(csv_path, path):
+        """
+        Builds the lookup artifact from the ESCO occupations CSV.
+
+        Keys are resolved with the same precedence as the former in-memory dictionary:
+        concept URIs first, then preferred labels, then alt labels in file order (later entries win).
+
+        The artifact is written to a temporary directory next to `path` and renamed into place once
+        complete, so a rebuild never mixes files of the old and the new CSV under one `meta.json`.
+
+        Args:
+            csv_path (str or Path): Path of the ESCO occupations CSV (e.g. `data/occupations_en.csv`).
+            path (str or Path): Directory the artifact is written to.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The fingerprint is computed from the same bytes the lookup is built from
+        with open(csv_path, "rb") as f:
+            content = f.read()
+        ESCO_occupations = pd.read_csv(io.BytesIO(content))
+
+        description_ids = {}
+        for row_id, uri in enumerate(ESCO_occupations["conceptUri"].tolist()):
+            description_ids[uri] = row_id
+        for row_id, label in enumerate(ESCO_occupations["preferredLabel"].tolist()):
+            description_ids[label] = row_id
+        for row_id, alt_labels in enumerate(ESCO_occupations["altLabels"].tolist()):
+            # If there are no altLabels, skip
+            if pd.isna(alt_labels):
+                continue
+            for alt_label in alt_labels.split("\n"):
+                description_ids[alt_label] = row_id
+
+        encoded = [str(description).encode("utf-8") for description in ESCO_occupations["description"].tolist()]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(description) for description in encoded], out=offsets[1:])
+
+        tmp_path = Path(tempfile.mkdtemp(prefix=f"{path.name}.tmp-", dir=path.parent))
+        with open(tmp_path / "descriptions.bin", "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(tmp_path / "description_offsets.npy", offsets)
+        with open(tmp_path / "keys.json", "w") as f:
+            json.dump(description_ids, f)
+        # meta.json is written last and marks the artifact as complete
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(_content_fingerprint(content), f)
+
+        # A directory cannot replace a non-empty one, so the old artifact is moved aside as a whole first
+        stale_path = None
+        if path.exists():
+            stale_path = Path(tempfile.mkdtemp(prefix=f"{path.name}.stale-", dir=path.parent))
+            os.replace(path, stale_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            # A concurrent build moved its complete artifact into place first
+            if not (path / "meta.json").exists():
+                raise
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        if stale_path is not None:
+            shutil.rmtree(stale_path, ignore_errors=True)
+
+
+def _content_fingerprint(content):
+    return {"version": ESCO_LOOKUP_FORMAT_VERSION, "sha1": hashlib.sha1(content).hexdigest()}
+
+
+def _source_fingerprint(csv_path):
+    with open(csv_path, "rb") as f:
+        return _content_fingerprint(f.read())
+
+
+def load_esco_lookup(csv_path=ESCO_OCCUPATIONS_CSV, path=None):
+    """
+    Opens the ESCO lookup artifact, (re)building it if it is missing or the CSV has changed.
+
+    Args:
+        csv_path (str or Path, optional): Path of the ESCO occupations CSV. Defaults to `data/occupations_en.csv`.
+        path (str or Path, optional): Directory of the artifact. Defaults to `<csv name>_lookup` next to the CSV.
+
+    Returns:
+        EscoLookup: The opened lookup.
+    """
+    csv_path = Path(csv_path)
+    path = Path(path) if path is not None else csv_path.with_name(f"{csv_path.stem}_lookup")
+    try:
+        with open(path / "meta.json") as f:
+            up_to_date = json.load(f) == _source_fingerprint(csv_path)
+    except FileNotFoundError:
+        up_to_date = False
+    if not up_to_date:
+        print(f"Building ESCO lookup {path} from {csv_path}...")
+        EscoLookup.build(csv_path, path)
+    return EscoLookup(path)
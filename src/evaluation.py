@@ -37,3 +37,29 @@ def r_at_k(predictions, k):
         if true_id in preds[:k]:
             relevant_found += 1
     return relevant_found / len(predictions)
+
+
+def ranking_metrics(predicted_ids, true_ids, ks=(5, 10)):
+    """
+    Calculate MRR and R@k for several k at once on integer label ids.
+
+    Vectorized equivalent of `mrr` and `r_at_k` that returns exactly the same values.
+    
+    Args:
+    predicted_ids (np.ndarray): (n, top_k) int array of predicted ids in order of confidence.
+    true_ids (np.ndarray): (n,) int array of true ids.
+    ks (Iterable[int]): The cut-off ranks for which R@k is computed.
+    
+    Returns:
+    dict: Maps "MRR" and "R@k" for every k in `ks` to its score
+    """
+    predicted_ids = np.asarray(predicted_ids)
+    true_ids = np.asarray(true_ids)
+    hits = predicted_ids == true_ids[:, None]
+    first_hit = hits.argmax(axis=1)
+    reciprocal_ranks = np.where(hits.any(axis=1), 1 / (first_hit + 1), 0.0)
+    # Summed sequentially like `mrr`, so that the floating point result is identical
+    scores = {"MRR": sum(reciprocal_ranks.tolist()) / len(true_ids)}
+    for k in ks:
+        scores[f"R@{k}"] = int(hits[:, :k].any(axis=1).sum()) / len(true_ids)
+    return scores
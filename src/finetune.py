@@ -169,6 +169,7 @@ def main(config):
         config["data"]["doc_1_prompt"],
         config["data"]["doc_2_prompt"],
         config["data"]["only_titles"],
+        cache_dir=config.get("cache", {}).get("data_dir"),
     )
 
     train_pairs, val_pairs, _ = data.get_data(stage="embedding_finetuning")
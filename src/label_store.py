@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import numpy as np
+import faiss
+
+LABEL_STORE_FORMAT_VERSION = 1
+# Index config keys that only affect evaluation, not the built index
+_NON_INDEX_KEYS = ("check_recall",)
+
+
+def label_store_path(store_dir, model_id, model_revision, label_texts, dtype="float32", backend="torch"):
+    """
+    Computes the directory holding the persisted label space of a model and label vocabulary.
+
+    Args:
+        store_dir (str): Root directory of the label store.
+        model_id (str): Hugging Face model id or local path of the embedding model.
+        model_revision (str): Resolved model revision, see `embedding_cache.resolve_model_revision`.
+        label_texts (List[str]): Label vocabulary; the position of a label is its id.
+        dtype (str): Storage dtype of the label embeddings.
+        backend (str): Inference backend of the embedding model, see `onnx_backend.BACKENDS`.
+
+    Returns:
+        str: Directory of the label space.
+    """
+    labels_hash = hashlib.sha1(json.dumps(list(label_texts)).encode()).hexdigest()
+    key = [LABEL_STORE_FORMAT_VERSION, model_id, model_revision, labels_hash, str(dtype)]
+    if backend != "torch":
+        key.append(backend)
+    key = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+    return os.path.join(store_dir, key)
+
+
+def index_file_name(index_config=None):
+    """
+    Returns the file name of the persisted Faiss index built with `index_config`.
+
+    Several index types can be stored next to the same label embeddings.
+    """
+    index_config = {k: v for k, v in (index_config or {}).items() if k not in _NON_INDEX_KEYS}
+    index_config.setdefault("type", "flat")
+    config_hash = hashlib.sha1(json.dumps(index_config, sort_keys=True).encode()).hexdigest()[:16]
+    return f"index-{index_config['type']}-{config_hash}.faiss"
+
+
+def has_label_embeddings(path):
+    """
+    Returns whether `path` holds completely written label embeddings.
+    """
+    return os.path.exists(os.path.join(path, "meta.json"))
+
+
+def save_label_embeddings(path, label_texts, embeddings, meta=None):
+    """
+    Persists normalized label embeddings and their label vocabulary.
+
+    `meta.json` is written last and marks the label space as complete.
+
+    Args:
+        path (str): Directory of the label space (see `label_store_path`).
+        label_texts (List[str]): Label vocabulary, row i of `embeddings` belongs to label i.
+        embeddings (np.ndarray): (n, dim) float32 or float16 label embeddings.
+        meta (dict, optional): Additional JSON-serializable information stored in `meta.json`.
+    """
+    os.makedirs(path, exist_ok=True)
+    _atomic_write(os.path.join(path, "labels.json"), lambda f: f.write(json.dumps(list(label_texts)).encode()))
+    _atomic_write(os.path.join(path, "embeddings.npy"), lambda f: np.save(f, embeddings))
+    meta = dict(
+        meta or {},
+        format_version=LABEL_STORE_FORMAT_VERSION,
+        num_labels=len(label_texts),
+        dim=embeddings.shape[1],
+        dtype=str(embeddings.dtype),
+    )
+    _atomic_write(os.path.join(path, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+
+
+def load_meta(path):
+    """
+    Loads `meta.json` of a persisted label space.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def load_label_texts(path):
+    """
+    Loads the label vocabulary of a persisted label space.
+    """
+    with open(os.path.join(path, "labels.json")) as f:
+        return json.load(f)
+
+
+def load_label_embeddings(path):
+    """
+    Memory-maps the label embeddings of a persisted label space.
+
+    Returns:
+        np.ndarray: (n, dim) read-only label embeddings, in their storage dtype.
+    """
+    return np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+
+
+def save_index(path, index, index_config=None):
+    """
+    Persists a Faiss index built with `index_config` next to the label embeddings.
+    """
+    final_path = os.path.join(path, index_file_name(index_config))
+    tmp_path = f"{final_path}.tmp-{os.getpid()}"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, final_path)
+
+
+def load_index(path, index_config=None, mmap=True):
+    """
+    Loads the Faiss index built with `index_config`, memory-mapped where Faiss supports it.
+
+    Args:
+        path (str): Directory of the label space.
+        index_config (dict, optional): Index config the index was built with.
+        mmap (bool): Memory-map the index. Indexes that are added to have to be read into memory.
+
+    Returns:
+        faiss.Index or None: The index, or None if it has not been persisted yet.
+    """
+    index_path = os.path.join(path, index_file_name(index_config))
+    if not os.path.exists(index_path):
+        return None
+    return faiss.read_index(index_path, faiss.IO_FLAG_MMAP) if mmap else faiss.read_index(index_path)
+
+
+def _atomic_write(final_path, write):
+    tmp_path = f"{final_path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, final_path)
@@ -1,9 +1,13 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from config_utils import load_train_config
 import argparse
 from data_classes import Data
 import json
+from itertools import islice
+from embedding_cache import load_embedding_model
+from encoding import encode_unique, load_query_encoder
+from utils import SEP_TOKEN
+from predictor import low_rank_path
 
 
 def max_frobenius_norm(n, a_min, a_max):
@@ -34,7 +38,9 @@ def max_frobenius_norm(n, a_min, a_max):
     return max_norm
 
 
-def train_linear_transformation(model, train_pairs, select_only_different=False):
+def train_linear_transformation(
+    model, train_pairs, select_only_different=False, query_model=None, errors_path=None, return_statistics=False
+):
     """
     Trains a linear transformation matrix T to map career history embeddings to ESCO occupation embeddings.
 
@@ -46,10 +52,17 @@ def train_linear_transformation(model, train_pairs, select_only_different=False)
         model (SentenceTransformer): Pre-trained sentence embedding model.
         train_pairs (list of tuples): List of (career_history_text, esco_occupation_text) pairs.
         select_only_different (bool): If True, removes pairs where the texts are identical.
+        query_model (optional): Encoder for the career histories (e.g. a `CompositionalEncoder`).
+            Defaults to `model`.
+        errors_path (str, optional): JSON file the training MSE and RMSE are written to, see `report_errors`.
+        return_statistics (bool): If True, also returns the sufficient statistics of the fit, e.g. to
+            evaluate low-rank factorizations of T with `transformation_mse`.
 
     Returns:
-        np.ndarray: Learned transformation matrix T.
+        np.ndarray: Learned transformation matrix T, or a tuple of T and the statistics (dict) if
+            `return_statistics` is True.
     """
+    query_model = query_model or model
     # Extract text pairs
     career_history_texts, esco_occupation_texts = zip(*train_pairs)
     
@@ -68,9 +81,9 @@ def train_linear_transformation(model, train_pairs, select_only_different=False)
         )
         print("Remaining pairs:", len(career_history_texts))
 
-    # Encode texts into embeddings
-    A = model.encode(career_history_texts)
-    B = model.encode(esco_occupation_texts)
+    # Encode texts into embeddings, each distinct text only once
+    A = encode_unique(query_model, career_history_texts)
+    B = encode_unique(model, esco_occupation_texts)
 
     # Solve for transformation matrix T using least squares
     T, residuals, rank, s = np.linalg.lstsq(A, B, rcond=None)
@@ -78,8 +91,80 @@ def train_linear_transformation(model, train_pairs, select_only_different=False)
     # Compute predicted B values
     B_pred = A @ T
 
-    # Compute Mean Squared Error (MSE) and Root Mean Squared Error (RMSE)
+    # Compute Mean Squared Error (MSE)
     mse = np.mean(np.sum((B - B_pred) ** 2, axis=1))
+
+    if errors_path is not None:
+        report_errors(T, mse, errors_path)
+
+    if return_statistics:
+        statistics = {
+            "AtA": A.T @ A,
+            "AtB": A.T @ B,
+            "sum_squared_B": float(np.sum(B * B)),
+            "num_pairs": len(A),
+        }
+        return T, statistics
+    return T
+
+
+def transformation_mse(T, statistics):
+    """
+    Computes the training MSE of a transformation matrix from the sufficient statistics of the fit.
+
+    Uses ||B - AT||² = sum(||b||²) - 2 <T, AᵀB> + <T, AᵀA T>, so any T (e.g. a low-rank
+    approximation) can be scored without the (N, d) embedding matrices.
+
+    Args:
+        T (np.ndarray): (d, d) transformation matrix.
+        statistics (dict): `AtA`, `AtB`, `sum_squared_B` and `num_pairs` of the training pairs.
+
+    Returns:
+        float: Mean squared error over the training pairs.
+    """
+    AtA, AtB = statistics["AtA"], statistics["AtB"]
+    return (statistics["sum_squared_B"] - 2 * np.sum(T * AtB) + np.sum(T * (AtA @ T))) / statistics["num_pairs"]
+
+
+def low_rank_factors(T, rank, method="svd", AtA=None):
+    """
+    Factorizes a transformation matrix into thin factors T_r = left @ right of rank `rank`.
+
+    "svd" truncates the SVD of T, which is the best rank-r approximation of T itself.
+    "rrr" (reduced-rank regression) projects T onto the top-r principal directions of the
+    fitted values AT, which is the least squares optimal rank-r map from A to B.
+
+    Args:
+        T (np.ndarray): (d, d) full-rank least squares solution.
+        rank (int): Rank r of the factorization.
+        method (str): "svd" or "rrr".
+        AtA (np.ndarray, optional): (d, d) Gram matrix of the career history embeddings, required for "rrr".
+
+    Returns:
+        tuple:
+            - np.ndarray: (d, r) left factor.
+            - np.ndarray: (r, d) right factor.
+    """
+    if method == "svd":
+        U, S, Vt = np.linalg.svd(T, full_matrices=False)
+        return U[:, :rank] * S[:rank], Vt[:rank]
+    elif method == "rrr":
+        # Covariance of the fitted values (AT)ᵀ(AT), eigenvalues in ascending order
+        _, eigenvectors = np.linalg.eigh(T.T @ AtA @ T)
+        V = eigenvectors[:, ::-1][:, :rank]
+        return T @ V, V.T
+    raise ValueError(f"Invalid low-rank method: {method}")
+
+
+def report_errors(T, mse, errors_path):
+    """
+    Prints fit diagnostics of a transformation matrix and saves its errors to a JSON file.
+
+    Args:
+        T (np.ndarray): Learned transformation matrix.
+        mse (float): Mean squared error of the fit on the training pairs.
+        errors_path (str): Path of the JSON file the MSE and RMSE are written to.
+    """
     rmse = np.sqrt(mse)
 
     # Compute Frobenius norm deviation from identity matrix
@@ -95,9 +180,109 @@ def train_linear_transformation(model, train_pairs, select_only_different=False)
 
     # Save errors to a JSON file
     errors = {"MSE": float(round(mse, 3)), "RMSE": float(round(rmse, 3))}
-    with open(config["output"]["path_linear_transformation_errors"], "w") as f:
+    with open(errors_path, "w") as f:
         json.dump(errors, f)
 
+
+def solve_normal_equations(AtA, AtB, ridge=0.0):
+    """
+    Solves (AᵀA + ridge * I) T = AᵀB for the transformation matrix T.
+
+    Falls back to a least squares solve if the system is singular (e.g. ridge=0 with
+    linearly dependent embedding dimensions).
+
+    Args:
+        AtA (np.ndarray): (d, d) Gram matrix of the career history embeddings.
+        AtB (np.ndarray): (d, d) cross product of career history and ESCO occupation embeddings.
+        ridge (float): L2 regularization strength.
+
+    Returns:
+        np.ndarray: (d, d) transformation matrix T.
+    """
+    system = AtA + ridge * np.eye(AtA.shape[0])
+    try:
+        return np.linalg.solve(system, AtB)
+    except np.linalg.LinAlgError:
+        print("Normal equations are singular, falling back to least squares...")
+        return np.linalg.lstsq(system, AtB, rcond=None)[0]
+
+
+def train_linear_transformation_streaming(
+    model,
+    train_pairs,
+    chunk_size=50000,
+    ridge=0.0,
+    select_only_different=False,
+    query_model=None,
+    errors_path=None,
+    return_statistics=False,
+):
+    """
+    Trains the linear transformation matrix T from streamed chunks of training pairs.
+
+    Instead of materializing the full (N, d) matrices A and B, the sufficient statistics AᵀA,
+    AᵀB and sum(||b||²) are accumulated chunk by chunk, and T is obtained by solving the
+    (d, d) normal equations once. Memory is O(d² + chunk_size * d) regardless of N.
+
+    Args:
+        model (SentenceTransformer): Pre-trained sentence embedding model.
+        train_pairs (Iterable[tuple]): (career_history_text, esco_occupation_text) pairs.
+        chunk_size (int): Number of pairs encoded and accumulated at a time.
+        ridge (float): L2 regularization strength, 0 for ordinary least squares.
+        select_only_different (bool): If True, removes pairs where the texts are identical.
+        query_model (optional): Encoder for the career histories (e.g. a `CompositionalEncoder`).
+            Defaults to `model`.
+        errors_path (str, optional): JSON file the training MSE and RMSE are written to, see `report_errors`.
+        return_statistics (bool): If True, also returns the sufficient statistics of the fit, e.g. to
+            evaluate low-rank factorizations of T with `transformation_mse`.
+
+    Returns:
+        np.ndarray: Learned transformation matrix T, or a tuple of T and the statistics (dict) if
+            `return_statistics` is True.
+    """
+    query_model = query_model or model
+    AtA, AtB = None, None
+    sum_squared_B = 0.0
+    num_pairs = 0
+
+    pairs_iterator = iter(train_pairs)
+    while True:
+        chunk = list(islice(pairs_iterator, chunk_size))
+        if not chunk:
+            break
+        if num_pairs == 0:
+            print("Example pair:")
+            print("Career History:", chunk[0][0])
+            print("ESCO Occupation:", chunk[0][1])
+        if select_only_different:
+            chunk = [pair for pair in chunk if pair[0] != pair[1]]
+            if not chunk:
+                continue
+        career_history_texts, esco_occupation_texts = zip(*chunk)
+
+        A = encode_unique(query_model, career_history_texts).astype(np.float64)
+        B = encode_unique(model, esco_occupation_texts).astype(np.float64)
+        if AtA is None:
+            AtA = np.zeros((A.shape[1], A.shape[1]))
+            AtB = np.zeros((A.shape[1], B.shape[1]))
+        AtA += A.T @ A
+        AtB += A.T @ B
+        sum_squared_B += float(np.sum(B * B))
+        num_pairs += len(chunk)
+        print(f"Accumulated {num_pairs} pairs")
+
+    if num_pairs == 0:
+        raise ValueError("No training pairs to fit the transformation matrix on")
+    T = solve_normal_equations(AtA, AtB, ridge=ridge)
+
+    statistics = {"AtA": AtA, "AtB": AtB, "sum_squared_B": sum_squared_B, "num_pairs": num_pairs}
+    mse = transformation_mse(T, statistics)
+
+    if errors_path is not None:
+        report_errors(T, mse, errors_path)
+
+    if return_statistics:
+        return T, statistics
     return T
 
 
@@ -108,26 +293,68 @@ def main(config):
     This function:
     1. Loads the training data for transformation fine-tuning.
     2. Loads a pre-trained sentence embedding model.
-    3. Computes and saves the transformation matrix.
+    3. Computes and saves the transformation matrix, and optionally its low-rank factorizations.
 
     Args:
         config (dict): Configuration dictionary containing paths and parameters.
     """
+    lt_config = config.get("linear_transformation", {})
+    solver = lt_config.get("solver", "lstsq")
+
     print("Loading data...")
     data = Data(
-        config["data"]["data_type"]
+        config["data"]["data_type"],
+        streaming=(solver == "normal_equations"),
+        cache_dir=config.get("cache", {}).get("data_dir"),
     )
 
     train_pairs, _, _ = data.get_data(stage="transformation_finetuning")
 
     print("Loading model...")
-    model = SentenceTransformer(config["model"]["embedding_model_transformation"])
+    model = load_embedding_model(
+        config["model"]["embedding_model_transformation"],
+        revision=config["model"].get("embedding_model_revision"),
+        cache_dir=config.get("cache", {}).get("embedding_dir"),
+        encoding_config=config.get("encoding"),
+    )
 
-    print("Training transformation matrix...")
-    T = train_linear_transformation(model=model, train_pairs=train_pairs)
+    query_model = load_query_encoder(model, SEP_TOKEN, config.get("composition"))
 
-    print(f"Saving transformation matrix to: {config['output']['path_transformation_matrix']}")
-    np.save(config["output"]["path_transformation_matrix"], T)
+    print("Training transformation matrix...")
+    if solver == "lstsq":
+        T, statistics = train_linear_transformation(
+            model=model,
+            train_pairs=train_pairs,
+            query_model=query_model,
+            errors_path=config["output"]["path_linear_transformation_errors"],
+            return_statistics=True,
+        )
+    elif solver == "normal_equations":
+        T, statistics = train_linear_transformation_streaming(
+            model=model,
+            train_pairs=train_pairs,
+            chunk_size=lt_config.get("chunk_size", 50000),
+            ridge=lt_config.get("ridge", 0.0),
+            query_model=query_model,
+            errors_path=config["output"]["path_linear_transformation_errors"],
+            return_statistics=True,
+        )
+    else:
+        raise ValueError(f"Invalid linear transformation solver: {solver}")
+
+    # Storage dtype of T and its factors; LinearTransformationModel applies them in float32
+    dtype = np.dtype(lt_config.get("dtype", "float32"))
+    print(f"Saving {dtype} transformation matrix to: {config['output']['path_transformation_matrix']}")
+    np.save(config["output"]["path_transformation_matrix"], T.astype(dtype))
+
+    # Optional rank-r factorizations, evaluated by the rank sweep in test.py
+    rank_method = lt_config.get("rank_method", "svd")
+    for rank in lt_config.get("ranks", []):
+        left, right = low_rank_factors(T, rank, method=rank_method, AtA=statistics["AtA"])
+        path = low_rank_path(config["output"]["path_transformation_matrix"], rank)
+        print(f"Rank {rank} ({rank_method}) MSE: {transformation_mse(left @ right, statistics):.3f}")
+        print(f"Saving rank {rank} factors to: {path}")
+        np.savez(path, left=left.astype(dtype), right=right.astype(dtype))
 
 
 if __name__ == "__main__":
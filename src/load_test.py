@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+import aiohttp
+from config_utils import load_serve_config
+from data_classes import Data
+
+
+async def run_load_test(url, texts, num_requests, concurrency, top_k=10):
+    """
+    Sends `num_requests` prediction requests with `concurrency` clients and measures them.
+
+    Args:
+        url (str): Base URL of the server, e.g. `http://localhost:8000`.
+        texts (List[str]): Career histories the requests cycle through.
+        num_requests (int): Total number of requests.
+        concurrency (int): Number of requests in flight at a time.
+        top_k (int): Number of predicted occupations per request.
+
+    Returns:
+        dict: Throughput of successful requests, client-side p50/p99 latency, error count and the server's /metrics.
+    """
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    async def client(session):
+        nonlocal errors, next_request
+        while next_request < num_requests:
+            text = texts[next_request % len(texts)]
+            next_request += 1
+            start = time.perf_counter()
+            try:
+                async with session.post(f"{url}/predict", json={"career_history": text, "top_k": top_k}) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                # A refused or dropped connection fails this request only, not the whole run
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+                continue
+            latencies.append(1000 * (time.perf_counter() - start))
+
+    async with aiohttp.ClientSession() as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[client(session) for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        try:
+            async with session.get(f"{url}/metrics") as response:
+                server_metrics = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            server_metrics = None
+
+    num_completed = len(latencies)
+    latencies = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        "requests_per_second": round(num_completed / elapsed, 1),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "errors": errors,
+        "server": server_metrics,
+    }
+
+
+def start_server(serve_config, port, max_batch_size=None, query_cache=True):
+    """
+    Starts `serve.py` with a serving configuration in a subprocess.
+
+    Args:
+        serve_config (str): Serving configuration (see `config/serve/`).
+        port (int): Port the server listens on.
+        max_batch_size (int, optional): Overrides `server.max_batch_size`; 1 disables micro-batching.
+        query_cache (bool): If False, disables the configured `server.query_cache`.
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py"),
+        "--serve_config", serve_config, "--port", str(port),
+    ]
+    if max_batch_size is not None:
+        command += ["--max_batch_size", str(max_batch_size)]
+    if not query_cache:
+        command.append("--no_query_cache")
+    return subprocess.Popen(command)
+
+
+async def wait_until_healthy(url, process, timeout=600):
+    """
+    Waits until the server at `url` answers /health, e.g. after loading its model.
+
+    Raises:
+        RuntimeError: If the server process exits or does not become healthy within `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while process.poll() is None and time.monotonic() < deadline:
+            try:
+                async with session.get(f"{url}/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(1)
+    raise RuntimeError(f"Server at {url} did not become healthy (exit code {process.poll()})")
+
+
+def compare_batching(serve_config, texts, num_requests, concurrency, port=8000, top_k=10):
+    """
+    Runs the same load against a server with one request per encode call and one with micro-batching.
+
+    The servers are started one after the other on `port`, so they do not compete for the CPU. Both run
+    without the query cache, which would otherwise answer repeated load test texts without encoding them.
+
+    Args:
+        serve_config (str): Serving configuration (see `config/serve/`).
+        texts, num_requests, concurrency, top_k: See `run_load_test`.
+        port (int): Port the servers listen on.
+
+    Returns:
+        dict: `run_load_test` results per configuration and the throughput gain of micro-batching.
+    """
+    url = f"http://localhost:{port}"
+    results = {}
+    for name, max_batch_size in (("one_request_per_call", 1), ("micro_batching", None)):
+        print(f"Starting the server ({name})...")
+        process = start_server(serve_config, port, max_batch_size, query_cache=False)
+        try:
+            asyncio.run(wait_until_healthy(url, process))
+            results[name] = asyncio.run(run_load_test(url, texts, num_requests, concurrency, top_k))
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{name}: {json.dumps({k: v for k, v in results[name].items() if k != 'server'})}")
+    baseline = results["one_request_per_call"]["requests_per_second"]
+    results["throughput_gain"] = round(results["micro_batching"]["requests_per_second"] / baseline, 2) if baseline else None
+    print(f"Micro-batching throughput gain: {results['throughput_gain']}x")
+    return results
+
+
+if __name__ == "__main__":
+    """
+    Entry point of the load test.
+
+    Either loads a running server (`--url`), or, with `--compare`, starts `serve.py` once with
+    `--max_batch_size 1` and once with the configured micro-batching, both without the query cache,
+    and reports both.
+    """
+    parser = argparse.ArgumentParser(description="Load test the inference server with test split career histories.")
+    parser.add_argument("--serve_config", type=str, required=True, help="Serving configuration of the server under test.")
+    parser.add_argument("--url", type=str, default="http://localhost:8000", help="Base URL of the server.")
+    parser.add_argument("--num_requests", type=int, default=2000, help="Total number of requests.")
+    parser.add_argument("--concurrency", type=int, default=64, help="Number of requests in flight at a time.")
+    parser.add_argument(
+        "--compare", action="store_true",
+        help="Start the server with one request per encode call and with micro-batching, and load both in turn.",
+    )
+    parser.add_argument("--port", type=int, default=8000, help="Port of the servers started by --compare.")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results.")
+    args = parser.parse_args()
+
+    config = load_serve_config(args.serve_config)
+    predictor_config = config["predictor"]
+    # Only the test split is read, lazily
+    data = Data(predictor_config["data"]["data_type"], streaming=True, cache_dir=predictor_config.get("cache", {}).get("data_dir"))
+    _, _, test_pairs = data.get_data(stage='evaluation')
+    texts = [exp_doc for exp_doc, _ in test_pairs]
+
+    if args.compare:
+        results = compare_batching(args.serve_config, texts, args.num_requests, args.concurrency, port=args.port)
+    else:
+        results = asyncio.run(run_load_test(args.url, texts, args.num_requests, args.concurrency))
+    print(json.dumps(results, indent=4))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
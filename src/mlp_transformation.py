@@ -0,0 +1,208 @@
+import os
+import argparse
+import json
+import numpy as np
+import torch
+from torch import nn
+from config_utils import load_train_config
+from data_classes import Data
+from embedding_cache import load_embedding_model
+from encoding import encode_unique, load_query_encoder
+from utils import SEP_TOKEN
+
+
+class TransformationMLP(nn.Module):
+    """
+    Residual MLP mapping career history embeddings to ESCO occupation embeddings.
+
+    The output is a linear map of the input (the counterpart of the matrix T) plus a one-hidden-layer
+    correction, so the network can represent the linear transformation exactly and learn non-linear
+    structure on top of it.
+    """
+
+    def __init__(self, embedding_dim, hidden_dim=1024, dropout=0.1):
+        """
+        Args:
+            embedding_dim (int): Dimension of the input and output embeddings.
+            hidden_dim (int): Width of the hidden layer.
+            dropout (float): Dropout applied to the hidden layer during training.
+        """
+        super().__init__()
+        self.linear = nn.Linear(embedding_dim, embedding_dim, bias=False)
+        self.mlp = nn.Sequential(
+            nn.Linear(embedding_dim, hidden_dim),
+            nn.GELU(),
+            nn.Dropout(dropout),
+            nn.Linear(hidden_dim, embedding_dim),
+        )
+
+    def forward(self, x):
+        return self.linear(x) + self.mlp(x)
+
+
+def load_transformation_mlp(path):
+    """
+    Loads a `TransformationMLP` checkpoint written by `train_mlp_transformation`.
+
+    Args:
+        path (str): Path of the checkpoint (`.pt`).
+
+    Returns:
+        TransformationMLP: The model in eval mode, on CPU.
+    """
+    checkpoint = torch.load(path, map_location="cpu")
+    model = TransformationMLP(**checkpoint["model_config"])
+    model.load_state_dict(checkpoint["state_dict"])
+    return model.eval()
+
+
+def train_mlp_transformation(model, train_pairs, val_pairs, mlp_config, query_model=None):
+    """
+    Trains a `TransformationMLP` to map career history embeddings to ESCO occupation embeddings.
+
+    The embeddings are computed once up front; training minimizes the same squared error
+    as the linear transformation, sum over dimensions averaged over pairs.
+
+    Args:
+        model (SentenceTransformer): Pre-trained sentence embedding model.
+        train_pairs (list of tuples): List of (career_history_text, esco_occupation_text) pairs.
+        val_pairs (list of tuples): Validation pairs, used to report the MSE after every epoch.
+        mlp_config (dict): `mlp_transformation` section of the training config.
+        query_model (optional): Encoder for the career histories (e.g. a `CompositionalEncoder`).
+            Defaults to `model`.
+
+    Returns:
+        TransformationMLP: Trained model in eval mode.
+    """
+    query_model = query_model or model
+    career_history_texts, esco_occupation_texts = zip(*train_pairs)
+    A = torch.from_numpy(np.asarray(encode_unique(query_model, career_history_texts), dtype=np.float32))
+    B = torch.from_numpy(np.asarray(encode_unique(model, esco_occupation_texts), dtype=np.float32))
+    val_career_history_texts, val_esco_occupation_texts = zip(*val_pairs)
+    A_val = torch.from_numpy(np.asarray(encode_unique(query_model, val_career_history_texts), dtype=np.float32))
+    B_val = torch.from_numpy(np.asarray(encode_unique(model, val_esco_occupation_texts), dtype=np.float32))
+
+    torch.manual_seed(mlp_config.get("seed", 42))
+    mlp = TransformationMLP(
+        A.shape[1], hidden_dim=mlp_config.get("hidden_dim", 1024), dropout=mlp_config.get("dropout", 0.1)
+    )
+    optimizer = torch.optim.AdamW(
+        mlp.parameters(), lr=mlp_config.get("learning_rate", 1.0e-3), weight_decay=mlp_config.get("weight_decay", 0.01)
+    )
+    batch_size = mlp_config.get("batch_size", 256)
+
+    for epoch in range(mlp_config.get("epochs", 10)):
+        mlp.train()
+        permutation = torch.randperm(len(A))
+        train_loss = 0.0
+        for start in range(0, len(A), batch_size):
+            batch = permutation[start:start + batch_size]
+            loss = ((mlp(A[batch]) - B[batch]) ** 2).sum(dim=1).mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.item() * len(batch)
+        mlp.eval()
+        with torch.inference_mode():
+            val_mse = ((mlp(A_val) - B_val) ** 2).sum(dim=1).mean().item()
+        print(f"Epoch {epoch + 1}: train MSE {train_loss / len(A):.3f}, validation MSE {val_mse:.3f}")
+
+    return mlp.eval()
+
+
+def export_transformation_mlp(mlp, path, export_format):
+    """
+    Exports a trained `TransformationMLP` for serving without the Python class definition.
+
+    Args:
+        mlp (TransformationMLP): Trained model.
+        path (str): Path of the checkpoint; the export is written next to it.
+        export_format (str): "torchscript" (`<name>.torchscript.pt`) or "onnx" (`<name>.onnx`).
+
+    Returns:
+        str: Path of the exported model.
+    """
+    root, _ = os.path.splitext(path)
+    example = torch.zeros(1, mlp.linear.in_features)
+    if export_format == "torchscript":
+        export_path = f"{root}.torchscript.pt"
+        torch.jit.trace(mlp, example).save(export_path)
+    elif export_format == "onnx":
+        export_path = f"{root}.onnx"
+        torch.onnx.export(
+            mlp, example, export_path, input_names=["embeddings"], output_names=["transformed"],
+            dynamic_axes={"embeddings": {0: "batch"}, "transformed": {0: "batch"}},
+        )
+    else:
+        raise ValueError(f"Invalid export format: {export_format}")
+    return export_path
+
+
+def main(config):
+    """
+    Main function to train a neural (MLP) transformation for mapping embeddings.
+
+    This function:
+    1. Loads the training and validation data for transformation fine-tuning.
+    2. Loads a pre-trained sentence embedding model.
+    3. Trains and saves the MLP, and optionally exports it to TorchScript or ONNX.
+
+    Args:
+        config (dict): Configuration dictionary containing paths and parameters.
+    """
+    mlp_config = config.get("mlp_transformation", {})
+
+    print("Loading data...")
+    data = Data(config["data"]["data_type"], cache_dir=config.get("cache", {}).get("data_dir"))
+    train_pairs, val_pairs, _ = data.get_data(stage="transformation_finetuning")
+
+    print("Loading model...")
+    model = load_embedding_model(
+        config["model"]["embedding_model_transformation"],
+        revision=config["model"].get("embedding_model_revision"),
+        cache_dir=config.get("cache", {}).get("embedding_dir"),
+        encoding_config=config.get("encoding"),
+    )
+
+    print("Training MLP transformation...")
+    query_model = load_query_encoder(model, SEP_TOKEN, config.get("composition"))
+    mlp = train_mlp_transformation(model, train_pairs, val_pairs, mlp_config, query_model=query_model)
+
+    print(f"Saving MLP transformation to: {config['output']['path_neural_model']}")
+    torch.save(
+        {
+            "model_config": {
+                "embedding_dim": mlp.linear.in_features,
+                "hidden_dim": mlp.mlp[0].out_features,
+                "dropout": mlp.mlp[2].p,
+            },
+            "state_dict": mlp.state_dict(),
+        },
+        config["output"]["path_neural_model"],
+    )
+
+    export_format = mlp_config.get("export")
+    if export_format is not None:
+        export_path = export_transformation_mlp(mlp, config["output"]["path_neural_model"], export_format)
+        print(f"Exported MLP transformation to: {export_path}")
+
+
+if __name__ == "__main__":
+    """
+    Command-line execution entry point.
+
+    This script takes a configuration file as input and trains an MLP transformation
+    to map career history embeddings to ESCO occupation embeddings.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mlp_transformation_config", type=str, help="Path to the configuration YAML file.")
+    args = parser.parse_args()
+
+    # Load configuration file
+    config = load_train_config(args.mlp_transformation_config)
+
+    print("Configuration loaded successfully.")
+    print(json.dumps(config, indent=4))
+
+    # Run main function
+    main(config)
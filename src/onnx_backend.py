@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+
+BACKENDS = ("torch", "onnx", "onnx_int8")
+
+
+def onnx_model_path(onnx_dir, model_id, revision=None):
+    """
+    Computes the directory an embedding model is exported to.
+
+    Args:
+        onnx_dir (str): Root directory of the exported models.
+        model_id (str): Hugging Face model id or local path of the embedding model.
+        revision (str, optional): Resolved model revision, see `embedding_cache.resolve_model_revision`.
+
+    Returns:
+        str: Directory of the exported model.
+    """
+    key = hashlib.sha1(json.dumps([model_id, revision]).encode()).hexdigest()[:16]
+    return os.path.join(onnx_dir, f"{os.path.basename(model_id.rstrip('/'))}-{key}")
+
+
+def onnx_file_name(backend, quantization="avx2"):
+    """
+    Returns the ONNX file of a backend, relative to the exported model directory.
+    """
+    if backend == "onnx":
+        return "onnx/model.onnx"
+    return f"onnx/model_qint8_{quantization}.onnx"
+
+
+def load_onnx_model(model_id, revision=None, backend="onnx", onnx_dir="./cache/onnx", quantization="avx2"):
+    """
+    Loads a SentenceTransformer running on ONNX Runtime, exporting (and quantizing) the model on first use.
+
+    The PyTorch model is exported once to `onnx/model.onnx`. "onnx_int8" additionally writes a
+    dynamically int8-quantized copy for the given CPU instruction set. Both are loaded with
+    sentence-transformers' ONNX backend and expose the same `encode` as the PyTorch model.
+
+    Args:
+        model_id (str): Hugging Face model id or local path of the embedding model.
+        revision (str, optional): Resolved model revision (see `embedding_cache.resolve_model_revision`).
+            It keys the exported model, so a re-trained local model is exported again.
+        backend (str): "onnx" (fp32) or "onnx_int8" (dynamic int8 quantization).
+        onnx_dir (str): Root directory of the exported models.
+        quantization (str): Quantization config of "onnx_int8": "arm64", "avx2", "avx512" or "avx512_vnni".
+
+    Returns:
+        SentenceTransformer: Model using the ONNX backend.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    if backend not in ("onnx", "onnx_int8"):
+        raise ValueError(f"Invalid ONNX backend: {backend}")
+    path = onnx_model_path(onnx_dir, model_id, revision)
+    if not os.path.exists(os.path.join(path, onnx_file_name("onnx"))):
+        print(f"Exporting {model_id} to ONNX at {path}...")
+        # Local models have no Hub revision; theirs is a fingerprint of the weight files
+        hub_revision = None if os.path.isdir(model_id) else revision
+        SentenceTransformer(model_id, revision=hub_revision, backend="onnx").save_pretrained(path)
+    file_name = onnx_file_name(backend, quantization)
+    if not os.path.exists(os.path.join(path, file_name)):
+        print(f"Quantizing {path} ({quantization})...")
+        export_dynamic_quantized_onnx_model(
+            SentenceTransformer(path, backend="onnx"), quantization_config=quantization, model_name_or_path=path
+        )
+    return SentenceTransformer(path, backend="onnx", model_kwargs={"file_name": file_name})
@@ -3,6 +3,9 @@
 # Define the datasets
 DATASETS=( "decorte" "decorte_esco" "karrierewege" "karrierewege_occ" "karrierewege_cp") 
 
+# Set TRAIN_MLP=1 to also train the neural (MLP) transformation of every dataset
+TRAIN_MLP=${TRAIN_MLP:-0}
+
 # Log files for output
 LOG_DIR="logs"
 mkdir -p $LOG_DIR
@@ -21,6 +24,17 @@ for DATASET in "${DATASETS[@]}"; do
     fi
     echo "Training completed for $DATASET. Logs saved to $LOG_DIR/${DATASET}_train.log"
 
+    # Neural (MLP) transformation, used by test configs with transformation_method "neural"
+    if [ "$TRAIN_MLP" = "1" ]; then
+        echo "Training MLP transformation with config: ${DATASET}.yaml"
+        CUDA_VISIBLE_DEVICES=0 python src/mlp_transformation.py --mlp_transformation_config "${DATASET}.yaml" > "$LOG_DIR/${DATASET}_train_mlp.log" 2>&1
+        if [ $? -ne 0 ]; then
+            echo "MLP training failed for $DATASET. Check $LOG_DIR/${DATASET}_train_mlp.log for details."
+            continue
+        fi
+        echo "MLP training completed for $DATASET. Logs saved to $LOG_DIR/${DATASET}_train_mlp.log"
+    fi
+
     # Testing
     echo "Testing with config: ${DATASET}.yaml"
     CUDA_VISIBLE_DEVICES=0 python src/test.py --test_config "${DATASET}.yaml" > "$LOG_DIR/${DATASET}_test.log" 2>&1
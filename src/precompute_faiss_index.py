@@ -1,19 +1,208 @@
+import argparse
+import glob
+import json
+import os
 import numpy as np
-import faiss
-from predictor import LabelSpace
-from sentence_transformers import SentenceTransformer
-from utils import load_prepare_karrierewege
+import pandas as pd
+import label_store
+from config_utils import load_label_index_config
+from embedding_cache import load_embedding_model, resolve_model_revision
+from predictor import build_faiss_index
 
-# Load data (just once)
-train_pairs, _, _ = load_prepare_karrierewege(minus_last=False, language='en')
-next_jobs = list(set([pair[1] for pair in train_pairs]))
+# meta.json keys identifying the embedding model; the label index is rebuilt if one of them changes
+MODEL_META_KEYS = ("model_id", "model_revision", "backend")
 
-# Build label space (embeds & builds FAISS index)
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-label_space = LabelSpace(model, next_jobs)
 
-# Save FAISS index + job labels
-faiss.write_index(label_space.index, 'faiss_index.index')
-np.save('next_jobs.npy', np.array(next_jobs))
+def esco_label(title, description):
+    # Same format as the (ESCO) targets of the prepared document pairs, see utils.py
+    return f"esco role: {title} \n description: {description}"
 
-print("✅ Precompute done! Saved faiss_index.index + next_jobs.npy")
+
+def load_dataset_labels(dataset_name, title_column, description_column):
+    """
+    Collects the distinct labels of a Hugging Face dataset from its title and description columns.
+
+    Only the two label columns of every split are read; no career histories or pairs are built.
+
+    Args:
+        dataset_name (str): Hugging Face dataset, e.g. "ElenaSenger/Karrierewege".
+        title_column (str): Column holding the occupation title.
+        description_column (str): Column holding the occupation description.
+
+    Returns:
+        List[str]: Distinct labels in order of first occurrence.
+    """
+    from datasets import load_dataset
+
+    dataset = load_dataset(dataset_name)
+    labels = {}
+    for split in dataset:
+        columns = dataset[split].select_columns([title_column, description_column])
+        for title, description in zip(columns[title_column], columns[description_column]):
+            labels.setdefault(esco_label(title, description))
+    return list(labels)
+
+
+def load_esco_csv_labels(csv_path):
+    """
+    Collects the labels of all occupations in the ESCO occupations CSV (e.g. `data/occupations_en.csv`).
+
+    Returns:
+        List[str]: Distinct labels in file order.
+    """
+    occupations = pd.read_csv(csv_path, usecols=["preferredLabel", "description"])
+    return list(dict.fromkeys(
+        esco_label(title, description)
+        for title, description in zip(occupations["preferredLabel"].tolist(), occupations["description"].tolist())
+    ))
+
+
+def load_source_labels(labels_config):
+    """
+    Loads the labels of the source configured in the `labels` section of a label index configuration.
+    """
+    if labels_config["source"] == "dataset":
+        return load_dataset_labels(
+            labels_config["dataset"], labels_config["title_column"], labels_config["description_column"]
+        )
+    if labels_config["source"] == "esco_csv":
+        return load_esco_csv_labels(labels_config["esco_csv"])
+    raise ValueError(f"Invalid label source: {labels_config['source']}")
+
+
+def update_label_index(path, label_texts, embedding_model, index_config=None, meta=None, rebuild=False):
+    """
+    Adds the labels missing from the label index at `path`, or builds it if it does not exist yet.
+
+    The index is stored in the `label_store` format: `labels.json`, `embeddings.npy`, `meta.json`
+    and the Faiss index of `index_config`. New labels are appended, so the ids of existing labels
+    stay stable; only the new labels are encoded and added to the existing Faiss index. Labels that
+    disappeared from the source are kept. The index is rebuilt from scratch if the embedding model
+    (`MODEL_META_KEYS` of `meta`) or the storage dtype differs from the stored one.
+
+    Args:
+        path (str): Directory of the label index.
+        label_texts (List[str]): Current labels of the source.
+        embedding_model: Model encoding the labels (see `embedding_cache.load_embedding_model`).
+        index_config (dict, optional): Faiss index of the label space, see `predictor.build_faiss_index`.
+        meta (dict, optional): Stored in `meta.json`; its `MODEL_META_KEYS` are compared on updates.
+        rebuild (bool): Rebuild from scratch even if the stored index is compatible. The stored label
+            ids are discarded; labels are renumbered in the order of `label_texts`.
+
+    Returns:
+        int: Number of labels encoded by this call.
+
+    Raises:
+        ValueError: If there are no labels to build a new index from.
+    """
+    index_config = index_config or {}
+    meta = meta or {}
+    dtype = np.dtype(index_config.get("embedding_dtype", "float32"))
+    existing = []
+    if rebuild and label_store.has_label_embeddings(path):
+        print(f"Rebuilding {path}, label ids of earlier predictions no longer apply")
+    elif label_store.has_label_embeddings(path):
+        stored_meta = label_store.load_meta(path)
+        same_model = all(stored_meta.get(key) == meta.get(key) for key in MODEL_META_KEYS)
+        if same_model and stored_meta["dtype"] == str(dtype):
+            existing = label_store.load_label_texts(path)
+        else:
+            print(f"{path} was built with a different embedding model or dtype, rebuilding (label ids of earlier predictions no longer apply)")
+
+    known = set(existing)
+    new_labels = [label for label in dict.fromkeys(label_texts) if label not in known]
+    if not existing and not new_labels:
+        raise ValueError(f"The label source is empty, cannot build a label index at {path}")
+    index = label_store.load_index(path, index_config, mmap=False) if existing else None
+    index_complete = index is not None and index.ntotal == len(existing)
+    if existing and not new_labels and index_complete:
+        print(f"{path} is up to date ({len(existing)} labels)")
+        return 0
+
+    print(f"Encoding {len(new_labels)} new labels ({len(existing)} already indexed)")
+    new_embeddings = np.empty((0, 0), dtype=dtype)
+    if new_labels:
+        new_embeddings = embedding_model.encode(new_labels)
+        # Normalize embeddings to unit length for cosine similarity, as LabelSpace does
+        new_embeddings = (new_embeddings / np.linalg.norm(new_embeddings, axis=1, keepdims=True)).astype(dtype)
+    if existing:
+        stored_embeddings = np.asarray(label_store.load_label_embeddings(path))
+        embeddings = np.concatenate([stored_embeddings, new_embeddings]) if new_labels else stored_embeddings
+    else:
+        embeddings = new_embeddings
+
+    if index_complete:
+        index.add(np.ascontiguousarray(new_embeddings, dtype=np.float32))
+    else:
+        index = build_faiss_index(np.ascontiguousarray(embeddings, dtype=np.float32), index_config)
+
+    label_store.save_label_embeddings(path, existing + new_labels, embeddings, meta)
+    # Indexes of other index configs no longer cover all labels
+    current_index = os.path.join(path, label_store.index_file_name(index_config))
+    for index_path in glob.glob(os.path.join(path, "index-*.faiss")):
+        if index_path != current_index:
+            os.remove(index_path)
+    label_store.save_index(path, index, index_config)
+    return len(new_labels)
+
+
+def main(config, rebuild=False):
+    """
+    Main function of the label index builder.
+
+    Encodes the labels of the configured source with the embedding model and backend of the
+    referenced test configuration and updates the label index in `output.label_index_dir`.
+
+    Args:
+        config (dict): Label index configuration (see `config/label_index/`).
+        rebuild (bool): Rebuild the index from scratch.
+    """
+    predictor_config = config["predictor"]
+    model_id = predictor_config["model"]["embedding_model_path"]
+    model_revision = resolve_model_revision(model_id, predictor_config["model"].get("embedding_model_revision"))
+    backend_config = predictor_config.get("backend")
+
+    print("Loading labels...")
+    label_texts = load_source_labels(config["labels"])
+    print(f"{len(label_texts)} labels in {config['labels']['source']}")
+
+    embedding_model = load_embedding_model(
+        model_id,
+        revision=model_revision,
+        cache_dir=predictor_config.get("cache", {}).get("embedding_dir"),
+        encoding_config=predictor_config.get("encoding"),
+        backend_config=backend_config,
+    )
+    meta = {
+        "model_id": model_id,
+        "model_revision": model_revision,
+        "backend": (backend_config or {}).get("type", "torch"),
+        "source": config["labels"],
+    }
+    num_encoded = update_label_index(
+        config["output"]["label_index_dir"],
+        label_texts,
+        embedding_model,
+        index_config=predictor_config.get("index"),
+        meta=meta,
+        rebuild=rebuild,
+    )
+    print(f"Done: encoded {num_encoded} labels into {config['output']['label_index_dir']}")
+
+
+if __name__ == "__main__":
+    """
+    Entry point for building or updating a label index.
+    """
+    parser = argparse.ArgumentParser(description="Build or incrementally update the label index served by the app.")
+    parser.add_argument("--label_index_config", type=str, required=True, help="Path to the label index configuration file.")
+    parser.add_argument("--rebuild", action="store_true", help=(
+        "Rebuild the index from scratch instead of adding new labels. This discards the stored label ids: "
+        "labels are renumbered, so label ids of earlier (batch) predictions no longer apply."
+    ))
+    args = parser.parse_args()
+
+    config = load_label_index_config(args.label_index_config)
+    print(json.dumps(config, indent=4))
+
+    main(config, rebuild=args.rebuild)
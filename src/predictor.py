@@ -1,8 +1,12 @@
 from abc import ABC, abstractmethod
+import json
+import os
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from typing import List
 import faiss  
+from embedding_cache import load_embedding_model, resolve_model_revision
+from encoding import load_query_encoder
+import label_store
 
 class TransformationModel(ABC):
     @abstractmethod
@@ -10,21 +14,141 @@ class TransformationModel(ABC):
         pass
 
 
+def file_version(path):
+    # Changes whenever the file is rewritten, e.g. by re-training the transformation
+    return f"{os.path.abspath(path)}:{os.stat(path).st_mtime_ns}"
+
+
+def low_rank_path(transformation_matrix_path, rank):
+    # e.g. ./output/matrix_T_decorte.npy -> ./output/matrix_T_decorte_rank64.npz
+    root, _ = os.path.splitext(transformation_matrix_path)
+    return f"{root}_rank{rank}.npz"
+
+
 class LinearTransformationModel(TransformationModel):
-    def __init__(self, transformation_matrix_path):
-        self.transformation_matrix = np.load(transformation_matrix_path)
+    def __init__(self, transformation_matrix_path, dtype=np.float32):
+        # Matrices may be stored in float16/float32/float64 but are applied in `dtype`, so float32
+        # query batches are not upcast to float64
+        self.dtype = np.dtype(dtype)
+        self.version = file_version(transformation_matrix_path)
+        if transformation_matrix_path.endswith(".npz"):
+            # Rank-r factorization T = left @ right with (d, r) and (r, d) factors
+            factors = np.load(transformation_matrix_path)
+            self.transformation_matrix = None
+            self.left, self.right = factors["left"].astype(self.dtype), factors["right"].astype(self.dtype)
+        else:
+            self.transformation_matrix = np.load(transformation_matrix_path).astype(self.dtype)
+
+    @property
+    def rank(self):
+        return None if self.transformation_matrix is not None else self.left.shape[1]
 
     def transform(self, np_2d_array):
+        np_2d_array = np.asarray(np_2d_array, dtype=self.dtype)
+        if self.transformation_matrix is None:
+            return (np_2d_array @ self.left) @ self.right
         transformed_2d_array = np_2d_array @ self.transformation_matrix
         return transformed_2d_array
 
+    def transform_transposed(self, np_2d_array):
+        # np_2d_array @ Tᵀ
+        np_2d_array = np.asarray(np_2d_array, dtype=self.dtype)
+        if self.transformation_matrix is None:
+            return (np_2d_array @ self.right.T) @ self.left.T
+        return np_2d_array @ self.transformation_matrix.T
+
+class MLPTransformationModel(TransformationModel):
+    def __init__(self, model_path, batch_size=4096):
+        # Checkpoint of mlp_transformation.py, or one of its TorchScript (.torchscript.pt) / ONNX (.onnx) exports
+        self.batch_size = batch_size
+        self.version = file_version(model_path)
+        self.session = None
+        self.model = None
+        if model_path.endswith(".onnx"):
+            import onnxruntime
+            self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        elif model_path.endswith(".torchscript.pt"):
+            import torch
+            self.model = torch.jit.load(model_path, map_location="cpu").eval()
+        else:
+            from mlp_transformation import load_transformation_mlp
+            self.model = load_transformation_mlp(model_path)
+
+    def transform(self, np_2d_array):
+        np_2d_array = np.ascontiguousarray(np_2d_array, dtype=np.float32)
+        transformed = np.empty_like(np_2d_array)
+        for start in range(0, len(np_2d_array), self.batch_size):
+            batch = np_2d_array[start:start + self.batch_size]
+            if self.session is not None:
+                transformed[start:start + len(batch)] = self.session.run(None, {"embeddings": batch})[0]
+            else:
+                import torch
+                with torch.inference_mode():
+                    transformed[start:start + len(batch)] = self.model(torch.from_numpy(batch)).numpy()
+        return transformed
+
+def build_faiss_index(embeddings, index_config=None):
+    """
+    Builds an inner-product Faiss index over normalized float32 embeddings.
+
+    `index_config` keys (all optional):
+        type: "flat" (exact, default), "hnsw", "ivf_flat", "ivf_pq", "sq8" or "sq_fp16".
+        hnsw_m, ef_construction, ef_search: HNSW graph degree and construction / search beam widths.
+        nlist, nprobe: number of IVF cells and cells visited per query.
+        pq_m, pq_nbits: number of PQ sub-quantizers and bits per sub-quantizer code.
+        embedding_dtype: storage dtype of the persisted label embeddings, "float32" (default) or "float16".
+    """
+    index_config = index_config or {}
+    index_type = index_config.get("type", "flat")
+    n, d = embeddings.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)  # Inner Product index
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, index_config.get("hnsw_m", 32), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = index_config.get("ef_construction", 200)
+        index.hnsw.efSearch = index_config.get("ef_search", 128)
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        # Faiss needs ~39 training points per cell
+        nlist = max(1, min(index_config.get("nlist", 4 * int(np.sqrt(n))), n // 39))
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer, d, nlist, index_config.get("pq_m", 64), index_config.get("pq_nbits", 8), faiss.METRIC_INNER_PRODUCT
+            )
+        index.train(embeddings)
+        index.nprobe = index_config.get("nprobe", 16)
+    elif index_type in ("sq8", "sq_fp16"):
+        # Scalar-quantized label matrix, 1 (int8) or 2 (fp16) bytes per dimension instead of 4
+        quantizer_type = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(d, quantizer_type, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Invalid index type: {index_type}")
+    index.add(embeddings)
+    return index
+
 class LabelSpace:
-    def __init__(self, embedding_model, label_texts):
+    def __init__(self, embedding_model, label_texts, index_config=None, store_path=None):
         self.embedding_model = embedding_model
         self.label_texts = label_texts
-        # Precompute label embeddings and build Faiss index
-        self.label_embeddings = self.__get_label_embeddings()
-        self.__build_faiss_index()
+        self.index_config = index_config or {}
+        self.embedding_dtype = np.dtype(self.index_config.get("embedding_dtype", "float32"))
+        self.store_path = store_path
+        # Load persisted label embeddings and Faiss index, or precompute and persist them
+        if store_path is not None and label_store.has_label_embeddings(store_path):
+            print(f"Loading label embeddings from {store_path}")
+            self.label_embeddings = label_store.load_label_embeddings(store_path)
+        else:
+            self.label_embeddings = self.__get_label_embeddings().astype(self.embedding_dtype)
+            if store_path is not None:
+                label_store.save_label_embeddings(store_path, label_texts, self.label_embeddings)
+        self.index = label_store.load_index(store_path, self.index_config) if store_path is not None else None
+        if self.index is None:
+            self.__build_faiss_index()
+            if store_path is not None:
+                label_store.save_index(store_path, self.index, self.index_config)
 
     def __get_label_embeddings(self):
         embeddings = self.embedding_model.encode(self.label_texts)
@@ -32,38 +156,137 @@ class LabelSpace:
         embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
         return embeddings.astype('float32')
 
+    def float32_label_embeddings(self):
+        return np.ascontiguousarray(self.label_embeddings, dtype=np.float32)
+
     def __build_faiss_index(self):
-        d = self.label_embeddings.shape[1]  # dimension
-        self.index = faiss.IndexFlatIP(d)  # Inner Product index
-        self.index.add(self.label_embeddings)
+        self.index = build_faiss_index(self.float32_label_embeddings(), self.index_config)
 
-    def lookup_closest_labels(self, embeddings, top_k=10):
-        # Normalize query embeddings
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-        embeddings = embeddings.astype('float32')
+    def lookup_closest_labels(self, embeddings, top_k=10, normalized=False):
+        if not normalized:
+            # Normalize query embeddings
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings.astype('float32')
         distances, indices = self.index.search(embeddings, top_k)
         return indices, distances
 
+    def recall_vs_flat(self, embeddings, top_k=10):
+        # Mean overlap of the top_k labels found by the configured index with those of an exact scan
+        flat_index = build_faiss_index(self.float32_label_embeddings(), {"type": "flat"})
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings.astype('float32')
+        _, exact = flat_index.search(embeddings, top_k)
+        _, approximate = self.index.search(embeddings, top_k)
+        overlap = [len(set(e.tolist()) & set(a.tolist())) for e, a in zip(exact, approximate)]
+        return sum(overlap) / (top_k * len(overlap))
+
 class LabelPredictor:
-    def __init__(self, embedding_model, label_texts, transformation_model=None):
-        self.label_space = LabelSpace(embedding_model, label_texts)
+    def __init__(
+        self,
+        embedding_model,
+        label_texts,
+        transformation_model=None,
+        index_config=None,
+        label_store_path=None,
+        fuse_transformation=False,
+        query_encoder=None,
+        model_version=None,
+    ):
+        self.label_space = LabelSpace(embedding_model, label_texts, index_config, label_store_path)
         self.transformation_model = transformation_model
         self.label_texts = label_texts.copy()
         self.embedding_model = embedding_model
+        # Career histories may be encoded differently from the labels, e.g. by a CompositionalEncoder
+        self.query_encoder = query_encoder if query_encoder is not None else embedding_model
+        self.fused_index = self.__build_fused_index() if fuse_transformation else None
+        # Identifies the embedding model, e.g. for caches of query results
+        self.model_version = model_version
 
-    def predict(self, texts: List[str], top_k=10):
-        embeddings = self.embedding_model.encode(texts)
+    @property
+    def version(self):
+        # Query vectors and predictions change with the embedding model, the transformation and fusion
+        transformation_version = getattr(self.transformation_model, "version", None)
+        return json.dumps([self.model_version, transformation_version, self.fused_index is not None])
+
+    def __build_fused_index(self):
+        if not isinstance(self.transformation_model, LinearTransformationModel):
+            raise ValueError("fuse_transformation requires a linear transformation model")
+        # normalize(q T) · l ranks labels like q · (l Tᵀ), so T is applied once to the labels
+        # instead of to every query batch
+        projected = self.transformation_model.transform_transposed(self.label_space.float32_label_embeddings())
+        # |q T|² = q (T Tᵀ) qᵀ rescales the fused scores to cosines; for T = left @ right the Gram matrix
+        # of the (r, d) right factor is applied to q @ left, so no (d, d) product is needed per batch
+        model = self.transformation_model
+        factor = model.right if model.transformation_matrix is None else model.transformation_matrix
+        self.fused_gram = np.ascontiguousarray(factor @ factor.T, dtype=np.float32)
+        return build_faiss_index(np.ascontiguousarray(projected, dtype=np.float32), self.label_space.index_config)
+
+    def set_transformation_model(self, transformation_model):
+        self.transformation_model = transformation_model
+        if self.fused_index is not None:
+            self.fused_index = self.__build_fused_index()
+
+    def embed(self, texts: List[str]):
+        embeddings = self.query_encoder.encode(texts)
         if self.transformation_model is not None:
             embeddings = self.transformation_model.transform(embeddings)
-        # Normalize embeddings
-        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        # Normalize once, in place, as the contiguous float32 array Faiss searches with
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def query_vectors(self, texts: List[str]):
+        if self.fused_index is not None:
+            # Untransformed, unnormalized query embeddings are searched against the fused index
+            return np.ascontiguousarray(self.query_encoder.encode(texts), dtype=np.float32)
+        return self.embed(texts)
+
+    def search(self, query_vectors, top_k=10):
+        if self.fused_index is not None:
+            # Same ranking as the unfused path; q · (l Tᵀ) is rescaled by |q T| to the cosine similarity
+            # normalize(q T) · l the unfused path returns
+            similarities, most_similar_indices = self.fused_index.search(query_vectors, top_k)
+            similarities = similarities / np.maximum(self.__fused_query_norms(query_vectors), np.finfo(np.float32).tiny)
+            return most_similar_indices.astype(np.int32), similarities.astype(np.float32)
         # Use Faiss index to find closest labels
         most_similar_indices, similarities = self.label_space.lookup_closest_labels(
-            embeddings, top_k
+            query_vectors, top_k, normalized=True
         )
+        # (n, top_k) label ids into label_texts, most similar first
+        return most_similar_indices.astype(np.int32), similarities
+
+    def __fused_query_norms(self, query_vectors):
+        # (n, 1) norms |q T| from the Gram matrix precomputed by __build_fused_index
+        if self.transformation_model.transformation_matrix is None:
+            query_vectors = query_vectors @ self.transformation_model.left.astype(np.float32, copy=False)
+        squared_norms = np.einsum("ij,ij->i", query_vectors @ self.fused_gram, query_vectors)
+        return np.sqrt(np.maximum(squared_norms, 0))[:, None]
+
+    def predict_ids(self, texts: List[str], top_k=10):
+        return self.search(self.query_vectors(texts), top_k)
+
+    @staticmethod
+    def found_results(label_ids, similarities):
+        """
+        Drops the padding of queries for which the index found fewer than `top_k` labels.
+
+        IVF, HNSW and PQ indexes pad their results with id -1, which would otherwise be read as the last label.
+
+        Args:
+            label_ids (np.ndarray): (n, top_k) label ids as returned by `predict_ids`.
+            similarities (np.ndarray): (n, top_k) similarities as returned by `predict_ids`.
+
+        Returns:
+            List[tuple]: Per query, the found label ids and their similarities, most similar first.
+        """
+        label_ids, similarities = np.asarray(label_ids), np.asarray(similarities)
+        return [(ids[ids >= 0], scores[ids >= 0]) for ids, scores in zip(label_ids, similarities)]
+
+    def predict(self, texts: List[str], top_k=10):
+        most_similar_indices, similarities = self.predict_ids(texts, top_k=top_k)
         # Build predictions
         predictions = []
-        for indices in most_similar_indices:
+        for indices, _ in self.found_results(most_similar_indices, similarities):
             predictions.append([self.label_texts[i] for i in indices])
         return predictions
 
@@ -75,10 +298,25 @@ class Predictor:
         transformation_model_path=None,
         transformation_method=None,
         embedding_type="sentence_transformer", # Can be 'sentence_transformer' or 'llama'
+        embedding_model_revision=None,
+        embedding_cache_dir=None, # Persistent embedding cache, disabled if None
+        index_config=None, # Faiss index of the label space, see build_faiss_index
+        label_store_dir=None, # Persisted label embeddings and indexes, disabled if None
+        fuse_transformation=False, # Search untransformed queries against labels projected by Tᵀ
+        encoding_config=None, # Batch size / worker processes of the encoder, see encoding.PooledEncoder
+        composition_config=None, # Pooled per-experience encoding of career histories, see encoding.CompositionalEncoder
+        backend_config=None, # Encoder inference backend (torch, onnx, onnx_int8), see onnx_backend
+        label_index_dir=None, # Label index built by precompute_faiss_index.py, used instead of label_store_dir
     ):
         assert embedding_type in ['sentence_transformer', 'llama'], f"Invalid embedding_type: {embedding_type}"
         if embedding_type == 'sentence_transformer':
-            embedding_model = SentenceTransformer(embedding_model_path)
+            embedding_model = load_embedding_model(
+                embedding_model_path,
+                revision=embedding_model_revision,
+                cache_dir=embedding_cache_dir,
+                encoding_config=encoding_config,
+                backend_config=backend_config,
+            )
         else:
             raise ValueError(f"Invalid embedding_type: {embedding_type}")
         transformation_model = None
@@ -89,11 +327,87 @@ class Predictor:
                 transformation_model = LinearTransformationModel(transformation_model_path)
             else:
                 raise ValueError(f"Invalid transformation_method: {transformation_method}")
+        model_revision = resolve_model_revision(embedding_model_path, embedding_model_revision)
+        backend = (backend_config or {}).get("type", "torch")
+        label_store_path = None
+        if label_index_dir is not None:
+            meta = label_store.load_meta(label_index_dir)
+            if [meta.get("model_id"), meta.get("model_revision"), meta.get("backend")] != [embedding_model_path, model_revision, backend]:
+                raise ValueError(f"{label_index_dir} was built with a different embedding model: {meta}")
+            label_store_path = label_index_dir
+        elif label_store_dir is not None:
+            label_store_path = label_store.label_store_path(
+                label_store_dir,
+                embedding_model_path,
+                model_revision,
+                label_texts,
+                dtype=(index_config or {}).get("embedding_dtype", "float32"),
+                backend=backend,
+            )
+        query_encoder = None
+        if (composition_config or {}).get("pooling") is not None:
+            from utils import SEP_TOKEN
+            query_encoder = load_query_encoder(embedding_model, SEP_TOKEN, composition_config)
         self.label_predictor = LabelPredictor(
-            embedding_model, label_texts, transformation_model
+            embedding_model,
+            label_texts,
+            transformation_model,
+            index_config,
+            label_store_path,
+            fuse_transformation,
+            query_encoder,
+            model_version=json.dumps([
+                embedding_model_path,
+                model_revision,
+                backend,
+                composition_config,
+            ]),
         )
         self.transformation_method = transformation_method
 
     def predict(self, data, top_k=10):
         return self.label_predictor.predict(data, top_k=top_k)
 
+
+def configured_transformation_path(config):
+    """
+    Returns the transformation model of a test configuration, or None if it has no transformation.
+    """
+    transformation_method = config["model"]["transformation_method"]
+    if transformation_method == "linear":
+        return config["model"]["transformation_model_path"]
+    if transformation_method == "neural":
+        return config["model"]["path_neural_model"]
+    return None
+
+
+def build_predictor(config, label_texts, label_index_dir=None, **overrides):
+    """
+    Builds the Predictor described by a test configuration (see `config/test/`).
+
+    Args:
+        config (dict): Test configuration.
+        label_texts (List[str]): Label vocabulary, e.g. `Data.labels` or the labels of `label_index_dir`.
+        label_index_dir (str, optional): Label index built by `precompute_faiss_index.py` to search instead
+            of the persisted label space of `label_texts`.
+        **overrides: `Predictor` arguments that are not taken from the configuration, e.g. `embedding_cache_dir`.
+
+    Returns:
+        Predictor: The configured predictor.
+    """
+    predictor_kwargs = dict(
+        embedding_model_path=config["model"]["embedding_model_path"],
+        label_texts=label_texts,
+        transformation_model_path=configured_transformation_path(config),
+        transformation_method=config["model"]["transformation_method"],
+        embedding_model_revision=config["model"].get("embedding_model_revision"),
+        index_config=config.get("index"),
+        label_store_dir=config.get("cache", {}).get("label_dir"),
+        fuse_transformation=config["model"].get("fuse_transformation", False),
+        encoding_config=config.get("encoding"),
+        composition_config=config.get("composition"),
+        backend_config=config.get("backend"),
+        label_index_dir=label_index_dir,
+    )
+    predictor_kwargs.update(overrides)
+    return Predictor(**predictor_kwargs)
@@ -0,0 +1,173 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+import numpy as np
+
+
+def normalize_query(text):
+    """
+    Normalizes a query so that trivially different spellings of it share cache entries.
+
+    Lower-cases the text and collapses runs of whitespace, e.g. "Marketing Intern  →\\nMarketing
+    Specialist " and "marketing intern → marketing specialist" map to the same key.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live and hit/miss counters.
+
+    Attributes:
+        max_size (int): Maximum number of entries; the least recently used entry is evicted first.
+        ttl_seconds (float): Entries older than this are treated as missing. None keeps them until evicted.
+        hits (int): Number of `get` calls that found a live entry.
+        misses (int): Number of `get` calls that did not.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expiry time or None, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached value of `key`, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            expiry = time.monotonic() + self.ttl_seconds if self.ttl_seconds is not None else None
+            self._entries[key] = (expiry, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+
+class CachedLabelPredictor:
+    """
+    Caches the predictions and query vectors of a `LabelPredictor`.
+
+    Two levels are kept, both keyed by the normalized query and the predictor's `version`, so a
+    different embedding model or transformation never serves stale entries:
+
+        - result cache: (query, top_k, version) -> (label ids, similarities)
+        - embedding cache: (query, version) -> query vector, so a request for another top_k only
+          repeats the (cheap) index search, not the encoding
+
+    Exposes the same `predict_ids` / `found_results` / `predict` as `LabelPredictor`.
+    """
+
+    def __init__(self, label_predictor, result_cache_size=4096, embedding_cache_size=4096, ttl_seconds=None):
+        """
+        Args:
+            label_predictor (LabelPredictor): Predictor whose results are cached.
+            result_cache_size (int): Maximum number of cached (query, top_k) results.
+            embedding_cache_size (int): Maximum number of cached query vectors.
+            ttl_seconds (float, optional): Time-to-live of both caches. None keeps entries until evicted.
+        """
+        self.label_predictor = label_predictor
+        self.label_texts = label_predictor.label_texts
+        self.results = QueryCache(result_cache_size, ttl_seconds)
+        self.embeddings = QueryCache(embedding_cache_size, ttl_seconds)
+
+    def __query_vectors(self, texts, keys, version):
+        vectors = [self.embeddings.get((key, version)) for key in keys]
+        # Encode every missing query once, even if it occurs several times in the batch
+        missing = {}
+        for text, key, vector in zip(texts, keys, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        encoded = {}
+        if missing:
+            for key, vector in zip(missing, self.label_predictor.query_vectors(list(missing.values()))):
+                self.embeddings.put((key, version), vector)
+                encoded[key] = vector
+        return np.ascontiguousarray(
+            np.stack([vector if vector is not None else encoded[key] for key, vector in zip(keys, vectors)]),
+            dtype=np.float32,
+        )
+
+    def predict_ids(self, texts: List[str], top_k=10):
+        version = self.label_predictor.version
+        keys = [normalize_query(text) for text in texts]
+        label_ids = np.empty((len(texts), top_k), dtype=np.int32)
+        similarities = np.empty((len(texts), top_k), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.results.get((key, top_k, version))
+            if cached is None:
+                missing.append(i)
+            else:
+                label_ids[i], similarities[i] = cached
+        if missing:
+            vectors = self.__query_vectors([texts[i] for i in missing], [keys[i] for i in missing], version)
+            missing_ids, missing_similarities = self.label_predictor.search(vectors, top_k)
+            for j, i in enumerate(missing):
+                label_ids[i], similarities[i] = missing_ids[j], missing_similarities[j]
+                self.results.put((keys[i], top_k, version), (label_ids[i].copy(), similarities[i].copy()))
+        return label_ids, similarities
+
+    def found_results(self, label_ids, similarities):
+        return self.label_predictor.found_results(label_ids, similarities)
+
+    def predict(self, texts: List[str], top_k=10):
+        most_similar_indices, similarities = self.predict_ids(texts, top_k=top_k)
+        return [[self.label_texts[i] for i in indices] for indices, _ in self.found_results(most_similar_indices, similarities)]
+
+    def stats(self):
+        return {"results": self.results.stats(), "embeddings": self.embeddings.stats()}
+
+
+def load_cached_label_predictor(label_predictor, cache_config=None):
+    """
+    Wraps a LabelPredictor in a `CachedLabelPredictor` as configured by a `query_cache` config section.
+
+    Args:
+        label_predictor (LabelPredictor): Predictor whose results are cached.
+        cache_config (dict, optional): `result_cache_size`, `embedding_cache_size` and `ttl_seconds`.
+            None returns `label_predictor` unchanged.
+
+    Returns:
+        LabelPredictor or CachedLabelPredictor: The (cached) predictor.
+    """
+    if cache_config is None:
+        return label_predictor
+    return CachedLabelPredictor(
+        label_predictor,
+        result_cache_size=cache_config.get("result_cache_size", 4096),
+        embedding_cache_size=cache_config.get("embedding_cache_size", 4096),
+        ttl_seconds=cache_config.get("ttl_seconds"),
+    )
@@ -37,7 +37,8 @@ def extract_sections(text):
     ]
     pattern_parts = []
     for keyword in section_keywords:
-        pattern_parts.append(f"^(?:\\s*[-*•]?\\s*)({keyword.replace(' ', r'\\s+')})(?:\\s*:|\\s*\\n)")
+        keyword_pattern = keyword.replace(' ', r'\s+')  # Backslashes are not allowed in f-string expressions before Python 3.12
+        pattern_parts.append(f"^(?:\\s*[-*•]?\\s*)({keyword_pattern})(?:\\s*:|\\s*\\n)")
     regex_pattern = re.compile("|".join(pattern_parts), re.IGNORECASE | re.MULTILINE)
 
     last_match_end = 0
@@ -44,7 +44,8 @@ def extract_sections(text):
     for keyword in section_keywords:
         # Allow for keyword to be followed by a colon, or just a newline.
         # Capture the keyword itself to use as dict key.
-        pattern_parts.append(f"^(?:\\s*[-*•]?\\s*)({keyword.replace(' ', r'\\s+')})(?:\\s*:|\\s*\\n)")
+        keyword_pattern = keyword.replace(' ', r'\s+')  # Backslashes are not allowed in f-string expressions before Python 3.12
+        pattern_parts.append(f"^(?:\\s*[-*•]?\\s*)({keyword_pattern})(?:\\s*:|\\s*\\n)")
     
     regex_pattern = re.compile("|".join(pattern_parts), re.IGNORECASE | re.MULTILINE)
 
@@ -6,64 +6,48 @@ import numpy as np
 # import faiss
 
 # Import functions from other files in the src directory
-from utils.resume_parser import parse_resume_data
-from career_pivot_page import load_predictor, extract_job_title_and_description
+from resume_parsing.resume_parser import parse_resume_data
+from career_pivot_page import load_predictor, extract_job_title_and_description, show_predictor_stats, DEFAULT_SERVE_CONFIG
 
-def generate_suggestions_from_text(model, index, next_jobs_data, query_text, top_n=5):
+def generate_suggestions_from_text(label_predictor, query_text, top_n=5):
     """
     Generates suggestions based on a query text.
     This is similar to the logic in career_pivot_page but generalized.
+    Repeated queries are answered from the predictor's query cache, if configured.
     """
-    if not query_text or not model or index is None or next_jobs_data is None:
+    if not query_text or label_predictor is None:
         return []
-        
-    input_embedding = model.encode([query_text])
-    input_embedding = input_embedding / np.linalg.norm(input_embedding, axis=1, keepdims=True)
-    input_embedding = input_embedding.astype('float32')
 
     try:
-        distances, indices = index.search(input_embedding, top_n)
+        indices, similarities = label_predictor.predict_ids([query_text], top_k=top_n)
     except Exception as e:
-        st.error(f"FAISS search error: {e}. Ensure the index is loaded correctly and compatible.")
+        st.error(f"Prediction error: {e}. Ensure the predictor is loaded correctly.")
         return []
     
     results = []
-    if indices.size > 0 and len(indices[0]) > 0:
-        for i, idx in enumerate(indices[0]):
-            if idx < 0 or idx >= len(next_jobs_data):
-                # This case should ideally not happen if index and data are consistent
-                # print(f"Warning: Index {idx} out of bounds for next_jobs_data (size {len(next_jobs_data)})")
-                continue
-            
-            # In career_pivot_page, 'distances' are used directly as 'confidence'.
-            # For IndexFlatIP (cosine similarity) with normalized vectors, this is correct.
-            # Higher values mean higher similarity.
-            confidence_score = distances[0][i] 
-            
-            raw_job_text = next_jobs_data[idx]
-            job_title, job_desc = extract_job_title_and_description(raw_job_text) # Reusing this
-            results.append({
-                "title": job_title,
-                "description": job_desc,
-                "confidence": confidence_score 
-            })
+    [(found_indices, found_similarities)] = label_predictor.found_results(indices, similarities)
+    for idx, confidence_score in zip(found_indices, found_similarities):
+        raw_job_text = label_predictor.label_texts[idx]
+        job_title, job_desc = extract_job_title_and_description(raw_job_text) # Reusing this
+        results.append({
+            "title": job_title,
+            "description": job_desc,
+            "confidence": confidence_score 
+        })
     return results
 
 
-def run(): # Standardized run function for Streamlit pages
+def run(serve_config=DEFAULT_SERVE_CONFIG): # Standardized run function for Streamlit pages
     st.title("📄 Resume Analyzer & Career Suggester")
     
-    # Load the model, FAISS index, and job data
-    # This uses the cached function from career_pivot_page
+    # Load the predictor (model, transformation and label index)
+    # This uses the cached function from career_pivot_page, shared by all pages
     try:
-        model, faiss_index, next_jobs_data = load_predictor()
+        label_predictor, load_stats = load_predictor(serve_config)
     except Exception as e:
         st.error(f"Failed to load predictor resources: {e}")
-        st.error("Please ensure 'src/next_jobs.npy' and 'src/faiss_index.index' exist and are valid, and that 'sentence-transformers/all-MiniLM-L6-v2' can be downloaded/loaded.")
-        st.warning("The application might not function correctly without these resources.")
-        # Attempt to proceed if only some parts failed, or stop if critical
-        if 'faiss_index' not in locals() or 'next_jobs_data' not in locals():
-             st.stop() # Stop if critical components are missing
+        st.error(f"Please ensure the serving configuration 'config/serve/{serve_config}', its test configuration and the transformation matrix it references exist and are valid.")
+        st.stop() # The predictor is required for all suggestions
 
     st.markdown("""
     Upload your resume (PDF) to extract your experience and skills.
@@ -80,7 +64,7 @@ def run(): # Standardized run function for Streamlit pages
     if uploaded_file is not None:
         if st.session_state.resume_filename != uploaded_file.name:
             with st.spinner("🔬 Analyzing your resume... This may take a moment."):
-                parsed_data = parse_resume_data(uploaded_file) # from src.resume_parser
+                parsed_data = parse_resume_data(uploaded_file) # from src/resume_parsing/resume_parser.py
                 if parsed_data and "error" not in parsed_data:
                     st.session_state.parsed_resume_data = parsed_data
                     st.session_state.resume_filename = uploaded_file.name
@@ -149,7 +133,7 @@ def run(): # Standardized run function for Streamlit pages
                 else:
                     with st.spinner("Finding conventional next steps..."):
                         recommendations = generate_suggestions_from_text(
-                            model, faiss_index, next_jobs_data, query_text_conventional, top_n=3
+                            label_predictor, query_text_conventional, top_n=3,
                         )
                         if recommendations:
                             st.success(f"Here are your Top {len(recommendations)} Conventional Suggestions:")
@@ -192,7 +176,7 @@ def run(): # Standardized run function for Streamlit pages
                 else:
                     with st.spinner("Exploring career pivot options..."):
                         recommendations = generate_suggestions_from_text(
-                            model, faiss_index, next_jobs_data, query_text_pivot, top_n=3 # Pivots often want a few strong ideas
+                            label_predictor, query_text_pivot, top_n=3, # Pivots often want a few strong ideas
                         )
                         if recommendations:
                             st.success(f"Here are your Top {len(recommendations)} Pivot Suggestions:")
@@ -206,4 +190,6 @@ def run(): # Standardized run function for Streamlit pages
     else:
         if uploaded_file is None:
             st.info("👋 Welcome! Please upload your resume (PDF) to get started.")
-        # If upload failed or parsing yielded nothing, message already shown
\ No newline at end of file
+        # If upload failed or parsing yielded nothing, message already shown
+
+    show_predictor_stats(label_predictor, load_stats)
@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+import numpy as np
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from config_utils import load_serve_config
+from data_classes import load_label_vocabulary
+import label_store
+from predictor import build_predictor
+from query_cache import CachedLabelPredictor, load_cached_label_predictor
+
+
+class Overloaded(Exception):
+    """
+    Raised when the request queue of a `MicroBatcher` is full.
+    """
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction requests into batches for `LabelPredictor.predict_ids`.
+
+    The first queued request opens a batch, which is closed once it holds `max_batch_size`
+    requests or `max_wait_ms` have passed. Batches are predicted one at a time in a worker thread,
+    so the event loop keeps accepting requests while the encoder runs. At most `max_queue_size`
+    requests may wait; further requests are rejected (backpressure) instead of queueing unboundedly.
+
+    Attributes:
+        latencies_ms (deque): Queue + prediction latency of the most recent requests.
+        batch_sizes (deque): Sizes of the most recent batches.
+        num_requests (int): Number of completed requests.
+        num_rejected (int): Number of requests rejected because the queue was full.
+    """
+
+    def __init__(self, label_predictor, max_batch_size=64, max_wait_ms=5, max_queue_size=1024, window=10_000):
+        """
+        Args:
+            label_predictor (LabelPredictor): Predictor the batches are sent to.
+            max_batch_size (int): Maximum number of requests per batch.
+            max_wait_ms (float): Maximum time the first request of a batch waits for others.
+            max_queue_size (int): Maximum number of waiting requests.
+            window (int): Number of recent requests / batches the metrics are computed over.
+        """
+        self.label_predictor = label_predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_queue_size = max_queue_size
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.num_requests = 0
+        self.num_rejected = 0
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, text, top_k=10):
+        """
+        Queues one career history and waits for its prediction.
+
+        Returns:
+            tuple:
+                - np.ndarray: Up to `top_k` label ids, most similar first (see `LabelPredictor.found_results`).
+                - np.ndarray: Their similarities.
+
+        Raises:
+            Overloaded: If the queue is full.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, top_k, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.num_rejected += 1
+            raise Overloaded()
+        return await future
+
+    async def __collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def __run(self):
+        while True:
+            batch = await self.__collect_batch()
+            try:
+                await self.__predict_batch(batch)
+            except Exception as error:
+                # Fail the requests of this batch that have no result yet, and keep serving later batches
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+
+    async def __predict_batch(self, batch):
+        texts = [text for text, _, _, _ in batch]
+        top_k = max(k for _, k, _, _ in batch)
+        label_ids, similarities = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.label_predictor.predict_ids(texts, top_k=top_k)
+        )
+        done = time.perf_counter()
+        self.batch_sizes.append(len(batch))
+        for i, (_, k, future, queued) in enumerate(batch):
+            if future.done():
+                # Cancelled, e.g. by a dropped client
+                continue
+            [(found_ids, found_similarities)] = self.label_predictor.found_results(
+                label_ids[i:i + 1, :k], similarities[i:i + 1, :k]
+            )
+            future.set_result((found_ids, found_similarities))
+            self.latencies_ms.append(1000 * (done - queued))
+            self.num_requests += 1
+
+    def metrics(self):
+        latencies = np.asarray(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            "requests": self.num_requests,
+            "rejected": self.num_rejected,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "latency_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "mean_batch_size": round(float(np.mean(self.batch_sizes)), 2) if self.batch_sizes else 0.0,
+        }
+
+
+def create_app(predictor, server_config):
+    """
+    Creates the Starlette app serving a Predictor.
+
+    Endpoints:
+        - POST /predict: `{"career_history": str, "top_k": int}` -> predicted occupations and similarities.
+        - GET /metrics: request counts, p50/p99 latency and mean batch size of the micro-batcher,
+          and the hit rates of the query cache if it is enabled.
+        - GET /health: liveness check.
+
+    Args:
+        predictor (Predictor): Predictor loaded once for all requests.
+        server_config (dict): `server` section of the serving configuration.
+
+    Returns:
+        Starlette: The app.
+    """
+    label_predictor = load_cached_label_predictor(predictor.label_predictor, server_config.get("query_cache"))
+    label_texts = label_predictor.label_texts
+    default_top_k = server_config.get("top_k", 10)
+    batcher = MicroBatcher(
+        label_predictor,
+        max_batch_size=server_config.get("max_batch_size", 64),
+        max_wait_ms=server_config.get("max_wait_ms", 5),
+        max_queue_size=server_config.get("max_queue_size", 1024),
+    )
+
+    async def predict(request):
+        try:
+            body = await request.json()
+        except ValueError:
+            return JSONResponse({"error": "request body must be JSON"}, status_code=400)
+        if not isinstance(body, dict) or not isinstance(body.get("career_history"), str):
+            return JSONResponse({"error": "'career_history' must be a string"}, status_code=422)
+        top_k = body.get("top_k", default_top_k)
+        # JSON booleans are ints in Python, and floats such as 2.5 must not be truncated
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= len(label_texts):
+            return JSONResponse({"error": f"'top_k' must be an integer between 1 and {len(label_texts)}"}, status_code=422)
+        try:
+            label_ids, similarities = await batcher.predict(body["career_history"], top_k)
+        except Overloaded:
+            return JSONResponse({"error": "overloaded, retry later"}, status_code=503, headers={"Retry-After": "1"})
+        return JSONResponse({
+            "predictions": [label_texts[i] for i in label_ids],
+            "label_ids": label_ids.tolist(),
+            "similarities": [round(float(s), 6) for s in similarities],
+        })
+
+    async def metrics(request):
+        metrics = batcher.metrics()
+        if isinstance(label_predictor, CachedLabelPredictor):
+            metrics["query_cache"] = label_predictor.stats()
+        return JSONResponse(metrics)
+
+    async def health(request):
+        return JSONResponse({"status": "ok"})
+
+    async def lifespan(app):
+        batcher.start()
+        yield
+        await batcher.stop()
+
+    return Starlette(
+        routes=[
+            Route("/predict", predict, methods=["POST"]),
+            Route("/metrics", metrics, methods=["GET"]),
+            Route("/health", health, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+def main(config):
+    """
+    Main function of the inference server.
+
+    Loads the label vocabulary and the Predictor of the configured test configuration once,
+    then serves it with uvicorn.
+
+    Args:
+        config (dict): Serving configuration (see `config/serve/`).
+    """
+    import uvicorn
+
+    predictor_config = config["predictor"]
+    print("Loading label vocabulary...")
+    label_index_dir = config.get("label_index_dir")
+    if label_index_dir is not None:
+        # The label index holds its own vocabulary, so the dataset is not loaded
+        label_texts = label_store.load_label_texts(label_index_dir)
+    else:
+        label_texts = load_label_vocabulary(
+            predictor_config["data"]["data_type"], cache_dir=predictor_config.get("cache", {}).get("data_dir")
+        )
+    print("Initializing the predictor model...")
+    predictor = build_predictor(predictor_config, label_texts, label_index_dir)
+
+    server_config = config.get("server", {})
+    uvicorn.run(
+        create_app(predictor, server_config), host=server_config.get("host", "0.0.0.0"), port=server_config.get("port", 8000)
+    )
+
+
+if __name__ == "__main__":
+    """
+    Entry point of the inference server.
+    """
+    parser = argparse.ArgumentParser(description="Serve the occupation prediction model over HTTP.")
+    parser.add_argument("--serve_config", type=str, required=True, help="Path to the serving configuration file.")
+    parser.add_argument("--max_batch_size", type=int, default=None, help="Override server.max_batch_size (1 disables batching).")
+    parser.add_argument("--max_wait_ms", type=float, default=None, help="Override server.max_wait_ms.")
+    parser.add_argument("--port", type=int, default=None, help="Override server.port.")
+    parser.add_argument("--no_query_cache", action="store_true", help="Disable server.query_cache, e.g. for load tests.")
+    args = parser.parse_args()
+
+    config = load_serve_config(args.serve_config)
+    for key in ("max_batch_size", "max_wait_ms", "port"):
+        if getattr(args, key) is not None:
+            config.setdefault("server", {})[key] = getattr(args, key)
+    if args.no_query_cache:
+        config.setdefault("server", {})["query_cache"] = None
+    print(json.dumps(config, indent=4))
+
+    main(config)
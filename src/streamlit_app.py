@@ -1,4 +1,5 @@
 # streamlit_app.py
+import argparse
 import streamlit as st
 import career_pivot_page 
 import internships_salary_page 
@@ -8,6 +9,12 @@ import resume_upload_and_predict_page # <-- NEW PAGE
 st.set_page_config(page_title="futurePaths", page_icon="🚀", layout="wide")
 
 
+# Serving configuration of the predictor shared by all pages:
+# streamlit run src/streamlit_app.py -- --serve_config decorte.yaml
+parser = argparse.ArgumentParser()
+parser.add_argument("--serve_config", type=str, default=career_pivot_page.DEFAULT_SERVE_CONFIG)
+args, _ = parser.parse_known_args()
+
 PAGES = {
     "🎯 Career Pivot Suggestions (Manual Input)": career_pivot_page, # Kept existing key for now
     "📄 Resume Analysis & Pathfinding": resume_upload_and_predict_page, # <-- NEW PAGE
@@ -21,6 +28,9 @@ page_to_run = PAGES[selection]
 
 # It's good practice to check if the page module has a 'run' function
 if hasattr(page_to_run, 'run') and callable(getattr(page_to_run, 'run')):
-    page_to_run.run()
+    if page_to_run in (career_pivot_page, resume_upload_and_predict_page):
+        page_to_run.run(serve_config=args.serve_config)
+    else:
+        page_to_run.run()
 else:
     st.error(f"Selected page '{selection}' does not have a callable 'run' function.")
\ No newline at end of file
@@ -1,25 +1,29 @@
 import argparse
 from typing import List, Tuple
 from config_utils import load_test_config
-from predictor import Predictor
+from predictor import Predictor, LinearTransformationModel, build_predictor, configured_transformation_path, low_rank_path
 from data_classes import Data
-from evaluation import mrr, r_at_k
+from evaluation import ranking_metrics
 import json
 import pickle
+import numpy as np
 
 
 def test_model(
     career_histories: List[str],
     predictor: Predictor,
-    ground_truth_next_esco_occupations: List[str],
+    ground_truth_label_ids: np.ndarray,
 ) -> Tuple[dict, List[Tuple[str, List[str]]]]:
     """
     Evaluates the predictor model on test data and computes performance metrics.
 
+    Predictions and ground truths are handled as label ids into the predictor's label texts
+    and only mapped back to label strings for display and saving.
+
     Args:
         career_histories (List[str]): List of career history descriptions.
         predictor (Predictor): The model used for predicting next occupations.
-        ground_truth_next_esco_occupations (List[str]): List of ground truth ESCO occupations.
+        ground_truth_label_ids (np.ndarray): (n,) int array of ground truth ESCO occupation ids.
 
     Returns:
         Tuple[dict, List[Tuple[str, List[str]]]]:
@@ -27,31 +31,30 @@ def test_model(
             - A list of tuples where each tuple contains a ground truth occupation and its top 10 predictions.
     """
     print("Predicting next occupations...")
+    label_texts = predictor.label_predictor.label_texts
 
-    # Predict next occupations for each career history
-    predicted_rank_occupations = predictor.label_predictor.predict(career_histories, top_k=10)
+    # Predict next occupation ids for each career history
+    predicted_label_ids, similarities = predictor.label_predictor.predict_ids(career_histories, top_k=10)
+    # Found label ids per history, without the padding of approximate indexes
+    found_label_ids = [ids for ids, _ in predictor.label_predictor.found_results(predicted_label_ids, similarities)]
 
     # Structure the predictions
-    predicted = [
-        (ground_truth, predicted_ranks)
-        for ground_truth, predicted_ranks in zip(
-            ground_truth_next_esco_occupations, predicted_rank_occupations
-        )
-    ]
+    predicted = list(zip(ground_truth_label_ids.tolist(), found_label_ids))
 
     # Display sample predictions
     print("\nSample Predictions:")
     for i in range(min(5, len(career_histories))):
         print(f"Test instance {i + 1}:")
         print(f"### Career History:\n{career_histories[i]}")
-        print(f"### Ground Truth Next Occupation:\n{ground_truth_next_esco_occupations[i]}")
-        print(f"### Top 5 Predicted Occupations:\n{predicted_rank_occupations[i][:5]}")
+        print(f"### Ground Truth Next Occupation:\n{label_texts[ground_truth_label_ids[i]]}")
+        print(f"### Top 5 Predicted Occupations:\n{[label_texts[j] for j in found_label_ids[i][:5]]}")
         print("-" * 80)
 
     # Compute evaluation metrics
-    mrr_score = mrr(predicted)
-    r_at_5_score = r_at_k(predicted, k=5)
-    r_at_10_score = r_at_k(predicted, k=10)
+    metrics = ranking_metrics(predicted_label_ids, ground_truth_label_ids, ks=(5, 10))
+    mrr_score = metrics["MRR"]
+    r_at_5_score = metrics["R@5"]
+    r_at_10_score = metrics["R@10"]
 
     print(f"MRR: {mrr_score:.4f}")
     print(f"R@5: {r_at_5_score:.4f}")
@@ -60,8 +63,10 @@ def test_model(
     # Prepare results for saving
     scores = {"MRR": round(mrr_score, 4), "R@5": round(r_at_5_score, 4), "R@10": round(r_at_10_score, 4)}
     
-    # Retain only the top 10 predictions per tuple
-    predicted = [(ground_truth, pred[:10]) for ground_truth, pred in predicted]
+    # Retain only the top 10 predictions per tuple, as label texts
+    predicted = [
+        (label_texts[ground_truth], [label_texts[j] for j in pred[:10]]) for ground_truth, pred in predicted
+    ]
 
     return scores, predicted
 
@@ -83,40 +88,51 @@ def main(config: dict):
 
     # Load test data
     data = Data(
-        config["data"]["data_type"]
+        config["data"]["data_type"],
+        cache_dir=config.get("cache", {}).get("data_dir"),
     )
 
     # Retrieve test pairs
     _, _, test_pairs = data.get_data(stage='evaluation')
     print(f"First test pair: {test_pairs[0]}")
 
-    # Extract career history descriptions and ground truth occupations
+    # Extract career history descriptions and ground truth occupation ids
     career_histories_texts = [exp_doc for exp_doc, _ in test_pairs]
-    ground_truth_next_esco_occupation_texts = [esco_doc for _, esco_doc in test_pairs]
+    ground_truth_label_ids = data.label_ids(test_pairs)
 
-    # Determine the transformation model path
+    # Determine the transformation model path (None without a transformation)
     transformation_method = config["model"]["transformation_method"]
-    transformation_model_path = (
-        config["model"]["transformation_model_path"] if transformation_method == "linear" 
-        else config["model"]["path_neural_model"]
-    )
+    transformation_model_path = configured_transformation_path(config)
 
     # Initialize predictor
     print("Initializing the predictor model...")
-    predictor = Predictor(
-        embedding_model_path=config["model"]["embedding_model_path"],
-        label_texts=data.labels,
-        transformation_model_path=transformation_model_path,
-        transformation_method=transformation_method,
-    )
+    predictor = build_predictor(config, data.labels, embedding_cache_dir=config.get("cache", {}).get("embedding_dir"))
 
     # Evaluate the model
     print("Evaluating model performance...")
-    scores, predictions = test_model(career_histories_texts, predictor, ground_truth_next_esco_occupation_texts)
+    scores, predictions = test_model(career_histories_texts, predictor, ground_truth_label_ids)
+
+    # Compare the configured (approximate) label index with an exact scan
+    if config.get("index", {}).get("check_recall", False):
+        query_embeddings = predictor.label_predictor.embed(career_histories_texts)
+        recall = predictor.label_predictor.label_space.recall_vs_flat(query_embeddings, top_k=10)
+        print(f"Recall@10 of the {config['index']['type']} index vs. exact search: {recall:.4f}")
+        scores["index_recall@10_vs_flat"] = round(recall, 4)
+
+    # Evaluate the rank-r factorizations of T written by linear_transformation.py
+    rank_sweep = config["model"].get("rank_sweep", [])
+    if rank_sweep and transformation_method == "linear":
+        scores["rank_sweep"] = {}
+        for rank in rank_sweep:
+            path = low_rank_path(transformation_model_path, rank)
+            print(f"Evaluating rank {rank} transformation from: {path}")
+            predictor.label_predictor.set_transformation_model(LinearTransformationModel(path))
+            scores["rank_sweep"][rank], _ = test_model(career_histories_texts, predictor, ground_truth_label_ids)
 
     # Construct file paths for results
-    path_scores = f"{config['output']['path_scores']}_{transformation_method}.json"
-    path_predictions = f"{config['output']['path_predictions']}_{transformation_method}.pkl"
+    output_suffix = transformation_method if transformation_method is not None else "no_transformation"
+    path_scores = f"{config['output']['path_scores']}_{output_suffix}.json"
+    path_predictions = f"{config['output']['path_predictions']}_{output_suffix}.pkl"
 
     print(f"Saving evaluation scores to: {path_scores}")
     print(f"Saving predictions to: {path_predictions}")
@@ -1,13 +1,50 @@
 from datasets import load_dataset
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from tqdm import tqdm
 from pathlib import Path
+import os
+import json
+from collections import Counter
+from itertools import islice
+from esco_lookup import load_esco_lookup
 
 SEP_TOKEN = "<SEP>"  # Separator token, used to separate sentences in a document pair. This can be model specific.
 DATA_PATH = Path("./data/")
+SPLITS = ("train", "validation", "test")
 
 
 
+ESCO_TITLE_REPLACEMENTS = {
+    'ICT security engineer': 'cyber incident responder',
+    'ict security engineer': 'cyber incident responder',
+    'care at home worker': 'care home worker',
+    'residential care home worker': 'care home worker',
+    'ICT security manager': 'cybersecurity risk manager',
+    'ict security manager': 'cybersecurity risk manager',
+    'care at hmoe worker': 'care home worker',
+    'handyman': 'handyperson',
+    'corporate banking manager': 'corporate banking adviser',
+}
+
+ESCO_URI_REPLACEMENTS = {
+    'http://data.europa.eu/esco/occupation/81309031-dad2-4a7a-bde6-7f6e518f89ff': 
+    'http://data.europa.eu/esco/occupation/f4525ed8-54eb-4a3b-90db-55cc01b0d9fd'
+}
+
+NUM_EXPERIENCE_COLUMNS = 16  # Number of title/description/ESCO column groups in the Decorte dataset
+ESCO_NORMALIZATION_VERSION = 1  # Bump when the replacements change, to invalidate cached normalized datasets
+
+
+def _normalize_esco_title(title):
+    if pd.isna(title):
+        return title
+    processed_title = title.strip().lower()
+    return ESCO_TITLE_REPLACEMENTS.get(processed_title, processed_title)
+
+
 def replace_esco_titles(example, i):
     """
     Replaces specific ESCO job titles with alternative titles for consistency.
@@ -19,35 +56,55 @@ def replace_esco_titles(example, i):
     Returns:
         dict: Updated dictionary with the replaced ESCO title and URI.
     """
-    replacements_title = {
-        'ICT security engineer': 'cyber incident responder',
-        'ict security engineer': 'cyber incident responder',
-        'care at home worker': 'care home worker',
-        'residential care home worker': 'care home worker',
-        'ICT security manager': 'cybersecurity risk manager',
-        'ict security manager': 'cybersecurity risk manager',
-        'care at hmoe worker': 'care home worker',
-        'handyman': 'handyperson',
-        'corporate banking manager': 'corporate banking adviser',
-    }
+    example[f'ESCO_title_{i}'] = _normalize_esco_title(example[f'ESCO_title_{i}'])
+    example[f'ESCO_uri_{i}'] = ESCO_URI_REPLACEMENTS.get(example[f'ESCO_uri_{i}'], example[f'ESCO_uri_{i}'])
+    
+    return example
 
-    original_title = example[f'ESCO_title_{i}']
-    if not pd.isna(original_title):
-        processed_title = original_title.strip().lower()
-        final_title = replacements_title.get(processed_title, processed_title)
-    else:
-        final_title = original_title
 
-    example[f'ESCO_title_{i}'] = final_title
+def normalize_esco_columns(batch):
+    """
+    Batched version of `replace_esco_titles` that normalizes all ESCO title and URI columns at once.
 
-    replacements_uri = {
-        'http://data.europa.eu/esco/occupation/81309031-dad2-4a7a-bde6-7f6e518f89ff': 
-        'http://data.europa.eu/esco/occupation/f4525ed8-54eb-4a3b-90db-55cc01b0d9fd'
-    }
-    
-    example[f'ESCO_uri_{i}'] = replacements_uri.get(example[f'ESCO_uri_{i}'], example[f'ESCO_uri_{i}'])
-    
-    return example
+    Args:
+        batch (dict): A batch of dataset rows, mapping column names to lists of values.
+
+    Returns:
+        dict: The normalized `ESCO_title_{i}` and `ESCO_uri_{i}` columns.
+    """
+    normalized = {}
+    for i in range(NUM_EXPERIENCE_COLUMNS):
+        normalized[f'ESCO_title_{i}'] = [_normalize_esco_title(title) for title in batch[f'ESCO_title_{i}']]
+        normalized[f'ESCO_uri_{i}'] = [ESCO_URI_REPLACEMENTS.get(uri, uri) for uri in batch[f'ESCO_uri_{i}']]
+    return normalized
+
+
+def load_normalized_decorte_dataset(num_proc=None):
+    """
+    Loads the Decorte dataset with normalized ESCO titles and URIs.
+
+    All ESCO columns are normalized in a single batched pass per split. The result is fingerprinted
+    from the source split and `ESCO_NORMALIZATION_VERSION`, so later runs reuse the cached Arrow output.
+
+    Args:
+        num_proc (int, optional): Number of processes used for the normalization. Defaults to `os.cpu_count()`.
+
+    Returns:
+        DatasetDict: The normalized dataset.
+    """
+    dataset = load_dataset("jensjorisdecorte/anonymous-working-histories")
+    # The output fingerprint does not depend on num_proc, so the cached result is reused with any process count
+    num_proc = num_proc if num_proc is not None else os.cpu_count()
+    for split in SPLITS:
+        dataset[split] = dataset[split].map(
+            normalize_esco_columns,
+            batched=True,
+            num_proc=num_proc,
+            load_from_cache_file=True,
+            new_fingerprint=f"{dataset[split]._fingerprint}-esco-normalized-v{ESCO_NORMALIZATION_VERSION}",
+            desc=f"Normalizing ESCO titles ({split})",
+        )
+    return dataset
 
 
 def subspans(lst):
@@ -65,9 +122,80 @@ def subspans(lst):
             yield lst[j:j + i]
 
 
-def load_prepare_karrierewege(minus_last, consider_all_subspans_of_len_at_least_2=False, language='en'):
+def num_subspans(n):
     """
-    Loads and processes the Karrierewege dataset for training.
+    Returns the number of subspans of length at least 2 of a list with `n` elements.
+
+    Args:
+        n (int): Length of the list.
+
+    Returns:
+        int: Number of subspans yielded by `subspans` for such a list.
+    """
+    return n * (n - 1) // 2
+
+
+class PairStream:
+    """
+    A re-iterable, lazily generated sequence of (doc_1, doc_2) pairs of one dataset split.
+
+    Every iteration rebuilds the pairs from the underlying dataset, so only the pair currently
+    being consumed is held in memory.
+
+    Attributes:
+        length_hint (int, optional): Expected number of pairs, if known.
+        fingerprint (str, optional): Fingerprint of the source data the pairs are built from.
+    """
+
+    def __init__(self, generate, length_hint=None, fingerprint=None):
+        """
+        Args:
+            generate (Callable[[], Iterator[tuple]]): Function returning a fresh iterator over the pairs.
+            length_hint (int, optional): Expected number of pairs, if known.
+            fingerprint (str, optional): Fingerprint of the source data the pairs are built from.
+        """
+        self._generate = generate
+        self.length_hint = length_hint
+        self.fingerprint = fingerprint
+
+    def __iter__(self):
+        return self._generate()
+
+    def __length_hint__(self):
+        return self.length_hint or 0
+
+
+def format_experiences(table, columns, prefix):
+    """
+    Formats the experiences of an Arrow table as f"{prefix}{title} \\n description: {description}" in bulk.
+
+    Missing values are rendered as "None", like a formatted Python `None`.
+
+    Args:
+        table (pyarrow.Table): Rows of the Karrierewege dataset.
+        columns (tuple): Names of the title and the description column.
+        prefix (str): Text in front of the title, e.g. "role: ".
+
+    Returns:
+        List[str]: One formatted experience per row.
+    """
+    # Columns may be stored as string or large_string; all kernel inputs need one type
+    title_column, description_column = columns
+    formatted = pc.binary_join_element_wise(
+        pa.scalar(prefix, pa.large_string()),
+        table[title_column].cast(pa.large_string()),
+        pa.scalar(" \n description: ", pa.large_string()),
+        table[description_column].cast(pa.large_string()),
+        pa.scalar("", pa.large_string()),
+        null_handling="replace",
+        null_replacement="None",
+    )
+    return formatted.to_pylist()
+
+
+def stream_prepare_karrierewege(minus_last, consider_all_subspans_of_len_at_least_2=False, language='en'):
+    """
+    Loads the Karrierewege dataset and returns lazily generated document pairs per split.
 
     Args:
         minus_last (bool): If True, removes the last experience in subspans.
@@ -75,174 +203,146 @@ def load_prepare_karrierewege(minus_last, consider_all_subspans_of_len_at_least_
         language (str, optional): Specifies the dataset language variant. Defaults to 'en'.
 
     Returns:
-        tuple: (train_pairs, val_pairs, test_pairs) - Prepared document pairs.
+        dict: Maps 'train', 'validation' and 'test' to a `PairStream` of (doc_1, doc_2) pairs.
     """
 
-    def create_pairs_from_dataset(_dataset):
-        document_pairs = []
-        _dataset_df = _dataset.to_pandas()
-        grouped = _dataset_df.groupby('_id')
-        print('len grouped', len(grouped))
-
-        # Iterate over the dataset it is da df and each row has a title, description ...
-        for _id, group in tqdm(grouped):
-            #sort by 'experience_order' ascending
-            group = group.sort_values('experience_order')
-            #differ by language, the same for German or other ESCO language variants possible
-            if language == 'en' or language == 'esco_100k':
-                titles = group['preferredLabel_en'].tolist()
-                descriptions = group['description_en'].tolist()
-            elif language == 'en_free':
-                titles = group['new_job_title_en_occ'].tolist()
-                descriptions = group['new_job_description_en_occ'].tolist()
-                titles_esco = group['preferredLabel_en'].tolist()
-                descriptions_esco = group['description_en'].tolist()
-            elif language == 'en_free_cp':
-                titles = group['new_job_title_en_cp'].tolist()
-                descriptions = group['new_job_description_en_cp'].tolist()
-                titles_esco = group['preferredLabel_en'].tolist()
-                descriptions_esco = group['description_en'].tolist()
-            number_of_experiences = len(group)
-
-            all_experience_indexes = list(range(number_of_experiences))
-
-                
-            # Create document pair
-            if language == 'en' or language == 'de' or language == 'esco_100k':
-                if consider_all_subspans_of_len_at_least_2 and number_of_experiences > 1:
-                    _title_subspans = list(subspans(titles))
-                    _description_subspans = list(subspans(descriptions))
-                    _experience_indexes_subspans = list(subspans(all_experience_indexes))
-
-                else:
-                    _title_subspans = [titles]
-                    _description_subspans = [descriptions]
-                    _experience_indexes_subspans = [all_experience_indexes]
+    span_discount = 1 if minus_last else 0
+
+    def subspan_offsets(number_of_experiences):
+        # (start, end) offsets of the subspans of one career, relative to its first experience
+        if consider_all_subspans_of_len_at_least_2 and number_of_experiences > 1:
+            spans = subspans(range(number_of_experiences))
+        else:
+            spans = [range(number_of_experiences)]
+        return np.array([(span[0], span[-1] + 1) for span in spans], dtype=np.int64).reshape(-1, 2)
+
+    # Columns of the history entries and of the (ESCO) targets,
+    #differ by language, the same for German or other ESCO language variants possible
+    if language == 'en' or language == 'esco_100k':
+        history_columns = ('preferredLabel_en', 'description_en')
+    elif language == 'en_free':
+        history_columns = ('new_job_title_en_occ', 'new_job_description_en_occ')
+    elif language == 'en_free_cp':
+        history_columns = ('new_job_title_en_cp', 'new_job_description_en_cp')
+    target_columns = ('preferredLabel_en', 'description_en')
+
+    def iter_pairs_from_dataset(_dataset, careers_per_chunk=10_000):
+        if len(_dataset) == 0:
+            return
+
+        # One global stable sort of the (small) key columns replaces grouping by '_id' and sorting every
+        # group by 'experience_order'; the text columns are only read for the careers of the current chunk
+        keys = _dataset.select_columns(['_id', 'experience_order']).to_pandas()
+        order = keys.sort_values(['_id', 'experience_order'], kind='stable').index.to_numpy().copy()
+        career_ids = keys['_id'].to_numpy()[order]
+        experience_order = keys['experience_order'].to_numpy()
+        del keys
+        career_starts = np.flatnonzero(np.r_[True, career_ids[1:] != career_ids[:-1]])
+        career_lengths = np.diff(np.r_[career_starts, len(career_ids)])
+        print('len grouped', len(career_starts))
+
+        # The per-group `sort_values` this replaces used pandas' default, unstable quicksort. Careers with
+        # tied experience orders are sorted the same way, so their ties keep the order of that sort
+        tied = (career_ids[1:] == career_ids[:-1]) & (experience_order[order[1:]] == experience_order[order[:-1]])
+        if tied.any():
+            career_of_row = np.repeat(np.arange(len(career_starts)), career_lengths)
+            for career in np.unique(career_of_row[1:][tied]).tolist():
+                start, end = career_starts[career], career_starts[career] + career_lengths[career]
+                group_rows = np.sort(order[start:end])  # rows of the career in dataset order, as grouped by '_id'
+                order[start:end] = group_rows[np.argsort(experience_order[group_rows], kind='quicksort')]
+        del career_ids, experience_order
+
+        # (start, end) offsets of the subspans of a career, per career length
+        offsets_per_length = {n: subspan_offsets(n) for n in np.unique(career_lengths).tolist()}
+        text_dataset = _dataset.select_columns(sorted(set(history_columns + target_columns))).with_format("arrow")
+
+        with tqdm(total=len(career_starts), unit='career') as progress:
+            for chunk_start in range(0, len(career_starts), careers_per_chunk):
+                starts = career_starts[chunk_start:chunk_start + careers_per_chunk]
+                lengths = career_lengths[chunk_start:chunk_start + careers_per_chunk]
+                row_start, row_end = starts[0], starts[-1] + lengths[-1]
+                rows = text_dataset[order[row_start:row_end].tolist()]
+
+                # Every experience of the chunk is formatted once, in bulk, as history entry and as (ESCO) target
+                experiences = format_experiences(rows, history_columns, "role: ")
+                targets = format_experiences(rows, target_columns, "esco role: ")
+
+                for career_start, career_length in zip((starts - row_start).tolist(), lengths.tolist()):
+                    for span_start, span_end in (offsets_per_length[career_length] + career_start).tolist():
+                        # doc_2: the (ESCO) title and description from the last experience in the subspan
+                        doc_2 = targets[span_end - 1]
+
+                        # doc_1: current career history subspan
+                        doc_1 = SEP_TOKEN.join(experiences[span_start:span_end - span_discount])
+
+                        yield (doc_1, doc_2)
+                progress.update(len(starts))
+
+    def count_pairs(_dataset):
+        experiences_per_career = Counter(_dataset['_id']).values()
+        if not consider_all_subspans_of_len_at_least_2:
+            return len(experiences_per_career)
+        return sum(num_subspans(n) if n > 1 else 1 for n in experiences_per_career)
 
-                
-                for _titles, _descriptions, _experience_indexes in zip(_title_subspans, _description_subspans, _experience_indexes_subspans):
-
-                    if minus_last:
-                        span_discount = 1
-                    else:
-                        span_discount = 0
-
-                    _num_experiences_subspan = len(_titles)
-                    # doc_2: the title and description from the last experience in the subspan
-                    doc_2 = f"esco role: {titles[_experience_indexes[-1]]} \n description: {descriptions[_experience_indexes[-1]]}"
-
-                    # doc_1: current career history subspan
-                    doc_1 = SEP_TOKEN.join(
-                        [
-                            f"role: {_titles[i]} \n description: {_descriptions[i]}"
-                            for i in range(_num_experiences_subspan-span_discount)
-                        ]
-                    )
-    
-          
-                    # Add document pair to list
-                    document_pairs.append((doc_1, doc_2))
-            
-            elif language=='en_free' or language == 'de_free' or language == 'en_free_cp':
-                if consider_all_subspans_of_len_at_least_2 and number_of_experiences > 1:
-                    _title_subspans = list(subspans(titles))
-                    _description_subspans = list(subspans(descriptions))
-                    _ESCO_title_subspans = list(subspans(titles_esco))
-                    _ESCO_uri_subspans = list(subspans(descriptions_esco))
-                    _experience_indexes_subspans = list(subspans(all_experience_indexes))
-                else:
-                    _title_subspans = [titles]
-                    _description_subspans = [descriptions]
-                    _ESCO_title_subspans = [titles_esco]
-                    _ESCO_uri_subspans = [descriptions_esco]
-                    _experience_indexes_subspans = [all_experience_indexes]
-                
-                for _titles, _descriptions, _titles_esco, _descriptions_esco, _experience_indexes in zip(_title_subspans, _description_subspans, _ESCO_title_subspans, _ESCO_uri_subspans, _experience_indexes_subspans):
-
-                    _num_experiences_subspan = len(_titles)
-                    if minus_last:
-                        span_discount = 1
-                    else:
-                        span_discount = 0
-
-                    doc_2 = f"esco role: {titles_esco[_experience_indexes[-1]]} \n description: {descriptions_esco[_experience_indexes[-1]]}"
-
-                    # doc_1: current career history subspan
-                    doc_1 = SEP_TOKEN.join(
-                        [
-                            f"role: {_titles[i]} \n description: {_descriptions[i]}"
-                            for i in range(_num_experiences_subspan-span_discount)
-                        ]
-                    )
-                          
-                    # Add document pair to list
-                    document_pairs.append((doc_1,doc_2))
-                    
-        return document_pairs
-    
-  
     # Load the dataset
     if language == 'en_free' or language == 'de_free' or language == 'esco_100k' or language == 'en_free_cp' or language == 'de_free_cp':
         dataset = load_dataset("ElenaSenger/Karrierewege_plus")
     elif language == 'en':
         dataset = load_dataset("ElenaSenger/Karrierewege")
 
-    train_pairs = create_pairs_from_dataset(dataset["train"])
-    val_pairs = create_pairs_from_dataset(dataset["validation"])
-    test_pairs = create_pairs_from_dataset(dataset["test"])
-
-
-    return train_pairs, val_pairs, test_pairs
+    return {
+        split: PairStream(
+            lambda _dataset=dataset[split]: iter_pairs_from_dataset(_dataset),
+            length_hint=count_pairs(dataset[split]),
+            fingerprint=dataset[split]._fingerprint,
+        )
+        for split in SPLITS
+    }
 
 
-def load_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len=16):
+def load_prepare_karrierewege(minus_last, consider_all_subspans_of_len_at_least_2=False, language='en'):
     """
-    Loads and processes the Decorte dataset for training.
+    Loads and processes the Karrierewege dataset for training.
 
     Args:
         minus_last (bool): If True, removes the last experience in subspans.
         consider_all_subspans_of_len_at_least_2 (bool, optional): If True, considers all subspans with at least 2 elements. Defaults to False.
-        verbose (bool, optional): If True, prints additional information. Defaults to False.
-        max_len (int, optional): Maximum length of subspans. Defaults to 16.
+        language (str, optional): Specifies the dataset language variant. Defaults to 'en'.
 
     Returns:
         tuple: (train_pairs, val_pairs, test_pairs) - Prepared document pairs.
     """
+    streams = stream_prepare_karrierewege(minus_last, consider_all_subspans_of_len_at_least_2, language)
+    train_pairs, val_pairs, test_pairs = (list(streams[split]) for split in SPLITS)
 
+    return train_pairs, val_pairs, test_pairs
 
-    # Load the dataset
-    dataset = load_dataset("jensjorisdecorte/anonymous-working-histories")
 
-    # Apply replacements to all columns in the dataset beginning with ESCO_title
-    for i in range(16):
-        dataset['train'] = dataset['train'].map(lambda example: replace_esco_titles(example, i))
-        dataset['validation'] = dataset['validation'].map(lambda example: replace_esco_titles(example, i))
-        dataset['test'] = dataset['test'].map(lambda example: replace_esco_titles(example, i))
+def stream_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len=16, num_proc=None):
+    """
+    Loads the Decorte dataset and returns lazily generated document pairs per split.
+
+    Args:
+        minus_last (bool): If True, removes the last experience in subspans.
+        consider_all_subspans_of_len_at_least_2 (bool, optional): If True, considers all subspans with at least 2 elements. Defaults to False.
+        verbose (bool, optional): If True, prints additional information. Defaults to False.
+        max_len (int, optional): Maximum length of subspans. Defaults to 16.
+        num_proc (int, optional): Number of processes used to normalize the ESCO columns. Defaults to `os.cpu_count()`.
 
-    # Load descriptions for ESCO occupations
-    ESCO_occupations = pd.read_csv(DATA_PATH / "occupations_en.csv")
+    Returns:
+        dict: Maps 'train', 'validation' and 'test' to a `PairStream` of (doc_1, doc_2) pairs.
+    """
 
 
-    # Create dictionary for ESCO occupations
-    ESCO_occupations_dict = ESCO_occupations.set_index("conceptUri")[
-        "description"
-    ].to_dict()
+    # Load the dataset and apply replacements to all columns in the dataset beginning with ESCO_title
+    dataset = load_normalized_decorte_dataset(num_proc=num_proc)
 
-    # Add to ESCO_occupations_dict keys which are the names of the occupations, and as value the description of the occupation
-    ESCO_occupations_dict.update(
-        ESCO_occupations.set_index("preferredLabel")["description"].to_dict()
-    )
+    # Open the prebuilt lookup from ESCO URIs, preferred labels and alt labels to occupation descriptions
+    ESCO_occupations_dict = load_esco_lookup(DATA_PATH / "occupations_en.csv")
 
-    # For every occupation, go through the altLabels and add them to the dictionary
-    for index, row in ESCO_occupations.iterrows():
-        # If there are no altLabels, skip
-        if pd.isna(row["altLabels"]):
-            continue
-        for alt_label in row["altLabels"].split("\n"):
-            ESCO_occupations_dict[alt_label] = row["description"]
+    span_discount = 1 if minus_last else 0
 
-    def create_pairs_from_dataset(_dataset):
-        document_pairs = []
+    def iter_pairs_from_dataset(_dataset):
         # Iterate over the dataset
         for example in tqdm(_dataset):
 
@@ -286,34 +386,18 @@ def load_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2=Fal
             #ESCO_titles withouth additional spaces
             ESCO_titles = [title.strip() for title in ESCO_titles]
 
+            # Subspans are generated over experience indexes only, titles and descriptions are looked up per span
             if consider_all_subspans_of_len_at_least_2 and example["number_of_experiences"] > 1:
-                _title_subspans = list(subspans(titles))
-                _description_subspans = list(subspans(descriptions))
-                _ESCO_title_subspans = list(subspans(ESCO_titles))
-                _ESCO_uri_subspans = list(subspans(ESCO_uris))
-                _experience_indexes_subspans = list(subspans(all_experience_indexes))
                 # keep only the last jobs in length max_len
-                if len(_title_subspans) > max_len:
-                    _title_subspans = _title_subspans[-max_len:]
-                    _description_subspans = _description_subspans[-max_len:]
-                    _ESCO_title_subspans = _ESCO_title_subspans[-max_len:]
-                    _ESCO_uri_subspans = _ESCO_uri_subspans[-max_len:]
-                    _experience_indexes_subspans = _experience_indexes_subspans[-max_len:]
+                _experience_indexes_subspans = islice(
+                    subspans(all_experience_indexes),
+                    max(num_subspans(example["number_of_experiences"]) - max_len, 0),
+                    None,
+                )
             else:
-                _title_subspans = [titles]
-                _description_subspans = [descriptions]
-                _ESCO_title_subspans = [ESCO_titles]
-                _ESCO_uri_subspans = [ESCO_uris]
                 _experience_indexes_subspans = [all_experience_indexes]
             
-            for _titles, _descriptions, _ESCO_titles, _ESCO_uris, _experience_indexes in zip(_title_subspans, _description_subspans, _ESCO_title_subspans, _ESCO_uri_subspans, _experience_indexes_subspans):
-
-                _num_experiences_subspan = len(_titles)
-                if minus_last:
-                    span_discount = 1
-                else:
-                    span_discount = 0
-                
+            for _experience_indexes in _experience_indexes_subspans:
 
                 # As doc_2 the esco role and description of the last job in the career history
                 doc_2 = ESCO_experience(
@@ -326,73 +410,75 @@ def load_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2=Fal
                 # As doc_1 set the current career history subspan
                 doc_1 = SEP_TOKEN.join(
                     [
-                        free_text_experience(_titles[i], _descriptions[i])
-                        for i in range(_num_experiences_subspan-span_discount)
+                        free_text_experience(titles[i], descriptions[i])
+                        for i in _experience_indexes[:len(_experience_indexes)-span_discount]
                     ]
                 )
 
 
-                # Add document pair to list
-                document_pairs.append((doc_1,doc_2))
+                yield (doc_1, doc_2)
 
-        return document_pairs
+    def count_pairs(_dataset):
+        if not consider_all_subspans_of_len_at_least_2:
+            return len(_dataset)
+        return sum(
+            min(num_subspans(n), max_len) if n > 1 else 1 for n in _dataset["number_of_experiences"]
+        )
 
-    train_pairs = create_pairs_from_dataset(dataset["train"])
-    val_pairs = create_pairs_from_dataset(dataset["validation"])
-    test_pairs = create_pairs_from_dataset(dataset["test"])
+    return {
+        split: PairStream(
+            lambda _dataset=dataset[split]: iter_pairs_from_dataset(_dataset),
+            length_hint=count_pairs(dataset[split]),
+            fingerprint=json.dumps([dataset[split]._fingerprint, ESCO_occupations_dict.source_fingerprint]),
+        )
+        for split in SPLITS
+    }
 
-    return train_pairs, val_pairs, test_pairs
 
-def load_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len = 16):
+def load_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len=16, num_proc=None):
     """
-    Loads and processes the Decorte ESCO dataset for training.
+    Loads and processes the Decorte dataset for training.
 
     Args:
         minus_last (bool): If True, removes the last experience in subspans.
         consider_all_subspans_of_len_at_least_2 (bool, optional): If True, considers all subspans with at least 2 elements. Defaults to False.
         verbose (bool, optional): If True, prints additional information. Defaults to False.
         max_len (int, optional): Maximum length of subspans. Defaults to 16.
+        num_proc (int, optional): Number of processes used to normalize the ESCO columns. Defaults to `os.cpu_count()`.
 
     Returns:
         tuple: (train_pairs, val_pairs, test_pairs) - Prepared document pairs.
     """
+    streams = stream_prepare_decorte(minus_last, consider_all_subspans_of_len_at_least_2, verbose, max_len, num_proc)
+    train_pairs, val_pairs, test_pairs = (list(streams[split]) for split in SPLITS)
 
+    return train_pairs, val_pairs, test_pairs
 
-    # Load the dataset
-    dataset = load_dataset("jensjorisdecorte/anonymous-working-histories")
-
-
-    # Apply replacements to all columns in the dataset beginning with ESCO_title
-    for i in range(16):
-        dataset['train'] = dataset['train'].map(lambda example: replace_esco_titles(example, i))
-        dataset['validation'] = dataset['validation'].map(lambda example: replace_esco_titles(example, i))
-        dataset['test'] = dataset['test'].map(lambda example: replace_esco_titles(example, i))
+def stream_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len = 16, num_proc=None):
+    """
+    Loads the Decorte ESCO dataset and returns lazily generated document pairs per split.
 
-    # Load descriptions for ESCO occupations
-    ESCO_occupations = pd.read_csv(DATA_PATH / "occupations_en.csv")
+    Args:
+        minus_last (bool): If True, removes the last experience in subspans.
+        consider_all_subspans_of_len_at_least_2 (bool, optional): If True, considers all subspans with at least 2 elements. Defaults to False.
+        verbose (bool, optional): If True, prints additional information. Defaults to False.
+        max_len (int, optional): Maximum length of subspans. Defaults to 16.
+        num_proc (int, optional): Number of processes used to normalize the ESCO columns. Defaults to `os.cpu_count()`.
 
+    Returns:
+        dict: Maps 'train', 'validation' and 'test' to a `PairStream` of (doc_1, doc_2) pairs.
+    """
 
 
-    # Create dictionary for ESCO occupations
-    ESCO_occupations_dict = ESCO_occupations.set_index("conceptUri")[
-        "description"
-    ].to_dict()
+    # Load the dataset and apply replacements to all columns in the dataset beginning with ESCO_title
+    dataset = load_normalized_decorte_dataset(num_proc=num_proc)
 
-    # Add to ESCO_occupations_dict keys which are the names of the occupations, and as value the description of the occupation
-    ESCO_occupations_dict.update(
-        ESCO_occupations.set_index("preferredLabel")["description"].to_dict()
-    )
+    # Open the prebuilt lookup from ESCO URIs, preferred labels and alt labels to occupation descriptions
+    ESCO_occupations_dict = load_esco_lookup(DATA_PATH / "occupations_en.csv")
 
-    # For every occupation, go through the altLabels and add them to the dictionary
-    for index, row in ESCO_occupations.iterrows():
-        # If there are no altLabels, skip
-        if pd.isna(row["altLabels"]):
-            continue
-        for alt_label in row["altLabels"].split("\n"):
-            ESCO_occupations_dict[alt_label] = row["description"]
+    span_discount = 1 if minus_last else 0
 
-    def create_pairs_from_dataset(_dataset):
-        document_pairs = []
+    def iter_pairs_from_dataset(_dataset):
         # Iterate over the dataset
         for example in tqdm(_dataset):
 
@@ -433,34 +519,20 @@ def load_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_
                 
             all_experience_indexes = list(range(example["number_of_experiences"]))
 
+            # Subspans are generated over experience indexes only, titles and descriptions are looked up per span
             if consider_all_subspans_of_len_at_least_2 and example["number_of_experiences"] > 1:
-                _title_subspans = list(subspans(titles))
-                _description_subspans = list(subspans(descriptions))
-                _ESCO_title_subspans = list(subspans(ESCO_titles))
-                _ESCO_uri_subspans = list(subspans(ESCO_uris))
-                _experience_indexes_subspans = list(subspans(all_experience_indexes))
                 # keep only the last jobs in length max_len
-                if len(_title_subspans) > max_len:
-                    _title_subspans = _title_subspans[-max_len:]
-                    _description_subspans = _description_subspans[-max_len:]
-                    _ESCO_title_subspans = _ESCO_title_subspans[-max_len:]
-                    _ESCO_uri_subspans = _ESCO_uri_subspans[-max_len:]
-                    _experience_indexes_subspans = _experience_indexes_subspans[-max_len:]
+                _experience_indexes_subspans = islice(
+                    subspans(all_experience_indexes),
+                    max(num_subspans(example["number_of_experiences"]) - max_len, 0),
+                    None,
+                )
             else:
-                _title_subspans = [titles]
-                _description_subspans = [descriptions]
-                _ESCO_title_subspans = [ESCO_titles]
-                _ESCO_uri_subspans = [ESCO_uris]
                 _experience_indexes_subspans = [all_experience_indexes]
             
-            for _titles, _descriptions, _ESCO_titles, _ESCO_uris, _experience_indexes in zip(_title_subspans, _description_subspans, _ESCO_title_subspans, _ESCO_uri_subspans, _experience_indexes_subspans):
+            for _experience_indexes in _experience_indexes_subspans:
 
-                if minus_last:
-                    span_discount = 1
-                else:
-                    span_discount = 0
-
-                _num_experiences_subspan = len(_titles)
+                _num_experiences_subspan = len(_experience_indexes)
                 
                 # Create document pair
 
@@ -480,17 +552,40 @@ def load_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_
                     ESCO_uris[_experience_indexes[-1]],
                 )
 
-                # Add document pair to list
-                document_pairs.append((doc_1,doc_2))
-
-        return document_pairs
+                yield (doc_1, doc_2)
+
+    def count_pairs(_dataset):
+        if not consider_all_subspans_of_len_at_least_2:
+            return len(_dataset)
+        return sum(
+            min(num_subspans(n), max_len) if n > 1 else 1 for n in _dataset["number_of_experiences"]
+        )
+
+    return {
+        split: PairStream(
+            lambda _dataset=dataset[split]: iter_pairs_from_dataset(_dataset),
+            length_hint=count_pairs(dataset[split]),
+            fingerprint=json.dumps([dataset[split]._fingerprint, ESCO_occupations_dict.source_fingerprint]),
+        )
+        for split in SPLITS
+    }
 
-    train_pairs = create_pairs_from_dataset(dataset["train"])
-    val_pairs = create_pairs_from_dataset(dataset["validation"])
-    test_pairs = create_pairs_from_dataset(dataset["test"])
 
-    return train_pairs, val_pairs, test_pairs
+def load_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_2=False, verbose=False, max_len=16, num_proc=None):
+    """
+    Loads and processes the Decorte ESCO dataset for training.
 
+    Args:
+        minus_last (bool): If True, removes the last experience in subspans.
+        consider_all_subspans_of_len_at_least_2 (bool, optional): If True, considers all subspans with at least 2 elements. Defaults to False.
+        verbose (bool, optional): If True, prints additional information. Defaults to False.
+        max_len (int, optional): Maximum length of subspans. Defaults to 16.
+        num_proc (int, optional): Number of processes used to normalize the ESCO columns. Defaults to `os.cpu_count()`.
 
-        
+    Returns:
+        tuple: (train_pairs, val_pairs, test_pairs) - Prepared document pairs.
+    """
+    streams = stream_prepare_decorte_esco(minus_last, consider_all_subspans_of_len_at_least_2, verbose, max_len, num_proc)
+    train_pairs, val_pairs, test_pairs = (list(streams[split]) for split in SPLITS)
 
+    return train_pairs, val_pairs, test_pairs
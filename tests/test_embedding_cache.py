@@ -0,0 +1,63 @@
+import os
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+REVISION = "0" * 40
+
+
+class CountingModel:
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.array([[len(text), sum(map(ord, text)) % 97, 1.0] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 3
+
+
+def test_cache_encodes_every_distinct_text_once(tmp_path):
+    model = CountingModel()
+    texts = [f"text {i}" for i in range(50)]
+    cache = EmbeddingCache(str(tmp_path), "some/model", REVISION)
+    first = cache.encode(model, texts[:30] + texts[:5])
+    second = cache.encode(model, texts[::-1])
+
+    reopened = EmbeddingCache(str(tmp_path), "some/model", REVISION)
+    third = reopened.encode(model, texts)
+
+    assert sorted(model.encoded) == sorted(texts)
+    expected = CountingModel().encode(texts)
+    np.testing.assert_array_equal(first, np.concatenate([expected[:30], expected[:5]]))
+    np.testing.assert_array_equal(second, expected[::-1])
+    np.testing.assert_array_equal(third, expected)
+    assert len(reopened) == len(texts)
+    assert reopened.encode(model, []).shape == (0, 3)
+
+
+def test_cache_reads_shards_with_unsorted_keys(tmp_path):
+    model = CountingModel()
+    texts = [f"text {i}" for i in range(20)]
+    cache = EmbeddingCache(str(tmp_path), "some/model", REVISION)
+    cache.encode(model, texts)
+    # Rewrite the shard in text order, as shards were stored before their keys were sorted
+    [keys_name] = [name for name in os.listdir(cache.path) if name.endswith(".keys.npy")]
+    digests = np.frombuffer(b"".join(cache._digest(text, "{}") for text in texts), dtype=np.uint8).reshape(-1, 20)
+    np.save(os.path.join(cache.path, keys_name), digests)
+    np.save(os.path.join(cache.path, keys_name.replace(".keys.npy", ".npy")), CountingModel().encode(texts))
+
+    reopened = EmbeddingCache(str(tmp_path), "some/model", REVISION)
+
+    np.testing.assert_array_equal(reopened.encode(model, texts), CountingModel().encode(texts))
+    assert len(model.encoded) == len(texts)
+
+
+def test_meta_is_only_written_on_creation(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "some/model", REVISION)
+    meta_path = os.path.join(cache.path, "meta.json")
+    os.utime(meta_path, ns=(0, 0))
+
+    EmbeddingCache(str(tmp_path), "some/model", REVISION)
+
+    assert os.stat(meta_path).st_mtime_ns == 0
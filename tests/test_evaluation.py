@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from evaluation import mrr, r_at_k, ranking_metrics
+
+
+def reference_metrics(predicted_ids, true_ids, ks):
+    predictions = list(zip(true_ids.tolist(), [row.tolist() for row in predicted_ids]))
+    scores = {"MRR": mrr(predictions)}
+    for k in ks:
+        scores[f"R@{k}"] = r_at_k(predictions, k)
+    return scores
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_ranking_metrics_match_mrr_and_r_at_k(seed):
+    rng = np.random.default_rng(seed)
+    num_labels, n, top_k = 30, 200, 10
+    # Small label space, so rows contain duplicate ids and rows without a hit are common
+    predicted_ids = rng.integers(0, num_labels, size=(n, top_k))
+    true_ids = rng.integers(0, num_labels, size=n)
+    # Approximate indexes pad missing results with -1
+    padded = rng.random(n) < 0.3
+    predicted_ids[padded, rng.integers(1, top_k, size=padded.sum())] = -1
+    predicted_ids[padded] = np.where(np.cumsum(predicted_ids[padded] == -1, axis=1) > 0, -1, predicted_ids[padded])
+
+    ks = (1, 5, 10)
+    assert ranking_metrics(predicted_ids, true_ids, ks) == reference_metrics(predicted_ids, true_ids, ks)
+
+
+def test_ranking_metrics_edge_rows():
+    predicted_ids = np.array([
+        [3, 3, 1, 2],     # duplicate hit, first occurrence counts
+        [-1, -1, -1, -1],  # nothing found
+        [5, 4, -1, -1],   # padded, no hit
+        [0, 1, 2, 7],     # hit at the last rank
+        [2, 7, 7, 7],     # hit after the R@1 cut-off, with duplicates
+    ])
+    true_ids = np.array([3, 0, 7, 7, 7])
+
+    ks = (1, 2, 4)
+    scores = ranking_metrics(predicted_ids, true_ids, ks)
+    assert scores == reference_metrics(predicted_ids, true_ids, ks)
+    assert scores["R@1"] == 1 / 5
+    assert scores["R@4"] == 3 / 5
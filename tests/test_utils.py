@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datasets import Dataset, DatasetDict
+import utils
+
+
+def reference_pairs(_dataset, minus_last, consider_all_subspans_of_len_at_least_2, language):
+    # Per-career loop of the former `create_pairs_from_dataset`
+    document_pairs = []
+    if language == 'en':
+        history_columns = ('preferredLabel_en', 'description_en')
+    else:
+        history_columns = ('new_job_title_en_occ', 'new_job_description_en_occ')
+    for _id, group in _dataset.to_pandas().groupby('_id'):
+        group = group.sort_values('experience_order')
+        titles, descriptions = group[history_columns[0]].tolist(), group[history_columns[1]].tolist()
+        titles_esco, descriptions_esco = group['preferredLabel_en'].tolist(), group['description_en'].tolist()
+        all_experience_indexes = list(range(len(group)))
+        if consider_all_subspans_of_len_at_least_2 and len(group) > 1:
+            _experience_indexes_subspans = list(utils.subspans(all_experience_indexes))
+        else:
+            _experience_indexes_subspans = [all_experience_indexes]
+        for _experience_indexes in _experience_indexes_subspans:
+            doc_2 = f"esco role: {titles_esco[_experience_indexes[-1]]} \n description: {descriptions_esco[_experience_indexes[-1]]}"
+            doc_1 = utils.SEP_TOKEN.join(
+                f"role: {titles[i]} \n description: {descriptions[i]}"
+                for i in _experience_indexes[:len(_experience_indexes) - (1 if minus_last else 0)]
+            )
+            document_pairs.append((doc_1, doc_2))
+    return document_pairs
+
+
+@pytest.fixture
+def karrierewege(monkeypatch):
+    rng = np.random.default_rng(0)
+    rows = []
+    # Short careers, a single-experience career, and a long career, some with tied experience orders
+    for career, length in enumerate([3, 1, 5, 2, 20, 4]):
+        orders = rng.permutation(length)
+        if length > 2:
+            orders[1] = orders[2]
+        if length == 20:
+            orders[5:12] = 7
+        for i, order in enumerate(orders):
+            rows.append({
+                "_id": f"career-{(career * 7) % 6}",
+                "experience_order": int(order),
+                "preferredLabel_en": f"esco {career}.{i}",
+                "description_en": None if (career, i) == (2, 3) else f"esco description {career}.{i}",
+                "new_job_title_en_occ": f"title {career}.{i}",
+                "new_job_description_en_occ": f"description {career}.{i}",
+            })
+    rows = [rows[i] for i in rng.permutation(len(rows))]
+    split = Dataset.from_pandas(pd.DataFrame(rows), preserve_index=False)
+    dataset = DatasetDict({name: split for name in utils.SPLITS})
+    monkeypatch.setattr(utils, "load_dataset", lambda name: dataset)
+    return split
+
+
+@pytest.mark.parametrize("minus_last", [False, True])
+@pytest.mark.parametrize("all_subspans", [False, True])
+@pytest.mark.parametrize("language", ["en", "en_free"])
+def test_karrierewege_pairs_match_per_career_loop(karrierewege, minus_last, all_subspans, language):
+    streams = utils.stream_prepare_karrierewege(minus_last, all_subspans, language)
+
+    pairs = list(streams["train"])
+
+    assert pairs == reference_pairs(karrierewege, minus_last, all_subspans, language)
+    assert streams["train"].length_hint == len(pairs)